@@ -0,0 +1,75 @@
+"""
+deterministic synthetic market data for the benchmarks, every generator gives the same data for the same seed.
+"""
+import numpy as np
+import pandas as pd
+
+from tradearch.core.provider import Provider
+from tradearch.providers.panel import make_panel_frame
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'adj_close', 'volume']
+
+
+def generate_ohlcv_values(n_bars: int, n_symbols: int = 1, seed: int = 0) -> np.ndarray:
+    # (n_bars, n_symbols, 6) geometric random walks in PRICE_COLUMNS order
+    random_state = np.random.RandomState(seed)
+
+    close = 100 * np.exp(np.cumsum(random_state.normal(0, 0.01, (n_bars, n_symbols)), axis=0))
+    open_ = np.empty_like(close)
+    open_[0] = 100
+    open_[1:] = close[:-1] * np.exp(random_state.normal(0, 0.002, (n_bars - 1, n_symbols)))
+
+    spread = np.abs(random_state.normal(0, 0.005, (2, n_bars, n_symbols)))
+    high = np.maximum(open_, close) * (1 + spread[0])
+    low = np.minimum(open_, close) * (1 - spread[1])
+    volume = np.round(random_state.lognormal(15, 0.5, (n_bars, n_symbols)))
+
+    return np.stack([open_, high, low, close, close * 0.9, volume], axis=-1)
+
+
+def get_bar_index(n_bars: int) -> pd.DatetimeIndex:
+    # minute bars, a million daily bars would not fit in the timestamp range
+    return pd.date_range('2000-01-03', periods=n_bars, freq='min', name='date')
+
+
+def generate_ohlcv(n_bars: int, seed: int = 0) -> pd.DataFrame:
+    values = generate_ohlcv_values(n_bars, n_symbols=1, seed=seed)[:, 0, :]
+    return pd.DataFrame(values, index=get_bar_index(n_bars), columns=PRICE_COLUMNS)
+
+
+class SyntheticPriceProvider(Provider):
+    persistent = False
+
+    def __init__(self, n_bars: int, seed: int = 0):
+        super().__init__()
+        self.n_bars = n_bars
+        self.seed = seed
+
+    def get_all_data(self) -> pd.DataFrame:
+        return generate_ohlcv(self.n_bars, seed=self.seed)
+
+
+class SyntheticMovementProvider(Provider):
+    # -1 and 1 labels of the next bar like UsStockMovementProvider, as floats
+    def __init__(self, price_provider: Provider):
+        super().__init__()
+        self.price_provider = price_provider
+
+    def get_all_data(self) -> pd.DataFrame:
+        dataset = self.price_provider.get_data().diff().dropna()
+        return pd.DataFrame(np.where(dataset.to_numpy() > 0, 1., -1.), index=dataset.index, columns=dataset.columns)
+
+
+class SyntheticPanelProvider(Provider):
+    persistent = False
+
+    def __init__(self, n_bars: int, n_symbols: int, seed: int = 0):
+        super().__init__()
+        self.n_bars = n_bars
+        self.n_symbols = n_symbols
+        self.seed = seed
+
+    def get_all_data(self) -> pd.DataFrame:
+        values = generate_ohlcv_values(self.n_bars, n_symbols=self.n_symbols, seed=self.seed)
+        return make_panel_frame(values, index=get_bar_index(self.n_bars),
+                                symbols=[f'S{i:04d}' for i in range(self.n_symbols)], fields=PRICE_COLUMNS)
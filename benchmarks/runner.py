@@ -0,0 +1,137 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from tradearch.core.cache import clear_data_cache
+from tradearch.core.storage import clear_shared_frames
+from .stages import STAGES, SCALES
+
+# local to the machine, timings of one machine say nothing about another so it is not committed
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# growth below these is noise whatever the ratio, a stage of a millisecond easily takes two on a busy machine
+MIN_REGRESSION_SECONDS = 0.01
+MIN_REGRESSION_BYTES = 1 << 20
+
+
+def _reset_caches():
+    clear_data_cache()
+    clear_shared_frames()
+    gc.collect()
+
+
+def measure_stage(name: str, scale: dict, repeat: int = 3) -> dict:
+    """
+    best wall time over repeat runs and the peak memory traced during one more run, every run starts from cold
+    caches.
+    """
+    prepare = STAGES[name]
+
+    seconds = []
+    for _ in range(repeat):
+        _reset_caches()
+        run = prepare(scale)
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+
+    # tracing slows allocations down, so memory is measured in a separate run
+    _reset_caches()
+    run = prepare(scale)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': min(seconds), 'peak_bytes': peak}
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> Dict[str, List[str]]:
+    regressions = {}
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+
+        for key, min_growth in (('seconds', MIN_REGRESSION_SECONDS), ('peak_bytes', MIN_REGRESSION_BYTES)):
+            if result[key] > expected[key] * (1 + tolerance) and result[key] - expected[key] > min_growth:
+                regressions.setdefault(name, []).append(key)
+
+    return regressions
+
+
+def format_table(results: Dict[str, dict], baseline: Dict[str, dict], regressions: Dict[str, List[str]]) -> str:
+    lines = [f'{"stage":<24}{"seconds":>12}{"peak MB":>12}{"vs baseline":>14}  status']
+    for name, result in results.items():
+        expected = baseline.get(name)
+        ratio = f'{result["seconds"] / expected["seconds"]:.2f}x' if expected and expected['seconds'] else '-'
+        if name in regressions:
+            status = 'regressed ' + ', '.join(regressions[name])
+        else:
+            status = 'ok' if expected else 'no baseline'
+        lines.append(f'{name:<24}{result["seconds"]:>12.4f}{result["peak_bytes"] / 2 ** 20:>12.1f}{ratio:>14}  '
+                     f'{status}')
+
+    return '\n'.join(lines)
+
+
+def _load_baseline(path: str, scale_name: str) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f).get(scale_name, {})
+
+
+def _save_baseline(path: str, scale_name: str, results: Dict[str, dict]):
+    baselines = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            baselines = json.load(f)
+
+    baselines[scale_name] = results
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='tradearch benchmark suite')
+    parser.add_argument('--scale', choices=sorted(SCALES.keys()), default='small')
+    parser.add_argument('--stage', action='append', dest='stages',
+                        help='stage name or prefix, e.g. indicators, can be given more than once')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown or memory growth over the baseline, as a fraction')
+    args = parser.parse_args(argv)
+
+    names = [name for name in STAGES
+             if not args.stages or any(name == x or name.startswith(f'{x}.') for x in args.stages)]
+    scale = SCALES[args.scale]
+
+    results = {}
+    for name in names:
+        results[name] = measure_stage(name, scale, repeat=args.repeat)
+        print(f'{name} {results[name]["seconds"]:.4f}s', file=sys.stderr)
+
+    baseline = _load_baseline(args.baseline, args.scale)
+    regressions = compare(results, baseline, tolerance=args.tolerance)
+    print(format_table(results, baseline, regressions))
+
+    if args.save_baseline:
+        _save_baseline(args.baseline, args.scale, results)
+        return 0
+
+    missing = [name for name in results if name not in baseline]
+    if missing:
+        print(f'no {args.scale} baseline in {args.baseline} for {", ".join(missing)}, nothing to compare them to, '
+              f'store one with --save-baseline', file=sys.stderr)
+
+    return 1 if regressions else 0
@@ -0,0 +1,295 @@
+"""
+benchmark stages. a stage prepares its inputs, warming every upstream provider, and returns the callable that is
+measured, so the numbers only cover the stage itself.
+"""
+import os
+import subprocess
+import sys
+from datetime import datetime
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+import tradearch
+from tradearch.core.executor import GraphExecutor
+from tradearch.core.model import Model, ModelOutputTypes
+from tradearch.core.provider import Provider
+from tradearch.helpers import lag_provider, window_provider
+from tradearch.models.model_selection import ModelSelectionModel
+from tradearch.providers.indicators import RSIIndicatorProvider, SMAIndicatorProvider, MACDIndicatorProvider, \
+    PSARIndicatorProvider, BollingerBandsIndicatorProvider
+from tradearch.providers.panel import PanelIndicatorProvider, PanelCrossSectionProvider
+from tradearch.providers.us_stocks import UsStockPriceProvider
+from .data import SyntheticPriceProvider, SyntheticMovementProvider, SyntheticPanelProvider
+
+SCALES = {
+    'small': {
+        'n_bars': 50_000,
+        'n_feature_bars': 20_000,
+        'n_symbols': 100,
+        'n_panel_bars': 500,
+        'n_features': 10,
+        'n_lags': 20,
+        'n_inputs': 10,
+        'n_base_models': 4,
+        'stack_depth': 3,
+    },
+    'full': {
+        'n_bars': 1_000_000,
+        # a deep lag block of a million bars would not fit in memory (60 lags x 30 features are 14 GiB)
+        'n_feature_bars': 100_000,
+        'n_symbols': 1000,
+        'n_panel_bars': 2500,
+        'n_features': 30,
+        'n_lags': 60,
+        'n_inputs': 20,
+        'n_base_models': 10,
+        'stack_depth': 4,
+    },
+}
+
+STAGES: Dict[str, Callable[[dict], Callable[[], object]]] = {}
+
+
+def stage(name: str):
+    def register(prepare: Callable[[dict], Callable[[], object]]):
+        STAGES[name] = prepare
+        return prepare
+
+    return register
+
+
+class LinearModel(Model):
+    # least squares sign classifier, cheap and deterministic so the stages measure the framework around the fit
+    output_type = ModelOutputTypes.CLASSIFICATION
+
+    def __init__(self):
+        super().__init__()
+        self.coef = None
+
+    def fit(self, x: pd.DataFrame, y: pd.Series):
+        values = np.c_[x.to_numpy(), np.ones(len(x.index))]
+        self.coef = np.linalg.lstsq(values, np.asarray(y, dtype=np.float64), rcond=None)[0]
+
+    def predict(self, x: pd.DataFrame) -> pd.Series:
+        values = np.c_[x.to_numpy(), np.ones(len(x.index))]
+        return pd.Series(np.where(values @ self.coef > 0, 1., -1.), index=x.index)
+
+
+class FeatureProvider(Provider):
+    # n_features noisy transforms of the synthetic prices
+    def __init__(self, price_provider: Provider, n_features: int):
+        super().__init__()
+        self.price_provider = price_provider
+        self.n_features = n_features
+
+    def get_all_data(self) -> pd.DataFrame:
+        close = self.price_provider.get_data()['close'].to_numpy()
+        returns = np.r_[np.nan, np.diff(np.log(close))]
+        values = returns[:, None] * np.linspace(0.5, 1.5, self.n_features)[None, :]
+        return pd.DataFrame(values, index=self.price_provider.get_data().index,
+                            columns=[f'feature_{i}' for i in range(self.n_features)])
+
+
+def _get_range(provider: Provider):
+    index = provider.get_data().index
+    return index[0].to_pydatetime(), index[-1].to_pydatetime()
+
+
+def _get_warm_prices(scale: dict, key: str = 'n_bars') -> SyntheticPriceProvider:
+    prices = SyntheticPriceProvider(n_bars=scale[key])
+    prices.get_data()
+    return prices
+
+
+# every public module, importing them must not pull in scikit-learn or ta
+_IMPORT_CHECK = '''
+import sys
+import tradearch.core, tradearch.helpers, tradearch.models.basic, tradearch.models.model_selection
+import tradearch.providers.indicators, tradearch.providers.us_stocks, tradearch.providers.panel
+eager = sorted({x.split('.')[0] for x in sys.modules} & {'sklearn', 'ta'})
+sys.exit('eagerly imported: ' + ', '.join(eager) if eager else 0)
+'''
+
+
+@stage('import.startup')
+def prepare_import_startup(scale: dict):
+    # a fresh interpreter importing the library, so the time covers the whole import chain
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(tradearch.__file__)),
+                                                       os.environ.get('PYTHONPATH', '')]))
+
+    def run():
+        result = subprocess.run([sys.executable, '-c', _IMPORT_CHECK], env=env, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise Exception(result.stderr.decode().strip())
+
+    return run
+
+
+@stage('provider.load')
+def prepare_provider_load(scale: dict):
+    return lambda: UsStockPriceProvider(symbol='AAPL').get_data()
+
+
+@stage('provider.slice')
+def prepare_provider_slice(scale: dict):
+    prices = _get_warm_prices(scale)
+    index = prices.get_data().index
+    starts = np.linspace(0, len(index) - 101, 1000).astype(int)
+    ranges = [(index[i].to_pydatetime(), index[i + 100].to_pydatetime()) for i in starts]
+
+    return lambda: [prices.get_data(from_t=from_t, to_t=to_t) for from_t, to_t in ranges]
+
+
+@stage('indicators.rsi')
+def prepare_rsi(scale: dict):
+    prices = _get_warm_prices(scale)
+    return lambda: RSIIndicatorProvider(price_provider=prices).get_data()
+
+
+@stage('indicators.macd')
+def prepare_macd(scale: dict):
+    prices = _get_warm_prices(scale)
+    return lambda: MACDIndicatorProvider(price_provider=prices).get_data()
+
+
+@stage('indicators.sma')
+def prepare_sma(scale: dict):
+    prices = _get_warm_prices(scale)
+    return lambda: SMAIndicatorProvider(price_provider=prices).get_data()
+
+
+@stage('indicators.bollinger')
+def prepare_bollinger(scale: dict):
+    prices = _get_warm_prices(scale)
+    return lambda: BollingerBandsIndicatorProvider(price_provider=prices).get_data()
+
+
+@stage('indicators.psar')
+def prepare_psar(scale: dict):
+    prices = _get_warm_prices(scale)
+    return lambda: PSARIndicatorProvider(price_provider=prices).get_data()
+
+
+@stage('features.lag')
+def prepare_lag(scale: dict):
+    features = FeatureProvider(price_provider=_get_warm_prices(scale, 'n_feature_bars'),
+                               n_features=scale['n_features'])
+    features.get_data()
+    return lambda: lag_provider(features, list(range(scale['n_lags'] + 1))).get_data()
+
+
+@stage('features.window')
+def prepare_window(scale: dict):
+    features = FeatureProvider(price_provider=_get_warm_prices(scale, 'n_feature_bars'),
+                               n_features=scale['n_features'])
+    features.get_data()
+    return lambda: window_provider(features, [5, 20, scale['n_lags']]).get_data()
+
+
+def _get_feature_model(prices: Provider, n_inputs: int) -> Model:
+    features = FeatureProvider(price_provider=prices, n_features=4)
+    model = LinearModel()
+    for i in range(n_inputs):
+        model.add_input_features(lag_provider(features, [i + 1]), slug=f'input_{i}_')
+
+    return model.set_output_feature(SyntheticMovementProvider(price_provider=prices), 'close')
+
+
+def _warm_inputs(model: Model, from_t: datetime, to_t: datetime):
+    for provider in model.get_input_providers():
+        provider.get_data()
+    model.get_output_dataset(from_t=from_t, to_t=to_t)
+
+
+@stage('model.input_dataset')
+def prepare_input_dataset(scale: dict):
+    prices = _get_warm_prices(scale)
+    model = _get_feature_model(prices, scale['n_inputs'])
+    from_t, to_t = _get_range(prices)
+    _warm_inputs(model, from_t, to_t)
+
+    return lambda: model.get_input_dataset(from_t=from_t, to_t=to_t)
+
+
+@stage('model.fit_by_time')
+def prepare_fit_by_time(scale: dict):
+    prices = _get_warm_prices(scale)
+    model = _get_feature_model(prices, scale['n_inputs'])
+    from_t, to_t = _get_range(prices)
+    _warm_inputs(model, from_t, to_t)
+
+    return lambda: model.fit_by_time(from_t=from_t, to_t=to_t)
+
+
+@stage('model.selection')
+def prepare_model_selection(scale: dict):
+    prices = _get_warm_prices(scale)
+    from_t, to_t = _get_range(prices)
+
+    base_models = [_get_feature_model(prices, i + 1) for i in range(scale['n_base_models'])]
+    for model in base_models:
+        _warm_inputs(model, from_t, to_t)
+        model.fit_by_time(from_t=from_t, to_t=to_t)
+
+    meta_model = LinearModel()
+    model = ModelSelectionModel(selection_models=base_models, meta_model=meta_model)
+    model.add_input_features(FeatureProvider(price_provider=prices, n_features=4))
+    model.set_output_feature(SyntheticMovementProvider(price_provider=prices), 'close')
+    _warm_inputs(model, from_t, to_t)
+
+    def run():
+        model.fit_by_time(from_t=from_t, to_t=to_t)
+        return model.predict_by_time(from_t=from_t, to_t=to_t)
+
+    return run
+
+
+@stage('model.stack')
+def prepare_stack(scale: dict):
+    prices = _get_warm_prices(scale)
+    from_t, to_t = _get_range(prices)
+
+    # every layer feeds all models of the next one, shared base models are what the graph executor deduplicates
+    layer = [_get_feature_model(prices, i + 1) for i in range(3)]
+    for depth in range(scale['stack_depth'] - 1):
+        next_layer = []
+        for i in range(3 if depth < scale['stack_depth'] - 2 else 1):
+            model = _get_feature_model(prices, 1)
+            for j, input_model in enumerate(layer):
+                model.add_input_model(input_model, slug=f'model_{j}')
+            next_layer.append(model)
+        layer = next_layer
+
+    top = layer[0]
+    for models in top.get_layers():
+        for model in models:
+            _warm_inputs(model, from_t, to_t)
+
+    def run():
+        executor = GraphExecutor(top)
+        executor.fit_by_time(from_t=from_t, to_t=to_t)
+        return executor.predict_by_time(from_t=from_t, to_t=to_t)
+
+    return run
+
+
+@stage('panel.indicators')
+def prepare_panel_indicators(scale: dict):
+    panel = SyntheticPanelProvider(n_bars=scale['n_panel_bars'], n_symbols=scale['n_symbols'])
+    panel.get_data()
+
+    def run():
+        return [PanelIndicatorProvider(panel, indicator='sma', params=[5, 20, 50]).get_data(),
+                PanelIndicatorProvider(panel, indicator='rsi', params=[14]).get_data(),
+                PanelIndicatorProvider(panel, indicator='macd', params=[(26, 12, 9)]).get_data()]
+
+    return run
+
+
+@stage('panel.cross_section')
+def prepare_panel_cross_section(scale: dict):
+    panel = SyntheticPanelProvider(n_bars=scale['n_panel_bars'], n_symbols=scale['n_symbols'])
+    panel.get_data()
+    return lambda: PanelCrossSectionProvider(panel, method='rank').get_data()
@@ -7,12 +7,15 @@ here = path.abspath(path.dirname(__file__))
 with open(path.join(here, "README.md"), encoding="utf-8") as f:
     long_description = f.read()
 
+with open(path.join(here, "tradearch", "__init__.py"), encoding="utf-8") as f:
+    version = f.read().split("__version__ = ")[1].split("\n")[0].strip("'\"")
+
 setup(
     # region core
     name="tradearch",
-    version="0.0.3",
-    python_requires=">=3.5",
-    packages=find_packages(exclude=["scripts"]),
+    version=version,
+    python_requires=">=3.8",
+    packages=find_packages(exclude=["scripts", "benchmarks", "benchmarks.*"]),
     install_requires=[
         "joblib==0.17.0; python_version >= '3.6'",
         "numpy==1.19.4",
@@ -22,7 +25,6 @@ setup(
         "scikit-learn==0.23.2",
         "scipy==1.5.4; python_version >= '3.6'",
         "six==1.15.0; python_version >= '2.7' and python_version not in '3.0, 3.1, 3.2, 3.3'",
-        "ta==0.7.0",
         "threadpoolctl==2.1.0; python_version >= '3.5'",
     ],
     extras_require={
@@ -56,6 +58,7 @@ setup(
             "pycparser==2.20; python_version >= '2.7' and python_version not in '3.0, 3.1, 3.2, 3.3'",
             "pygments==2.7.2; python_version >= '3.5'",
             "pyparsing==2.4.7; python_version >= '2.6' and python_version not in '3.0, 3.1, 3.2, 3.3'",
+            "pytest==6.1.2",
             "python-dateutil==2.8.1; python_version >= '2.7' and python_version not in '3.0, 3.1, 3.2, 3.3'",
             "readme-renderer==28.0",
             "regex==2020.11.13",
@@ -65,6 +68,7 @@ setup(
             "rfc3986==1.4.0",
             "secretstorage==3.3.0; sys_platform == 'linux'",
             "six==1.15.0; python_version >= '2.7' and python_version not in '3.0, 3.1, 3.2, 3.3'",
+            "ta==0.7.0",
             "toml==0.10.2; python_version >= '2.6' and python_version not in '3.0, 3.1, 3.2, 3.3'",
             "tomlkit==0.7.0; python_version >= '2.7' and python_version not in '3.0, 3.1, 3.2, 3.3, 3.4'",
             "tqdm==4.54.0; python_version >= '2.7' and python_version not in '3.0, 3.1, 3.2, 3.3'",
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# the rolling sums start again at block boundaries which depend on where a computation starts, so chunked, streamed
+# and full computations round differently
+RTOL = 1e-9
+
+
+def _assert_frames_close(got: pd.DataFrame, expected: pd.DataFrame):
+    assert got.index.equals(expected.index)
+    assert got.columns.equals(expected.columns)
+    assert (got.dtypes == expected.dtypes).all()
+
+    floats = [x for x in got.columns if got[x].dtype.kind == 'f']
+    rounded = np.zeros(len(got.index), dtype=bool)
+    for column in floats:
+        np.testing.assert_allclose(got[column].to_numpy(), expected[column].to_numpy(), rtol=RTOL, atol=0,
+                                   err_msg=column)
+        rounded |= got[column].to_numpy() != expected[column].to_numpy()
+
+    # signals compare the values with prices, they may only flip where the values were rounded differently
+    for column in got.columns.difference(floats):
+        assert (got[column].to_numpy()[~rounded] == expected[column].to_numpy()[~rounded]).all(), column
+
+
+@pytest.fixture
+def assert_frames_close():
+    return _assert_frames_close
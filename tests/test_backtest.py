@@ -0,0 +1,30 @@
+import pandas as pd
+
+from benchmarks.data import SyntheticPriceProvider, SyntheticMovementProvider, get_bar_index
+from tradearch.core.backtest import WalkForward
+from tradearch.models.basic import LogisticRegression
+from tradearch.providers.indicators import RSIIndicatorProvider, SMAIndicatorProvider
+
+N_BARS = 2000
+
+
+def _build_model():
+    price = SyntheticPriceProvider(N_BARS, seed=3)
+    model = LogisticRegression()
+    model.add_input_features(RSIIndicatorProvider(price))
+    model.add_input_features(SMAIndicatorProvider(price, window=10))
+    model.set_output_feature(SyntheticMovementProvider(price), column='adj_close')
+    return model
+
+
+def test_parallel_walk_forward_equals_serial():
+    index = get_bar_index(N_BARS)
+    runs = [WalkForward(_build_model(), train_size=500, test_size=200, max_workers=max_workers)
+            for max_workers in (1, 2)]
+
+    serial, parallel = [x.predict_by_time(from_t=index[0], to_t=index[-1]) for x in runs]
+    assert serial['fold'].nunique() > 2
+    pd.testing.assert_frame_equal(parallel, serial, check_exact=True)
+
+    serial, parallel = [x.measure_by_time(from_t=index[0], to_t=index[-1]) for x in runs]
+    pd.testing.assert_frame_equal(parallel, serial, check_exact=True)
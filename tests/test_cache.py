@@ -0,0 +1,97 @@
+import glob
+import json
+import os
+
+import pandas as pd
+
+from tradearch.core.cache import clear_data_cache, disable_persistent_cache, enable_persistent_cache, data_cache, \
+    set_cache_max_bytes
+from tradearch.core.provider import Provider
+from tradearch.providers.indicators import SMAIndicatorProvider
+from tradearch.providers.panel import UsStockPanelProvider
+
+
+def _define_provider(values):
+    class ConstantProvider(Provider):
+        def get_all_data(self) -> pd.DataFrame:
+            return pd.DataFrame({'adj_close': values}, index=pd.date_range('2020-01-01', periods=len(values)))
+
+    return ConstantProvider
+
+
+def test_redefined_class_does_not_share_cached_data():
+    old_class = _define_provider([1., 2., 3.])
+    new_class = _define_provider([5., 6., 7.])
+    assert old_class().get_identity() == new_class().get_identity()
+
+    assert old_class().get_data()['adj_close'].tolist() == [1., 2., 3.]
+    assert new_class().get_data()['adj_close'].tolist() == [5., 6., 7.]
+    assert SMAIndicatorProvider(old_class(), window=2).get_data()['sma'].tolist() == [1.5, 2.5]
+    assert SMAIndicatorProvider(new_class(), window=2).get_data()['sma'].tolist() == [5.5, 6.5]
+
+
+def test_persistent_entries_are_salted_with_the_provider_version(tmp_path, monkeypatch):
+    calls = []
+
+    class CountingProvider(Provider):
+        def get_source_fingerprint(self):
+            return ['counting']
+
+        def get_all_data(self) -> pd.DataFrame:
+            calls.append(1)
+            return pd.DataFrame({'adj_close': [1., 2.]}, index=pd.date_range('2020-01-01', periods=2))
+
+    enable_persistent_cache(str(tmp_path))
+    try:
+        CountingProvider().get_data()
+        clear_data_cache()
+        CountingProvider().get_data()
+        assert len(calls) == 1
+
+        [meta_path] = glob.glob(os.path.join(str(tmp_path), '*', '*', 'meta.json'))
+        with open(meta_path) as f:
+            assert 'CountingProvider' in json.load(f)['extra']['version']
+
+        monkeypatch.setattr(CountingProvider, 'cache_version', 1)
+        clear_data_cache()
+        CountingProvider().get_data()
+        assert len(calls) == 2
+    finally:
+        disable_persistent_cache()
+        clear_data_cache()
+
+
+def test_private_parameters_do_not_share_cached_data():
+    class PrivateProvider(Provider):
+        def __init__(self, k):
+            super().__init__()
+            self._k = k
+
+        def get_all_data(self) -> pd.DataFrame:
+            return pd.DataFrame({'adj_close': [float(self._k)]}, index=pd.date_range('2020-01-01', periods=1))
+
+    assert PrivateProvider(1).get_identity() is None
+    assert PrivateProvider(1).get_data()['adj_close'].tolist() == [1.]
+    assert PrivateProvider(2).get_data()['adj_close'].tolist() == [2.]
+    # transient attributes like the data cache itself do not take the identity away
+    assert UsStockPanelProvider(['AAPL'], max_workers=2).get_identity() == UsStockPanelProvider(['AAPL']).get_identity()
+
+
+def test_frames_larger_than_the_data_cache_are_kept_by_the_provider():
+    calls = []
+
+    class LargeProvider(Provider):
+        def get_all_data(self) -> pd.DataFrame:
+            calls.append(1)
+            return pd.DataFrame({'adj_close': [1.] * 1000}, index=pd.date_range('2020-01-01', periods=1000))
+
+    max_bytes = data_cache.max_bytes
+    set_cache_max_bytes(1000)
+    try:
+        provider = LargeProvider()
+        provider.get_data()
+        provider.get_data()
+        assert len(calls) == 1 and provider.get_cache_key() not in data_cache
+    finally:
+        set_cache_max_bytes(max_bytes)
+        clear_data_cache()
@@ -0,0 +1,91 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+from benchmarks.data import SyntheticPriceProvider, SyntheticMovementProvider, get_bar_index
+from tradearch.core.executor import GraphExecutor
+from tradearch.helpers import lag_provider, window_provider
+from tradearch.models.basic import LogisticRegression
+from tradearch.providers.indicators import SMAIndicatorProvider, MACDIndicatorProvider, PSARIndicatorProvider, \
+    RSIIndicatorProvider, BollingerBandsIndicatorProvider
+from tradearch.providers.panel import UsStockPanelProvider, PanelIndicatorProvider
+from tradearch.providers.us_stocks import UsStockPriceProvider
+
+PRICE = UsStockPriceProvider('AAPL')
+PANEL = UsStockPanelProvider(['AAPL'])
+
+INDICATOR_PROVIDERS = [
+    SMAIndicatorProvider(PRICE, window=2),
+    SMAIndicatorProvider(PRICE, window=20),
+    MACDIndicatorProvider(PRICE),
+    PSARIndicatorProvider(PRICE),
+    RSIIndicatorProvider(PRICE),
+    BollingerBandsIndicatorProvider(PRICE, n=20),
+    PanelIndicatorProvider(PANEL, 'sma', [5, 20]),
+    PanelIndicatorProvider(PANEL, 'rolling_std', [10]),
+    PanelIndicatorProvider(PANEL, 'bollinger_bands', [(20, 2)]),
+    PanelIndicatorProvider(PANEL, 'ema', [12]),
+    PanelIndicatorProvider(PANEL, 'rsi', [14]),
+    PanelIndicatorProvider(PANEL, 'psar', [(0.02, 0.2)]),
+]
+
+
+@pytest.mark.parametrize('provider', INDICATOR_PROVIDERS, ids=lambda x: type(x).__name__)
+@pytest.mark.parametrize('chunk_size', ['400D', '90D'])
+def test_chunks_equal_full_data(provider, chunk_size, assert_frames_close):
+    chunks = list(provider.iter_chunks(chunk_size))
+
+    assert len(chunks) > 1
+    assert_frames_close(pd.concat(chunks), provider.get_data())
+
+
+@pytest.mark.parametrize('build', [
+    lambda x: MACDIndicatorProvider(x),
+    lambda x: RSIIndicatorProvider(x),
+    lambda x: PSARIndicatorProvider(x),
+    lambda x: lag_provider(RSIIndicatorProvider(x), [0, 3]),
+], ids=['macd', 'rsi', 'psar', 'lagged_rsi'])
+def test_chunks_carry_rolling_states(build, monkeypatch, assert_frames_close):
+    provider = build(PRICE)
+    expected = provider.get_data()
+
+    calls = []
+    for cls in (MACDIndicatorProvider, RSIIndicatorProvider, PSARIndicatorProvider):
+        get_all_data = cls.get_all_data
+        monkeypatch.setattr(cls, 'get_all_data', lambda self, f=get_all_data: calls.append(self) or f(self))
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings('error', message='.*carries no rolling state')
+        chunks = list(provider.iter_chunks('90D'))
+
+    # only the first chunk reads the history, the next ones step the state it left
+    assert len(chunks) > 1 and len(calls) == 1
+    assert_frames_close(pd.concat(chunks), expected)
+
+
+def test_chunks_warn_about_providers_without_state():
+    with pytest.warns(UserWarning, match='PanelIndicatorProvider has no lookback and carries no rolling state'):
+        list(PanelIndicatorProvider(PANEL, 'ema', [12]).iter_chunks('400D'))
+
+
+def test_chunked_predictions_equal_full_predictions():
+    index = get_bar_index(2000)
+    price = SyntheticPriceProvider(len(index), seed=11)
+    model = LogisticRegression()
+    model.add_input_features(lag_provider(SMAIndicatorProvider(price, window=10), [0, 2]))
+    model.add_input_features(window_provider(price, [5, 20]))
+    model.add_input_features(lag_provider(RSIIndicatorProvider(price), [0, 1]))
+    model.add_input_features(MACDIndicatorProvider(price))
+    model.set_output_feature(SyntheticMovementProvider(price), column='adj_close')
+    GraphExecutor(model).fit_by_time(from_t=index[0], to_t=index[999])
+
+    test_from_t, test_to_t = index[1000], index[-1]
+    full = model.predict_by_time(from_t=test_from_t, to_t=test_to_t)
+    chunks = list(model.iter_predictions(from_t=test_from_t, to_t=test_to_t, chunk_size='90min'))
+    assert len(chunks) > 1
+
+    chunked = model.predict_by_time(from_t=test_from_t, to_t=test_to_t, chunk_size='90min')
+    pd.testing.assert_series_equal(chunked, full, check_freq=False)
+    assert model.measure_by_time(from_t=test_from_t, to_t=test_to_t, chunk_size='90min') == \
+        model.measure_by_time(from_t=test_from_t, to_t=test_to_t)
@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+import tradearch
+from benchmarks.stages import _IMPORT_CHECK
+
+
+def test_import_does_not_pull_optional_dependencies():
+    # a fresh interpreter, this one has imported scikit-learn and ta for the other tests already
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(tradearch.__file__)),
+                                                       os.environ.get('PYTHONPATH', '')]))
+    result = subprocess.run([sys.executable, '-c', _IMPORT_CHECK], env=env, stderr=subprocess.PIPE)
+
+    assert result.returncode == 0, result.stderr.decode()
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tradearch.providers.indicators import SMAIndicatorProvider, MACDIndicatorProvider, PSARIndicatorProvider, \
+    RSIIndicatorProvider, BollingerBandsIndicatorProvider, kernels
+from tradearch.providers.us_stocks import UsStockPriceProvider
+
+ta = pytest.importorskip('ta')
+
+PRICE = UsStockPriceProvider('AAPL')
+# the kernels restart their sums every few windows, ta (through pandas) runs one sum along the series, they round
+# differently
+RTOL = 1e-10
+
+
+def _assert_close(got: pd.Series, expected: pd.Series):
+    expected = expected.dropna()
+    assert got.index.equals(expected.index)
+    np.testing.assert_allclose(got.to_numpy(), expected.to_numpy(), rtol=RTOL, atol=0)
+
+
+def _assert_signals(got: pd.Series, indicator: pd.Series, price: pd.Series):
+    # the same signal from the reference values, except where the reference ties the price up to rounding
+    expected = kernels.trend_signal(indicator.to_numpy(), price.to_numpy())
+    ties = np.abs(indicator.to_numpy() - price.to_numpy()) <= RTOL * np.abs(price.to_numpy())
+    assert (got.to_numpy()[~ties] == expected[~ties]).all()
+
+
+@pytest.mark.parametrize('window', [2, 3, 5, 14, 20, 50])
+def test_sma_equals_reference(window):
+    prices = PRICE.get_data()
+    got = SMAIndicatorProvider(PRICE, window=window).get_data()
+    expected = ta.trend.SMAIndicator(prices['adj_close'], window).sma_indicator()
+
+    _assert_close(got['sma'], expected)
+    _assert_signals(got['sma_signal'], expected[got.index], prices['adj_close'][got.index])
+
+
+@pytest.mark.parametrize('n', [5, 20])
+def test_bollinger_bands_equal_reference(n):
+    prices = PRICE.get_data()
+    got = BollingerBandsIndicatorProvider(PRICE, n=n).get_data()
+    expected = ta.volatility.BollingerBands(prices['adj_close'], n, 2)
+
+    _assert_close(got['bollinger_mavg'], expected.bollinger_mavg())
+    _assert_close(got['bollinger_hband'], expected.bollinger_hband())
+    _assert_close(got['bollinger_lband'], expected.bollinger_lband())
+
+
+def test_rsi_equals_reference():
+    prices = PRICE.get_data()
+    got = RSIIndicatorProvider(PRICE).get_data()
+    expected = ta.momentum.RSIIndicator(prices['adj_close'], 14).rsi()
+
+    _assert_close(got['rsi'], expected)
+
+
+def test_macd_equals_reference():
+    prices = PRICE.get_data()
+    got = MACDIndicatorProvider(PRICE).get_data()
+    expected = ta.trend.MACD(prices['adj_close'], 26, 12, 9)
+
+    _assert_close(got['macd'], expected.macd()[got.index])
+    _assert_close(got['macd_sig'], expected.macd_signal()[got.index])
+    _assert_close(got['macd_diff'], expected.macd_diff()[got.index])
+
+
+def test_psar_equals_reference():
+    prices = PRICE.get_data()
+    got = PSARIndicatorProvider(PRICE).get_data()
+    # by position, newer versions of ta mix up positions and labels of a date index in psar
+    columns = [prices[x].reset_index(drop=True) for x in ('high', 'low', 'close')]
+    expected = ta.trend.PSARIndicator(*columns, 0.02, 0.2).psar().set_axis(prices.index)
+
+    _assert_close(got['psar'], expected)
+    _assert_signals(got['psar_signal'], expected, prices['close'])
+
+
+@pytest.mark.parametrize('window', [2, 7, 30])
+def test_rolling_kernels_equal_pandas(window):
+    values = PRICE.get_data()[['adj_close', 'volume']].to_numpy(dtype=np.float64)
+    rolling = pd.DataFrame(values).rolling(window, min_periods=window)
+
+    np.testing.assert_allclose(kernels.rolling_mean(values, [window])[:, :, 0], rolling.mean(), rtol=RTOL)
+    # against every window on its own, pandas keeps one running sum of squares which drifts along the series
+    windows = np.lib.stride_tricks.as_strided(values, shape=(len(values) - window + 1, window, values.shape[1]),
+                                              strides=(values.strides[0], *values.strides))
+    deviations = kernels.rolling_std(values, [window])[:, :, 0]
+    assert np.isnan(deviations[:window - 1]).all()
+    # flat windows keep the square root of a rounding error
+    for k, expected in enumerate(windows.std(axis=1).T):
+        np.testing.assert_allclose(deviations[window - 1:, k], expected, rtol=RTOL,
+                                   atol=1e-10 * np.abs(values[:, k]).max())
+    np.testing.assert_array_equal(kernels.rolling_min(values, [window])[:, :, 0], rolling.min())
+    np.testing.assert_array_equal(kernels.rolling_max(values, [window])[:, :, 0], rolling.max())
+
+
+def test_rolling_kernels_skip_missing_values():
+    values = np.cumsum(np.random.default_rng(0).normal(size=5000)) + 100
+    values[[3, 1000, 4321]] = np.nan
+    expected = pd.Series(values).rolling(20, min_periods=20)
+
+    np.testing.assert_allclose(kernels.rolling_mean(values, [20])[:, 0], expected.mean(), rtol=RTOL)
+    np.testing.assert_allclose(kernels.rolling_std(values, [20], ddof=1)[:, 0], expected.std(), rtol=1e-7)
@@ -0,0 +1,33 @@
+import pandas as pd
+
+from tradearch.core.model import Model, ModelOutputTypes
+from tradearch.models.model_selection import ModelSelectionModel
+
+
+class ConstantModel(Model):
+    output_type = ModelOutputTypes.CLASSIFICATION
+
+    def __init__(self, value: float):
+        super().__init__()
+        self.value = value
+        self.next_value = value
+
+    def fit(self, x: pd.DataFrame, y: pd.Series):
+        self.value = self.next_value
+
+    def predict(self, x: pd.DataFrame) -> pd.Series:
+        return pd.Series(self.value, index=x.index)
+
+    def predict_by_time(self, from_t, to_t, chunk_size=None) -> pd.Series:
+        return pd.Series(self.value, index=pd.date_range(from_t, to_t))
+
+
+def test_selection_predictions_follow_a_refit_selection_model():
+    first, second = ConstantModel(1.), ConstantModel(2.)
+    model = ModelSelectionModel([first, second], meta_model=ConstantModel(0.))
+    index = pd.date_range('2020-01-01', periods=5)
+    assert model.get_selection_predictions(index)[0].tolist() == [1., 2.]
+
+    first.next_value = 3.
+    first.fit(pd.DataFrame(), pd.Series(dtype=float))
+    assert model.get_selection_predictions(index)[0].tolist() == [3., 2.]
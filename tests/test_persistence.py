@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from benchmarks.data import SyntheticPriceProvider, SyntheticMovementProvider, get_bar_index
+from tradearch.core.executor import GraphExecutor
+from tradearch.core.persistence import save_model, load_model
+from tradearch.models.basic import LogisticRegression, RandomForestClassifier
+from tradearch.providers.indicators import RSIIndicatorProvider, MACDIndicatorProvider
+
+N_BARS = 1500
+
+
+def _build_model():
+    price = SyntheticPriceProvider(N_BARS, seed=5)
+    movement = SyntheticMovementProvider(price)
+
+    first = LogisticRegression()
+    first.add_input_features(RSIIndicatorProvider(price))
+    first.set_output_feature(movement, column='adj_close')
+
+    model = RandomForestClassifier(n_estimators=10, random_state=0)
+    model.add_input_model(first, slug='first')
+    model.add_input_features(MACDIndicatorProvider(price))
+    model.set_output_feature(movement, column='adj_close')
+    return model
+
+
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_loaded_model_predicts_like_the_saved_one(tmp_path, mmap_mode):
+    index = get_bar_index(N_BARS)
+    model = _build_model()
+    GraphExecutor(model).fit_by_time(from_t=index[0], to_t=index[999])
+    expected = model.predict_by_time(from_t=index[1000], to_t=index[-1])
+
+    save_model(model, str(tmp_path / 'model'))
+    loaded = load_model(str(tmp_path / 'model'), mmap_mode=mmap_mode)
+
+    assert type(loaded) is type(model)
+    pd.testing.assert_series_equal(loaded.predict_by_time(from_t=index[1000], to_t=index[-1]), expected,
+                                   check_exact=True)
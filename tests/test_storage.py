@@ -0,0 +1,19 @@
+import os
+
+import pandas as pd
+
+from tradearch.core.storage import read_csv_columnar, set_cache_dir, clear_shared_frames
+
+
+def test_csv_with_text_columns_is_read_without_a_store(tmp_path):
+    file_path = os.path.join(str(tmp_path), 'prices.csv')
+    pd.DataFrame({'date': ['2020-01-01', '2020-01-02'], 'close': [1., 2.], 'note': ['a', 'b']}).to_csv(file_path,
+                                                                                                      index=False)
+    set_cache_dir(os.path.join(str(tmp_path), 'cache'))
+    try:
+        dataset = read_csv_columnar(file_path, index_col='date')
+    finally:
+        set_cache_dir(None)
+        clear_shared_frames()
+
+    assert dataset['close'].tolist() == [1., 2.] and dataset['note'].tolist() == ['a', 'b']
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tradearch.core.cache import clear_data_cache
+from tradearch.core.storage import append_rows
+from tradearch.providers.indicators import (SMAIndicatorProvider, BollingerBandsIndicatorProvider, MACDIndicatorProvider,
+                                            RSIIndicatorProvider)
+from tradearch.providers.us_stocks import UsStockPriceProvider, _streamed_bars
+
+
+@pytest.fixture
+def price_provider():
+    clear_data_cache()
+    yield UsStockPriceProvider('AAPL')
+    _streamed_bars.clear()
+    clear_data_cache()
+
+
+@pytest.mark.parametrize('build', [
+    lambda x: SMAIndicatorProvider(x, window=20),
+    lambda x: BollingerBandsIndicatorProvider(x),
+    lambda x: MACDIndicatorProvider(x),
+    lambda x: RSIIndicatorProvider(x),
+], ids=['sma', 'bollinger', 'macd', 'rsi'])
+def test_streamed_bars_equal_the_full_computation(price_provider, build, assert_frames_close):
+    prices = price_provider.get_data()
+    provider = build(price_provider)
+    provider.get_data()
+
+    last = prices.iloc[-1]
+    for i in range(60):
+        bar = (last * (1 + 0.01 * ((i * 7) % 5 - 2))).rename(prices.index[-1] + pd.Timedelta(days=i + 1))
+        price_provider.append(bar)
+        provider.update()
+
+    streamed = provider.get_data()
+    clear_data_cache()
+    assert_frames_close(streamed, build(price_provider).get_data())
+
+
+def test_append_rows_equals_concat():
+    index = pd.date_range('2020-01-01', periods=40, name='date')
+    dataset = pd.DataFrame({'close': np.arange(40.), 'volume': np.arange(40)}, index=index)
+
+    grown = dataset.iloc[:3]
+    for i in range(3, 40):
+        branch = grown
+        grown = append_rows(grown, dataset.iloc[i:i + 1])
+        # appending to an older frame again leaves the rows of the newer one alone
+        append_rows(branch, dataset.iloc[:1] * 0)
+
+    pd.testing.assert_frame_equal(grown, dataset, check_freq=False)
+    pd.testing.assert_frame_equal(append_rows(grown, dataset.iloc[:1].astype(float)),
+                                  pd.concat([dataset, dataset.iloc[:1].astype(float)]))
@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.data import SyntheticPriceProvider, SyntheticMovementProvider, get_bar_index
+from tradearch.core.sweep import Sweep
+from tradearch.models.basic import LogisticRegression
+from tradearch.providers.indicators import SMAIndicatorProvider
+
+N_BARS = 2000
+PARENT_PID = os.getpid()
+
+
+class MarketProvider(SMAIndicatorProvider):
+    def get_all_data(self):
+        if os.getpid() != PARENT_PID:
+            raise Exception('the shared provider was computed in a worker')
+        return super().get_all_data()
+
+
+PRICE = SyntheticPriceProvider(N_BARS, seed=3)
+MARKET = MarketProvider(SyntheticPriceProvider(N_BARS, seed=1), window=10)
+
+
+def build(params: dict):
+    model = LogisticRegression()
+    model.add_input_features(SMAIndicatorProvider(PRICE, window=params['window']))
+    model.add_input_features(MARKET)
+    model.set_output_feature(SyntheticMovementProvider(PRICE), column='adj_close')
+    return model
+
+
+def _run(**kwargs):
+    index = get_bar_index(N_BARS)
+    sweep = Sweep(build, metric='accuracy', max_workers=2, shared_providers=[MARKET], **kwargs)
+    return sweep.run(index[100], index[1500], index[1501], index[-1])
+
+
+@pytest.mark.parametrize('eta, min_fraction, n_trials, survivors', [
+    (3, None, 9, [9, 3, 1]),
+    (2, 0.25, 8, [8, 4, 2]),
+    (2, 0.5, 5, [5, 2]),
+])
+def test_successive_halving_keeps_the_best_trials(eta, min_fraction, n_trials, survivors):
+    results = _run(space={'window': range(2, 2 + n_trials)}, eta=eta, min_fraction=min_fraction)
+
+    assert results.groupby('rung').size().tolist() == survivors
+    assert sorted(results['fraction'].unique().tolist())[0] == pytest.approx(min_fraction or 1 / eta ** 2)
+    for rung in range(1, len(survivors)):
+        previous = results[results['rung'] == rung - 1].sort_values('accuracy', ascending=False)
+        kept = results[results['rung'] == rung]
+        assert sorted(kept['window']) == sorted(previous['window'].iloc[:len(kept.index)])
+
+
+def test_sweep_resumes_from_its_results(tmp_path):
+    results_path = os.path.join(str(tmp_path), 'results.jsonl')
+    space = {'window': [2, 5, 10, 20]}
+    first = _run(space=space, results_path=results_path)
+
+    # an interrupted sweep leaves its last line cut short, only that trial runs again
+    with open(results_path) as f:
+        lines = f.read().splitlines()
+    with open(results_path, 'w') as f:
+        f.write('\n'.join(lines[:-1]) + '\n' + lines[-1][:10])
+
+    resumed = _run(space=space, results_path=results_path)
+
+    with open(results_path) as f:
+        records = [json.loads(line) for line in f.read().splitlines()[len(lines):]]
+    assert [x['params'] for x in records] == [json.loads(lines[-1])['params']]
+    assert resumed.sort_values('window').reset_index(drop=True).equals(first.sort_values('window')
+                                                                       .reset_index(drop=True))
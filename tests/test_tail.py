@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from benchmarks.data import SyntheticPriceProvider, SyntheticMovementProvider, get_bar_index
+from tradearch.core.executor import GraphExecutor
+from tradearch.helpers import lag_provider, window_provider
+from tradearch.models.basic import LogisticRegression
+from tradearch.providers.indicators import SMAIndicatorProvider, MACDIndicatorProvider, PSARIndicatorProvider, \
+    RSIIndicatorProvider, BollingerBandsIndicatorProvider
+from tradearch.providers.us_stocks import UsStockPriceProvider, UsStockDiffProvider
+
+PRICE = UsStockPriceProvider('AAPL')
+
+PROVIDERS = [
+    SMAIndicatorProvider(PRICE, window=20),
+    MACDIndicatorProvider(PRICE),
+    PSARIndicatorProvider(PRICE),
+    RSIIndicatorProvider(PRICE),
+    BollingerBandsIndicatorProvider(PRICE, n=20),
+    UsStockDiffProvider('AAPL', n_days=5),
+    lag_provider(SMAIndicatorProvider(PRICE, window=5), [1, 3]),
+    window_provider(PRICE, [5, 10]),
+]
+
+
+@pytest.mark.parametrize('provider', PROVIDERS, ids=lambda x: type(x).__name__)
+@pytest.mark.parametrize('n_rows', [1, 30])
+def test_tail_equals_full_data(provider, n_rows, assert_frames_close):
+    full = provider.get_data()
+    assert_frames_close(provider.get_tail(n_rows), full.iloc[-n_rows:])
+
+    to_t = full.index[-100]
+    assert_frames_close(provider.get_tail(n_rows, to_t=to_t), full.loc[:to_t].iloc[-n_rows:])
+
+
+def test_latest_predictions_equal_full_predictions():
+    index = get_bar_index(1500)
+    price = SyntheticPriceProvider(len(index), seed=7)
+    model = LogisticRegression()
+    model.add_input_features(SMAIndicatorProvider(price, window=10))
+    model.add_input_features(lag_provider(RSIIndicatorProvider(price), [1, 2]))
+    model.set_output_feature(SyntheticMovementProvider(price), column='adj_close')
+    GraphExecutor(model).fit_by_time(from_t=index[0], to_t=index[999])
+
+    full = model.predict_by_time(from_t=index[1000], to_t=index[-1])
+    pd.testing.assert_series_equal(model.predict_latest(n_rows=10), full.iloc[-10:], check_freq=False)
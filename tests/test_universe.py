@@ -0,0 +1,50 @@
+import os
+import zlib
+
+from benchmarks.data import SyntheticPriceProvider, SyntheticMovementProvider, get_bar_index
+from tradearch.core.cache import get_persistent_cache
+from tradearch.core.universe import Universe
+from tradearch.models.basic import LogisticRegression
+from tradearch.providers.indicators import SMAIndicatorProvider, RSIIndicatorProvider
+
+N_BARS = 3000
+MARKET = SMAIndicatorProvider(SyntheticPriceProvider(N_BARS, seed=1), window=10)
+
+
+def build(symbol: str):
+    if symbol == 'FAIL':
+        raise ValueError('no data for FAIL')
+    if symbol == 'CRASH':
+        os._exit(3)
+    if get_persistent_cache() is not None:
+        raise Exception('the persistent cache was enabled in the worker')
+
+    price = SyntheticPriceProvider(N_BARS, seed=zlib.crc32(symbol.encode()))
+    model = LogisticRegression()
+    model.add_input_features(RSIIndicatorProvider(price))
+    model.add_input_features(MARKET)
+    model.set_output_feature(SyntheticMovementProvider(price), column='adj_close')
+    return model
+
+
+def _run(symbols, max_workers):
+    index = get_bar_index(N_BARS)
+    universe = Universe(build, symbols, shared_providers=[MARKET], max_workers=max_workers)
+    return universe, universe.run(index[100], index[2000], index[2001], index[-1])
+
+
+def test_pool_equals_serial_run():
+    symbols = ['A', 'B', 'C']
+    _, pooled = _run(symbols, max_workers=2)
+    _, serial = _run(symbols, max_workers=1)
+
+    assert list(pooled.columns) == symbols
+    assert pooled.equals(serial)
+
+
+def test_failures_are_isolated_per_symbol():
+    symbols = ['A', 'FAIL', 'B', 'CRASH', 'C', 'D']
+    universe, panel = _run(symbols, max_workers=3)
+
+    assert sorted(universe.errors) == ['CRASH', 'FAIL']
+    assert list(panel.columns) == ['A', 'B', 'C', 'D']
@@ -0,0 +1,24 @@
+import os
+
+import pandas as pd
+
+from tradearch.core.sources import DirectorySource
+from tradearch.providers.us_stocks import UsStockPriceProvider, UsStockMovementProvider, PACKAGE_SOURCE
+
+
+def test_derived_providers_read_their_source(tmp_path):
+    prices = pd.read_csv(PACKAGE_SOURCE.get_file_path('AAPL')).iloc[:50]
+    # falling prices, every movement is down
+    for column in ('open', 'high', 'low', 'close', 'adj_close', 'volume'):
+        prices[column] = range(50, 0, -1)
+    prices.to_csv(os.path.join(str(tmp_path), 'AAPL.csv'), index=False)
+
+    source = DirectorySource(str(tmp_path))
+    movement = UsStockMovementProvider('AAPL', source=source)
+
+    [diff] = movement.get_upstream_providers()
+    [price] = diff.get_upstream_providers()
+    assert price.get_identity() == UsStockPriceProvider('AAPL', source).get_identity()
+    assert len(movement.get_data().index) == 49 and (movement.get_data() == -1).all().all()
+    assert (movement.get_quantized_provider().get_data() == -1).all().all()
+    assert (UsStockMovementProvider('AAPL').get_data() == 1).any().any()
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Optional, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .executor import GraphExecutor
+from .model import Model, compute_window_metrics
+
+# (train_start, train_stop, test_start, test_stop) row positions of a fold
+Fold = Tuple[int, int, int, int]
+
+
+class WalkForward:
+    """
+    walk-forward backtest of a model, retrained on a moving (or expanding) window and tested on the bars after it.
+
+    sizes are in bars of the aligned training data. the input and output datasets are built once for the whole range
+    and every fold only slices them, folds are fitted in parallel worker processes reading the feature matrix from
+    shared memory. models with input models are retrained fold by fold through the graph executor instead, since
+    their inputs change with every fit.
+    """
+
+    def __init__(self, model: Model, train_size: int, test_size: int, step: Optional[int] = None, gap: int = 0,
+                 expanding: bool = False, max_workers: Optional[int] = None):
+        self.model = model
+        self.train_size = train_size
+        self.test_size = test_size
+        self.step = step if step is not None else test_size
+        self.gap = gap
+        self.expanding = expanding
+        self.max_workers = max_workers
+
+    def get_folds(self, n_rows: int) -> List[Fold]:
+        folds = []
+        train_stop = self.train_size
+        while train_stop + self.gap < n_rows:
+            train_start = 0 if self.expanding else train_stop - self.train_size
+            test_start = train_stop + self.gap
+            folds.append((train_start, train_stop, test_start, min(test_start + self.test_size, n_rows)))
+            train_stop += self.step
+
+        return folds
+
+    def _get_checked_folds(self, n_rows: int) -> List[Fold]:
+        folds = self.get_folds(n_rows)
+        if not folds:
+            raise Exception(f'{n_rows} rows are not enough for a single walk forward fold')
+
+        return folds
+
+    def predict_by_time(self, from_t: datetime, to_t: datetime) -> pd.DataFrame:
+        """
+        one row per tested bar with its fold, the predicted and the expected output. bars are repeated when the test
+        windows of consecutive folds overlap.
+        """
+        index, expected, folds, predictions = self._run(from_t=from_t, to_t=to_t)
+        return _get_prediction_frame(index, expected, folds, predictions)
+
+    def measure_by_time(self, from_t: datetime, to_t: datetime) -> pd.DataFrame:
+        """
+        one row per fold with its train and test range and the metrics of its test window.
+        """
+        index, expected, folds, predictions = self._run(from_t=from_t, to_t=to_t)
+        expected = np.asarray(expected)
+
+        # the test windows of all folds one after the other, measured in one pass
+        stops = np.cumsum([len(x) for x in predictions])
+        metrics = compute_window_metrics(
+            self.model.output_type,
+            expected_output=np.concatenate([expected[test_start:test_stop] for _, _, test_start, test_stop in folds]),
+            predicted_output=np.concatenate(predictions), starts=stops - [len(x) for x in predictions], stops=stops)
+
+        train_starts, train_stops, test_starts, test_stops = [np.array(x) for x in zip(*folds)]
+        return pd.DataFrame({
+            'train_from': index[train_starts],
+            'train_to': index[train_stops - 1],
+            'test_from': index[test_starts],
+            'test_to': index[test_stops - 1],
+            **metrics,
+        }, index=pd.RangeIndex(len(folds), name='fold'))
+
+    def _run(self, from_t: datetime, to_t: datetime) -> Tuple[pd.Index, pd.Series, List[Fold], List[np.ndarray]]:
+        if self.model.get_input_models():
+            return self._run_graph(from_t=from_t, to_t=to_t)
+
+        input_dataset, output_dataset = self.model.get_training_datasets(from_t=from_t, to_t=to_t)
+        folds = self._get_checked_folds(len(input_dataset.index))
+
+        values = input_dataset.to_numpy(dtype=np.float64)
+        columns = input_dataset.columns
+        model = _get_bare_model(self.model)
+
+        if self.max_workers == 1 or len(folds) < 2:
+            predictions = [_run_fold(model, values, columns, output_dataset, fold) for fold in folds]
+            return input_dataset.index, output_dataset, folds, predictions
+
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        try:
+            np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+            del values
+
+            with ProcessPoolExecutor(max_workers=self.max_workers or os.cpu_count(), initializer=_init_worker,
+                                     initargs=(shm.name, input_dataset.shape, columns, output_dataset, model)) as pool:
+                predictions = list(pool.map(_run_fold_in_worker, folds))
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return input_dataset.index, output_dataset, folds, predictions
+
+    def _run_graph(self, from_t: datetime, to_t: datetime) -> Tuple[pd.Index, pd.Series, List[Fold],
+                                                                   List[np.ndarray]]:
+        if self.model.output_feature_descriptor is None:
+            raise Exception('walk forward over a model graph needs an output feature on the model')
+
+        output_dataset = self.model.get_output_dataset(from_t=from_t, to_t=to_t).dropna()
+        index = output_dataset.index
+        folds = self._get_checked_folds(len(index))
+
+        executor = GraphExecutor(self.model)
+        predictions = []
+        for train_start, train_stop, test_start, test_stop in folds:
+            executor.fit_by_time(from_t=index[train_start], to_t=index[train_stop - 1])
+            prediction = executor.predict_by_time(from_t=index[test_start], to_t=index[test_stop - 1])
+            predictions.append(prediction.reindex(index[test_start:test_stop]).to_numpy())
+
+        return index, output_dataset, folds, predictions
+
+
+def _get_prediction_frame(index: pd.Index, expected: pd.Series, folds: List[Fold],
+                          predictions: List[np.ndarray]) -> pd.DataFrame:
+    positions = np.concatenate([np.arange(test_start, test_stop) for _, _, test_start, test_stop in folds])
+    sizes = [test_stop - test_start for _, _, test_start, test_stop in folds]
+
+    return pd.DataFrame({
+        'fold': np.repeat(np.arange(len(folds)), sizes),
+        'prediction': np.concatenate(predictions),
+        'expected': np.asarray(expected)[positions],
+    }, index=index[positions])
+
+
+def _get_bare_model(model: Model) -> Model:
+    # the model without its providers, it is fitted on the prepared matrix and has to be cheap to send to workers
+    model = copy.copy(model)
+    model.input_feature_descriptors = []
+    model.output_feature_descriptor = None
+    return model
+
+
+def _run_fold(model: Model, values: np.ndarray, columns: pd.Index, output_dataset: pd.Series,
+              fold: Fold) -> np.ndarray:
+    train_start, train_stop, test_start, test_stop = fold
+    index = output_dataset.index
+
+    model = copy.deepcopy(model)
+    model.fit(pd.DataFrame(values[train_start:train_stop], index=index[train_start:train_stop], columns=columns),
+              output_dataset.iloc[train_start:train_stop])
+
+    x = pd.DataFrame(values[test_start:test_stop], index=index[test_start:test_stop], columns=columns)
+    return pd.Series(model.predict(x), index=x.index).to_numpy()
+
+
+_worker_state = {}
+
+
+def _init_worker(shm_name: str, shape: Tuple[int, int], columns: pd.Index, output_dataset: pd.Series, model: Model):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_state.update({
+        'shm': shm,
+        'values': np.ndarray(shape, dtype=np.float64, buffer=shm.buf),
+        'columns': columns,
+        'output_dataset': output_dataset,
+        'model': model,
+    })
+
+
+def _run_fold_in_worker(fold: Fold) -> np.ndarray:
+    return _run_fold(_worker_state['model'], _worker_state['values'], _worker_state['columns'],
+                     _worker_state['output_dataset'], fold)
@@ -0,0 +1,188 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import pandas as pd
+
+from tradearch import __version__
+from .storage import ColumnarStore, get_cache_dir
+
+CACHE_MAX_BYTES_ENV = 'TRADEARCH_CACHE_MAX_BYTES'
+PERSISTENT_CACHE_ENV = 'TRADEARCH_PERSISTENT_CACHE'
+# bumped whenever the layout of the cached entries changes
+CACHE_FORMAT = 1
+
+
+def get_dataset_nbytes(dataset: pd.DataFrame) -> int:
+    return int(dataset.memory_usage(index=True, deep=False).sum())
+
+
+class DataCache:
+    """
+    process-wide lru cache of provider outputs keyed by provider identity, bounded by the total size of the frames.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, dataset: pd.DataFrame) -> bool:
+        """
+        stores the frame and returns whether it was stored, a frame larger than max_bytes is not.
+        """
+        nbytes = get_dataset_nbytes(dataset)
+
+        with self._lock:
+            self.discard(key)
+
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                return False  # would evict everything else and still not fit
+
+            self._entries[key] = (dataset, nbytes)
+            self._total_bytes += nbytes
+            self._evict()
+            return True
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def set_max_bytes(self, max_bytes: Optional[int]):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+
+        while self._entries and self._total_bytes > self.max_bytes:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._total_bytes -= nbytes
+
+
+data_cache = DataCache(max_bytes=int(os.environ.get(CACHE_MAX_BYTES_ENV, 2 * 1024 ** 3)))
+
+
+def set_cache_max_bytes(max_bytes: Optional[int]):
+    data_cache.set_max_bytes(max_bytes)
+
+
+def clear_data_cache():
+    data_cache.clear()
+
+
+class PersistentCache:
+    """
+    on-disk cache of provider outputs stored as columnar stores, so they are memory-mapped on load.
+
+    entries are keyed by provider identity and by the version of the code that computed them: the cache format, the
+    library version and the cache_version of the providers. they carry the fingerprint of the source files they were
+    computed from, an entry whose fingerprint does not match anymore is recomputed and overwritten.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, identity: tuple, fingerprint: list, version: tuple = ()) -> Optional[pd.DataFrame]:
+        store = self._get_store(identity, version)
+        meta = store.read_meta()
+        if meta is None:
+            return None
+
+        extra = meta.get('extra', {})
+        if extra.get('identity') != repr(identity) or extra.get('version') != repr(_get_version(version)) or \
+                extra.get('fingerprint') != _to_json_list(fingerprint):
+            return None
+
+        try:
+            return store.read()
+        except (OSError, ValueError):
+            return None
+
+    def save(self, identity: tuple, fingerprint: list, dataset: pd.DataFrame, version: tuple = ()) -> bool:
+        try:
+            self._get_store(identity, version).write(dataset, extra={
+                'identity': repr(identity),
+                'version': repr(_get_version(version)),
+                'fingerprint': _to_json_list(fingerprint),
+            })
+        except (OSError, ValueError):
+            return False  # read-only cache directory or a dtype the columnar store can not hold
+
+        return True
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _get_store(self, identity: tuple, version: tuple) -> ColumnarStore:
+        digest = hashlib.sha1(repr((_get_version(version), identity)).encode('utf-8')).hexdigest()
+        return ColumnarStore(os.path.join(self.path, digest[:2], digest))
+
+
+def _get_version(version: tuple) -> tuple:
+    return CACHE_FORMAT, __version__, version
+
+
+def _to_json_list(value):
+    if isinstance(value, (list, tuple)):
+        return [_to_json_list(x) for x in value]
+    return value
+
+
+persistent_cache: Optional[PersistentCache] = None
+
+
+def enable_persistent_cache(path: Optional[str] = None) -> PersistentCache:
+    global persistent_cache
+    persistent_cache = PersistentCache(path if path else os.path.join(get_cache_dir(), 'providers'))
+    return persistent_cache
+
+
+def disable_persistent_cache():
+    global persistent_cache
+    persistent_cache = None
+
+
+def get_persistent_cache() -> Optional[PersistentCache]:
+    return persistent_cache
+
+
+# '1' enables the cache in the default location, any other value is used as the cache path
+if os.environ.get(PERSISTENT_CACHE_ENV):
+    enable_persistent_cache(None if os.environ[PERSISTENT_CACHE_ENV] == '1' else os.environ[PERSISTENT_CACHE_ENV])
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, Context, copy_context
+from datetime import datetime
+from typing import Optional, Callable, Dict, Hashable, List, Iterable, Tuple, Union, TYPE_CHECKING
+
+import pandas as pd
+
+from .instrumentation import note_cache
+from .provider import SharedValues, set_shared_values
+
+if TYPE_CHECKING:
+    from .model import Model
+
+_active_memo: ContextVar[Optional[PredictionMemo]] = ContextVar('tradearch_prediction_memo', default=None)
+
+
+def get_active_memo() -> Optional[PredictionMemo]:
+    return _active_memo.get()
+
+
+class PredictionMemo:
+    """
+    predictions of the models of a graph keyed by model and range, shared by everything running under one executor
+    call so every model is predicted once per range.
+    """
+
+    def __init__(self):
+        self._predictions: Dict[Hashable, pd.Series] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, model: Model, from_t: datetime, to_t: datetime,
+                       compute: Callable[[], pd.Series]) -> pd.Series:
+        key = (id(model), from_t, to_t)
+
+        with self._lock:
+            if key in self._predictions:
+                note_cache('memo')
+                return self._predictions[key]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if key in self._predictions:
+                note_cache('memo')
+            else:
+                note_cache('miss')
+                self._predictions[key] = compute()
+
+            return self._predictions[key]
+
+
+class GraphExecutor:
+    """
+    runs a model graph layer by layer, from the models without input models up to the given model.
+
+    every model is fitted and predicted once per requested range and the models of a layer run concurrently on a
+    thread pool, most estimators release the gil while fitting. provider data is loaded concurrently up front, in one
+    pass sharing the intermediate results of providers over the same prices.
+    """
+
+    def __init__(self, model: Model, max_workers: Optional[int] = None):
+        self.model = model
+        self.max_workers = max_workers
+
+    def fit_by_time(self, from_t: datetime, to_t: datetime):
+        layers = list(self.model.get_layers())
+        context = self._create_context()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            self._load_providers(pool, context, layers)
+
+            for i, layer in enumerate(layers):
+                self._map(pool, context, [lambda m=m: m.fit_by_time(from_t=from_t, to_t=to_t) for m in layer])
+
+                # the next layers read these predictions from the memo
+                if i < len(layers) - 1:
+                    self._map(pool, context, [lambda m=m: m.predict_by_time(from_t=from_t, to_t=to_t) for m in layer])
+
+    def predict_by_time(self, from_t: datetime, to_t: datetime) -> pd.Series:
+        context = self._predict_layers(from_t=from_t, to_t=to_t)
+        return context.run(self.model.predict_by_time, from_t=from_t, to_t=to_t)
+
+    def measure_by_time(self, from_t: datetime, to_t: datetime) -> dict:
+        context = self._predict_layers(from_t=from_t, to_t=to_t)
+        return context.run(self.model.measure_by_time, from_t=from_t, to_t=to_t)
+
+    def measure_windows(self, from_t: datetime, to_t: datetime,
+                        windows: Union[str, int, Iterable[Tuple[datetime, datetime]]], step: int = 1) -> pd.DataFrame:
+        context = self._predict_layers(from_t=from_t, to_t=to_t)
+        return context.run(self.model.measure_windows, from_t=from_t, to_t=to_t, windows=windows, step=step)
+
+    def _predict_layers(self, from_t: datetime, to_t: datetime) -> Context:
+        layers = list(self.model.get_layers())
+        context = self._create_context()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            self._load_providers(pool, context, layers)
+
+            for layer in layers:
+                self._map(pool, context, [lambda m=m: m.predict_by_time(from_t=from_t, to_t=to_t) for m in layer])
+
+        return context
+
+    def _load_providers(self, pool: ThreadPoolExecutor, context: Context, layers: List[List[Model]]):
+        providers = {}
+        for layer in layers:
+            for model in layer:
+                for provider in model.get_input_providers():
+                    identity = provider.get_identity()
+                    providers[identity if identity is not None else id(provider)] = provider
+
+        self._map(pool, context, [lambda p=p: p.get_data() for p in providers.values()])
+
+    @staticmethod
+    def _create_context() -> Context:
+        # the memo and the shared values are only active for this executor call, tasks run in copies of this context
+        context = copy_context()
+        context.run(_active_memo.set, PredictionMemo())
+        context.run(set_shared_values, SharedValues())
+        return context
+
+    @staticmethod
+    def _map(pool: ThreadPoolExecutor, context: Context, tasks: List[Callable]):
+        futures = [pool.submit(context.copy().run, task) for task in tasks]
+        for future in futures:
+            future.result()
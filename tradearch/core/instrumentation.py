@@ -0,0 +1,172 @@
+"""
+opt-in instrumentation of the provider and model hot paths.
+
+provider and model subclasses get their data, fit and predict methods wrapped when they are defined. while no
+recorder is active a wrapped method costs one global lookup on top of the call, so it can stay in production code.
+spans are recorded for the threads of this process, work done in worker processes is not seen.
+"""
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, List, Iterable, Callable
+
+import pandas as pd
+
+_recorder: Optional['Recorder'] = None
+_current_span: ContextVar[Optional['Span']] = ContextVar('tradearch_current_span', default=None)
+
+
+class Span:
+    __slots__ = ('span_id', 'parent_id', 'category', 'name', 'thread_id', 'start_ns', 'duration_ns', 'rows',
+                 'nbytes', 'cache')
+
+    def __init__(self, span_id: int, parent_id: Optional[int], category: str, name: str):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.category = category
+        self.name = name
+        self.thread_id = threading.get_ident()
+        self.start_ns = 0
+        self.duration_ns = 0
+        self.rows = None
+        self.nbytes = None
+        self.cache = None
+
+
+class Recorder:
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._ids = itertools.count(1)
+        self._origin_ns = time.perf_counter_ns()
+
+    def run(self, category: str, name: str, method: Callable, args: tuple, kwargs: dict):
+        parent = _current_span.get()
+        span = Span(next(self._ids), parent.span_id if parent is not None else None, category, name)
+        token = _current_span.set(span)
+        span.start_ns = time.perf_counter_ns()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            span.duration_ns = time.perf_counter_ns() - span.start_ns
+            _current_span.reset(token)
+            self.spans.append(span)
+
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            span.rows = len(result.index)
+            span.nbytes = int(result.memory_usage(index=True).sum()) if isinstance(result, pd.DataFrame) \
+                else int(result.memory_usage(index=True))
+
+        return result
+
+    def summary(self) -> pd.DataFrame:
+        """
+        one row per method with its calls, total and self time (without the traced calls it made) in seconds, the
+        rows and bytes it returned and its cache hits and misses, slowest first.
+        """
+        child_ns = {}
+        for span in self.spans:
+            if span.parent_id is not None:
+                child_ns[span.parent_id] = child_ns.get(span.parent_id, 0) + span.duration_ns
+
+        rows = [{
+            'name': span.name,
+            'category': span.category,
+            'total_seconds': span.duration_ns / 1e9,
+            'self_seconds': (span.duration_ns - child_ns.get(span.span_id, 0)) / 1e9,
+            'rows': span.rows or 0,
+            'bytes': span.nbytes or 0,
+            'cache_hits': int(span.cache is not None and span.cache != 'miss'),
+            'cache_misses': int(span.cache == 'miss'),
+        } for span in self.spans]
+
+        columns = ['calls', 'total_seconds', 'self_seconds', 'rows', 'bytes', 'cache_hits', 'cache_misses']
+        if not rows:
+            return pd.DataFrame(columns=['name', 'category'] + columns).set_index(['name', 'category'])
+
+        dataset = pd.DataFrame(rows)
+        dataset['calls'] = 1
+        return dataset.groupby(['name', 'category'])[columns].sum().sort_values('total_seconds', ascending=False)
+
+    def export_chrome_trace(self, path: str):
+        """
+        writes the spans in the trace event format read by chrome://tracing and ui.perfetto.dev.
+        """
+        pid = os.getpid()
+        events = []
+        for span in sorted(self.spans, key=lambda x: x.start_ns):
+            args = {'rows': span.rows, 'bytes': span.nbytes, 'cache': span.cache}
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': (span.start_ns - self._origin_ns) / 1e3,
+                'dur': span.duration_ns / 1e3,
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': {k: v for k, v in args.items() if v is not None},
+            })
+
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def enable_instrumentation() -> Recorder:
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def disable_instrumentation():
+    global _recorder
+    _recorder = None
+
+
+def get_recorder() -> Optional[Recorder]:
+    return _recorder
+
+
+@contextmanager
+def record():
+    global _recorder
+    previous = _recorder
+    recorder = enable_instrumentation()
+    try:
+        yield recorder
+    finally:
+        _recorder = previous
+
+
+def note_cache(kind: str):
+    # kind is where the data of the current call came from, 'miss' when it had to be computed
+    if _recorder is not None:
+        span = _current_span.get()
+        if span is not None and span.cache is None:
+            span.cache = kind
+
+
+def traced(category: str):
+    def decorate(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return method(self, *args, **kwargs)
+
+            return recorder.run(category, f'{type(self).__name__}.{method.__name__}', method, (self,) + args, kwargs)
+
+        wrapper.__traced__ = True
+        return wrapper
+
+    return decorate
+
+
+def trace_methods(cls: type, category: str, names: Iterable[str]):
+    for name in names:
+        method = cls.__dict__.get(name)
+        if callable(method) and not getattr(method, '__traced__', False):
+            setattr(cls, name, traced(category)(method))
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
+import functools
 from abc import ABC, abstractmethod
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import Optional, Iterable
+from typing import Optional, Iterable, List, Dict, Tuple, Iterator, Union
 
+import numpy as np
 import pandas as pd
-from sklearn.metrics import accuracy_score, f1_score, mean_squared_error, mean_absolute_error, r2_score
 
-from .provider import Provider, get_provider_series, get_provider_dataset
+from .executor import get_active_memo
+from .instrumentation import traced, trace_methods
+from .provider import Provider, RangePlan, get_provider_series, get_provider_dataset, get_active_range_plan, \
+    iter_chunk_plans, sharing_values
 
 
 class ModelOutputTypes(Enum):
@@ -18,6 +22,12 @@ class ModelOutputTypes(Enum):
 
 class Model(ABC):
     output_type: ModelOutputTypes = None
+    # dtype of the input matrix, e.g. np.float32 or np.int8 for label inputs, float64 when not set
+    input_dtype: Optional[np.dtype] = None
+    # last bar the model was trained on, update_by_time continues after it
+    _trained_to_t: Optional[datetime] = None
+    # bumped by every fit, partial_fit and reset, values derived from the fitted model compare it to tell they are stale
+    _fit_generation = 0
 
     def __init__(self):
         self.input_feature_descriptors = []
@@ -25,6 +35,15 @@ class Model(ABC):
         self.output_feature_descriptor = None
         self.output_model = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in ('fit', 'partial_fit', 'reset'):
+            method = cls.__dict__.get(name)
+            if callable(method):
+                setattr(cls, name, _counting_fits(method))
+        trace_methods(cls, 'model', ('fit', 'partial_fit', 'predict', 'fit_by_time', 'predict_by_time',
+                                     'get_input_dataset'))
+
     def add_input_features(self, provider: Provider, columns: Optional[Iterable[str]] = None,
                            slug: Optional[str] = None):
         self.input_feature_descriptors.append({
@@ -54,49 +73,178 @@ class Model(ABC):
         self.output_model = model
         return self
 
+    def set_input_dtype(self, dtype: Optional[np.dtype]):
+        self.input_dtype = dtype
+        return self
+
+    @traced('model')
     def fit_by_time(self, from_t: datetime, to_t: datetime):
-        input_dataset = self.get_input_dataset(from_t=from_t, to_t=to_t)
+        input_dataset, output_dataset = self.get_training_datasets(from_t=from_t, to_t=to_t)
+        self.fit(input_dataset, output_dataset)
+        self._trained_to_t = output_dataset.index.max() if len(output_dataset.index) else None
+
+    @traced('model')
+    def update_by_time(self, from_t: Optional[datetime], to_t: datetime):
+        """
+        trains the fitted model further on the bars of the range through partial_fit, from_t=None takes the bars
+        after the last bar the model was trained on.
+        """
+        after_t = None
+        if from_t is None:
+            if self._trained_to_t is None:
+                raise Exception('model is not fitted, fit it before updating it')
+            from_t = after_t = self._trained_to_t
+
+        input_dataset, output_dataset = self.get_training_datasets(from_t=from_t, to_t=to_t)
+        if after_t is not None:
+            new = input_dataset.index > after_t
+            input_dataset, output_dataset = input_dataset[new], output_dataset[new]
+
+        if not len(input_dataset.index):
+            return
+
+        self.partial_fit(input_dataset, output_dataset)
+        self._trained_to_t = max(output_dataset.index.max(), self._trained_to_t or output_dataset.index.max())
+
+    @traced('model')
+    def get_training_datasets(self, from_t: datetime, to_t: datetime) -> Tuple[pd.DataFrame, pd.Series]:
         output_dataset = self.get_output_dataset(from_t=from_t, to_t=to_t)
+        input_dataset = assemble_datasets(self.get_input_datasets(from_t=from_t, to_t=to_t),
+                                          index=output_dataset.index, dtype=self.input_dtype)
 
-        input_dataset = input_dataset[input_dataset.index.isin(output_dataset.index)]
-        output_dataset = output_dataset[output_dataset.index.isin(input_dataset.index)].reindex(input_dataset.index)
+        return input_dataset, output_dataset.reindex(input_dataset.index)
 
-        self.fit(input_dataset, output_dataset)
+    @traced('model')
+    def predict_by_time(self, from_t: datetime, to_t: datetime,
+                        chunk_size: Optional[Union[str, timedelta]] = None) -> pd.Series:
+        """
+        with chunk_size the range is predicted chunk by chunk, see iter_predictions.
+        """
+        if chunk_size is not None:
+            return _concat_series(list(self.iter_predictions(from_t=from_t, to_t=to_t, chunk_size=chunk_size)))
 
-    def predict_by_time(self, from_t: datetime, to_t: datetime) -> pd.Series:
+        memo = get_active_memo()
+        # predictions over slices of the providers are not memoized with the full ones
+        if memo is not None and get_active_range_plan() is None:
+            return memo.get_or_compute(self, from_t, to_t, lambda: self._predict_by_time(from_t=from_t, to_t=to_t))
+
+        return self._predict_by_time(from_t=from_t, to_t=to_t)
+
+    def _predict_by_time(self, from_t: datetime, to_t: datetime) -> pd.Series:
         input_dataset = self.get_input_dataset(from_t=from_t, to_t=to_t)
         output_dataset = pd.Series(self.predict(input_dataset), index=input_dataset.index)
         return output_dataset
 
-    def measure_by_time(self, from_t: datetime, to_t: datetime) -> dict:
-        predicted_output = self.predict_by_time(from_t=from_t, to_t=to_t)
-        expected_output = self.get_output_dataset(from_t=from_t, to_t=to_t)
-
-        expected_output = expected_output[expected_output.index.isin(predicted_output.index)] \
-            .reindex(predicted_output.index)
-
-        if self.output_type == ModelOutputTypes.CLASSIFICATION:
-            return {
-                'accuracy': accuracy_score(expected_output, predicted_output),
-                'f1_score': f1_score(expected_output, predicted_output),
-            }
-        elif self.output_type == ModelOutputTypes.REGRESSION:
-            return {
-                'mae': mean_absolute_error(expected_output, predicted_output),
-                'mse': mean_squared_error(expected_output, predicted_output),
-                'r2_score': r2_score(expected_output, predicted_output),
-            }
-
-        raise Exception('this output type does not support measure')
+    def predict_latest(self, n_rows: int = 1, to_t: Optional[datetime] = None) -> pd.Series:
+        """
+        predictions for the last n_rows bars up to to_t. the providers of the graph compute only the rows these bars
+        need (see Provider.get_lookback) instead of their whole history, providers without a lookback are read from
+        their cached data, which update keeps current.
+        """
+        plan = RangePlan(to_t=to_t)
+        for provider in self.get_graph_providers():
+            plan.require(provider, n_rows)
+
+        with plan.activate():
+            prediction = self.predict_by_time(from_t=None, to_t=to_t)
+
+        return prediction.iloc[max(len(prediction.index) - n_rows, 0):]
+
+    def iter_predictions(self, from_t: Optional[datetime], to_t: Optional[datetime],
+                         chunk_size: Union[str, timedelta]) -> Iterator[pd.Series]:
+        """
+        predictions from from_t to to_t in chunks spanning chunk_size each. the providers of the graph compute every
+        chunk from the slices of their upstream providers plus the overlap their lookbacks need (see
+        Provider.iter_chunks), so the inputs of one chunk are held at a time and the predictions equal the unchunked
+        ones.
+        """
+        for predicted_output, _ in self._iter_chunk_outputs(from_t, to_t, chunk_size, with_expected=False):
+            yield predicted_output
+
+    def measure_by_time(self, from_t: datetime, to_t: datetime,
+                        chunk_size: Optional[Union[str, timedelta]] = None) -> dict:
+        expected_output, predicted_output = self._get_measured_outputs(from_t, to_t, chunk_size=chunk_size)
+        return compute_metrics(self.output_type, expected_output=expected_output, predicted_output=predicted_output)
+
+    def measure_windows(self, from_t: datetime, to_t: datetime,
+                        windows: Union[str, int, Iterable[Tuple[datetime, datetime]]], step: int = 1,
+                        chunk_size: Optional[Union[str, timedelta]] = None) -> pd.DataFrame:
+        """
+        metrics of many windows of the range from a single prediction pass, one row per window with its range and
+        number of bars. windows is a period frequency like 'M' or 'W' for calendar buckets, a number of bars for
+        rolling windows ending every step bars, or a list of (from_t, to_t) ranges. see compute_window_metrics.
+        """
+        expected_output, predicted_output = self._get_measured_outputs(from_t, to_t, chunk_size=chunk_size)
+        index = predicted_output.index
+
+        if isinstance(windows, str):
+            periods = index.to_period(windows)
+            starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]]) if len(index) \
+                else np.zeros(0, dtype=np.int64)
+            stops = np.r_[starts[1:], len(index)].astype(np.int64)
+            ranges = [(x.start_time, x.end_time) for x in periods[starts]]
+        elif isinstance(windows, (int, np.integer)):
+            stops = np.arange(windows, len(index) + 1, step, dtype=np.int64)
+            starts = stops - windows
+            ranges = list(zip(index[starts], index[stops - 1]))
+        else:
+            ranges = [(pd.Timestamp(x), pd.Timestamp(y)) for x, y in windows]
+            starts = index.searchsorted([x for x, _ in ranges], side='left').astype(np.int64)
+            stops = index.searchsorted([y for _, y in ranges], side='right').astype(np.int64)
+
+        metrics = compute_window_metrics(self.output_type, expected_output=expected_output,
+                                         predicted_output=predicted_output, starts=starts, stops=stops)
+
+        return pd.DataFrame({
+            'from_t': [x for x, _ in ranges],
+            'to_t': [y for _, y in ranges],
+            'n_rows': np.maximum(stops - starts, 0),
+            **metrics,
+        })
 
+    def _get_measured_outputs(self, from_t: datetime, to_t: datetime,
+                              chunk_size: Optional[Union[str, timedelta]] = None) -> Tuple[pd.Series, pd.Series]:
+        if chunk_size is None:
+            outputs = [(self.predict_by_time(from_t=from_t, to_t=to_t), self.get_output_dataset(from_t=from_t,
+                                                                                               to_t=to_t))]
+        else:
+            outputs = self._iter_chunk_outputs(from_t, to_t, chunk_size, with_expected=True)
+
+        predicted_outputs, expected_outputs = [], []
+        for predicted_output, expected_output in outputs:
+            predicted_outputs.append(predicted_output)
+            expected_outputs.append(expected_output[expected_output.index.isin(predicted_output.index)]
+                                    .reindex(predicted_output.index))
+
+        return _concat_series(expected_outputs), _concat_series(predicted_outputs)
+
+    def _iter_chunk_outputs(self, from_t: Optional[datetime], to_t: Optional[datetime],
+                            chunk_size: Union[str, timedelta],
+                            with_expected: bool) -> Iterator[Tuple[pd.Series, Optional[pd.Series]]]:
+        providers = self.get_graph_providers(with_output=with_expected)
+        for plan in iter_chunk_plans(providers, chunk_size, from_t=from_t, to_t=to_t):
+            with plan.activate():
+                predicted_output = self.predict_by_time(from_t=plan.from_t, to_t=plan.to_t)
+                expected_output = self.get_output_dataset(from_t=plan.from_t, to_t=plan.to_t) \
+                    if with_expected else None
+
+            if len(predicted_output.index):
+                yield predicted_output, expected_output
+
+    @traced('model')
     def get_input_dataset(self, from_t: datetime, to_t: datetime) -> pd.DataFrame:
+        return assemble_datasets(self.get_input_datasets(from_t=from_t, to_t=to_t), dtype=self.input_dtype)
+
+    def get_input_datasets(self, from_t: datetime, to_t: datetime) -> List[pd.DataFrame]:
         input_datasets = []
-        for feature_descriptor in self.input_feature_descriptors:
-            dataset = get_provider_dataset(provider=feature_descriptor.get('provider'),
-                                           from_t=from_t, to_t=to_t,
-                                           columns=feature_descriptor.get('columns'),
-                                           slug=feature_descriptor.get('slug'))
-            input_datasets.append(dataset)
+        # the input features are computed in one pass, indicators over the same prices share their rolling statistics
+        with sharing_values():
+            for feature_descriptor in self.input_feature_descriptors:
+                dataset = get_provider_dataset(provider=feature_descriptor.get('provider'),
+                                               from_t=from_t, to_t=to_t,
+                                               columns=feature_descriptor.get('columns'),
+                                               slug=feature_descriptor.get('slug'))
+                input_datasets.append(dataset)
 
         for model_descriptor in self.input_model_descriptors:
             dataset = get_model_dataset(model=model_descriptor.get('model'),
@@ -104,19 +252,7 @@ class Model(ABC):
                                         slug=model_descriptor.get('slug'))
             input_datasets.append(dataset)
 
-        if not input_datasets:
-            return pd.DataFrame()
-
-        ret = input_datasets[0]
-        for i, dataset in enumerate(input_datasets):
-            if i == 0:
-                continue
-
-            ret = pd.merge(ret, dataset, left_index=True, right_index=True)
-
-        ret = ret.dropna()
-
-        return ret
+        return input_datasets
 
     def get_output_dataset(self, from_t: datetime, to_t: datetime) -> pd.Series:
         if self.output_model is not None:
@@ -129,20 +265,78 @@ class Model(ABC):
 
         raise Exception('no output is set on model')
 
-    def get_layers(self) -> Iterable[Iterable[Model]]:
-        layers = [[self]]
+    def get_input_models(self) -> List[Model]:
+        models = [x.get('model') for x in self.input_model_descriptors]
+        if self.output_model is not None:
+            models.append(self.output_model)
+
+        return models
+
+    def get_input_providers(self) -> List[Provider]:
+        providers = [x.get('provider') for x in self.input_feature_descriptors]
+        if self.output_feature_descriptor is not None:
+            providers.append(self.output_feature_descriptor.get('provider'))
+
+        return providers
+
+    def get_graph_providers(self, with_output: bool = False) -> List[Provider]:
+        """
+        the feature providers the predictions of the model are computed from, its own and those of its input models.
+        with_output adds the providers of its output.
+        """
+        providers: Dict[int, Provider] = {}
+        visited = set()
+
+        def visit(model: Model):
+            if id(model) in visited:
+                return
+            visited.add(id(model))
+
+            for feature_descriptor in model.input_feature_descriptors:
+                providers.setdefault(id(feature_descriptor.get('provider')), feature_descriptor.get('provider'))
+            for model_descriptor in model.input_model_descriptors:
+                visit(model_descriptor.get('model'))
+
+        visit(self)
+        if with_output:
+            if self.output_feature_descriptor is not None:
+                provider = self.output_feature_descriptor.get('provider')
+                providers.setdefault(id(provider), provider)
+            if self.output_model is not None:
+                visit(self.output_model)
 
-        while True:
-            layer = []
-            for model in layers[-1]:
-                layer.extend([x.get('model') for x in model.input_model_descriptors])
+        return list(providers.values())
 
-            if not layer:
-                break
+    def get_layers(self) -> List[List[Model]]:
+        # every model sits one layer above its deepest input model, so a model shared by several others is in
+        # exactly one layer and all of its inputs are in the layers before it
+        depths: Dict[int, int] = {}
+        models: Dict[int, Model] = {}
 
-            layers.append(layer)
+        def visit(model: Model, path: Tuple[int, ...]) -> int:
+            if id(model) in path:
+                raise Exception('model graph has a cycle')
 
-        return reversed(layers)
+            if id(model) not in depths:
+                input_models = model.get_input_models()
+                depths[id(model)] = max([visit(x, path + (id(model),)) + 1 for x in input_models] + [0])
+                models[id(model)] = model
+
+            return depths[id(model)]
+
+        visit(self, ())
+
+        layers = [[] for _ in range(max(depths.values()) + 1)]
+        for key, model in models.items():
+            layers[depths[key]].append(model)
+
+        return layers
+
+    def get_fit_generation(self) -> tuple:
+        """
+        changes whenever this model or a model its inputs come from is fitted or reset.
+        """
+        return (self._fit_generation, *(model.get_fit_generation() for model in self.get_input_models()))
 
     def reset(self):
         for model_descriptor in self.input_model_descriptors:
@@ -156,6 +350,179 @@ class Model(ABC):
     def predict(self, x: pd.DataFrame) -> pd.Series:
         raise NotImplementedError('predict method is not implemented')
 
+    def partial_fit(self, x: pd.DataFrame, y: pd.Series):
+        raise NotImplementedError('partial fit method is not implemented')
+
+
+def assemble_datasets(datasets: List[pd.DataFrame], index: Optional[pd.Index] = None,
+                      dtype: Optional[np.dtype] = None) -> pd.DataFrame:
+    """
+    inner join of the datasets on their index without rows holding a missing value, optionally restricted to index,
+    as one c-contiguous matrix. column names clash the same way pd.merge would name them.
+    """
+    if not datasets:
+        return pd.DataFrame()
+
+    common_index = datasets[0].index
+    for dataset in datasets[1:]:
+        common_index = _intersect_indexes(common_index, dataset.index)
+    if index is not None:
+        common_index = common_index[common_index.isin(index)]
+
+    try:
+        sources = [dataset.to_numpy(dtype=np.float64) for dataset in datasets]
+    except (TypeError, ValueError):
+        return _merge_datasets(datasets, index=index)
+
+    # rows of every dataset in the joined order, then the rows where any input is missing are left out
+    positions = [_get_positions(dataset.index, common_index) for dataset in datasets]
+    valid = np.ones(len(common_index), dtype=bool)
+    for source, source_positions in zip(sources, positions):
+        valid &= ~np.isnan(source[source_positions]).any(axis=1)
+
+    if not valid.all():
+        common_index = common_index[valid]
+        positions = [np.arange(len(source))[x][valid] for source, x in zip(sources, positions)]
+
+    ret = np.empty((len(common_index), sum(source.shape[1] for source in sources)),
+                   dtype=dtype if dtype is not None else np.float64)
+    start = 0
+    for source, source_positions in zip(sources, positions):
+        ret[:, start:start + source.shape[1]] = source[source_positions]
+        start += source.shape[1]
+
+    return pd.DataFrame(ret, index=common_index, columns=_get_merged_columns(datasets), copy=False)
+
+
+def _find_run(index: pd.Index, target: pd.Index) -> Optional[int]:
+    # where target appears in index as a run of consecutive rows. datasets computed from the same prices are runs of
+    # the same bars, they are aligned by a binary search instead of a hash lookup per row
+    if not len(target) or not index.is_monotonic_increasing or not target.is_monotonic_increasing:
+        return None
+
+    start = index.searchsorted(target[0], side='left')
+    if start + len(target) <= len(index) and index[start:start + len(target)].equals(target):
+        return start
+
+    return None
+
+
+def _intersect_indexes(index: pd.Index, other: pd.Index) -> pd.Index:
+    if _find_run(other, index) is not None:
+        return index
+
+    start = _find_run(index, other)
+    if start is not None:
+        return index[start:start + len(other)]
+
+    return index[index.isin(other)]
+
+
+def _get_positions(index: pd.Index, target: pd.Index) -> Union[slice, np.ndarray]:
+    start = _find_run(index, target)
+    if start is not None:
+        return slice(start, start + len(target))
+
+    return index.get_indexer(target)
+
+
+def _get_merged_columns(datasets: List[pd.DataFrame]) -> List:
+    columns = list(datasets[0].columns)
+    for dataset in datasets[1:]:
+        overlap = set(columns) & set(dataset.columns)
+        columns = [f'{x}_x' if x in overlap else x for x in columns] + \
+                  [f'{x}_y' if x in overlap else x for x in dataset.columns]
+
+    return columns
+
+
+def _merge_datasets(datasets: List[pd.DataFrame], index: Optional[pd.Index] = None) -> pd.DataFrame:
+    # inputs that are not numeric are joined by pandas and keep their dtypes
+    ret = datasets[0]
+    for dataset in datasets[1:]:
+        ret = pd.merge(ret, dataset, left_index=True, right_index=True)
+
+    if index is not None:
+        ret = ret[ret.index.isin(index)]
+
+    return ret.dropna()
+
+
+def _concat_series(series: List[pd.Series]) -> pd.Series:
+    if not series:
+        return pd.Series(dtype=np.float64)
+
+    return series[0] if len(series) == 1 else pd.concat(series)
+
+
+def compute_metrics(output_type: ModelOutputTypes, expected_output, predicted_output) -> dict:
+    # imported here, scikit-learn takes seconds to import and most processes never measure
+    from sklearn.metrics import accuracy_score, f1_score, mean_squared_error, mean_absolute_error, r2_score
+
+    if output_type == ModelOutputTypes.CLASSIFICATION:
+        return {
+            'accuracy': accuracy_score(expected_output, predicted_output),
+            'f1_score': f1_score(expected_output, predicted_output),
+        }
+    elif output_type == ModelOutputTypes.REGRESSION:
+        return {
+            'mae': mean_absolute_error(expected_output, predicted_output),
+            'mse': mean_squared_error(expected_output, predicted_output),
+            'r2_score': r2_score(expected_output, predicted_output),
+        }
+
+    raise Exception('this output type does not support measure')
+
+
+def compute_window_metrics(output_type: ModelOutputTypes, expected_output, predicted_output, starts,
+                           stops) -> Dict[str, np.ndarray]:
+    """
+    the metrics of compute_metrics for many [start, stop) row windows of the same outputs, every window is a
+    difference of cumulative confusion counts or error sums, so any number of windows costs one pass over the rows.
+    f1_score is that of label 1 and 0 without positives, r2_score is 1 for a perfect and 0 for any other prediction
+    of a constant window and nan for a window under two rows, like scikit-learn. empty windows get nan.
+    """
+    expected = np.asarray(expected_output)
+    predicted = np.asarray(predicted_output)
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.maximum(np.asarray(stops, dtype=np.int64), starts)
+    n_rows = (stops - starts).astype(np.float64)
+
+    def get_window_sums(values: np.ndarray) -> np.ndarray:
+        sums = np.zeros(len(values) + 1, dtype=np.int64 if values.dtype == bool else np.float64)
+        np.cumsum(values, out=sums[1:])
+        return sums[stops] - sums[starts]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if output_type == ModelOutputTypes.CLASSIFICATION:
+            true_positives = get_window_sums((predicted == 1) & (expected == 1))
+            # 2 tp + fp + fn
+            f1_denominator = get_window_sums(predicted == 1) + get_window_sums(expected == 1)
+            return {
+                'accuracy': get_window_sums(expected == predicted) / n_rows,
+                'f1_score': np.where(n_rows > 0, np.where(f1_denominator > 0, 2 * true_positives / f1_denominator,
+                                                          0.), np.nan),
+            }
+        elif output_type == ModelOutputTypes.REGRESSION:
+            expected = expected.astype(np.float64)
+            error = predicted.astype(np.float64) - expected
+            squared_error = get_window_sums(error ** 2)
+
+            # centered so the sums of squares do not cancel out
+            centered = expected - expected.mean() if len(expected) else expected
+            centered_squares = get_window_sums(centered ** 2)
+            total_squares = centered_squares - get_window_sums(centered) ** 2 / n_rows
+            constant = total_squares <= 1e-12 * centered_squares
+
+            return {
+                'mae': get_window_sums(np.abs(error)) / n_rows,
+                'mse': squared_error / n_rows,
+                'r2_score': np.where(n_rows > 1, np.where(constant, np.where(squared_error == 0, 1., 0.),
+                                                          1 - squared_error / total_squares), np.nan),
+            }
+
+    raise Exception('this output type does not support measure')
+
 
 def get_model_series(model: Model, from_t: datetime, to_t: datetime) -> pd.Series:
     return model.predict_by_time(from_t=from_t, to_t=to_t)
@@ -163,3 +530,14 @@ def get_model_series(model: Model, from_t: datetime, to_t: datetime) -> pd.Serie
 
 def get_model_dataset(model: Model, from_t: datetime, to_t: datetime, slug: Optional[str] = None) -> pd.DataFrame:
     return model.predict_by_time(from_t=from_t, to_t=to_t).to_frame(slug if slug else 'prediction')
+
+
+def _counting_fits(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._fit_generation += 1
+
+    return wrapper
@@ -0,0 +1,99 @@
+"""
+save and load fitted model graphs: the models, their input models, the provider configurations and the fitted
+estimators. providers are saved without their data and recompute or reload it when they are used.
+"""
+import json
+import os
+import pickle
+import shutil
+import threading
+from typing import Optional, List, Tuple
+
+import numpy as np
+
+from .model import Model
+
+# bumped whenever the layout of a saved model changes
+MODEL_FORMAT = 1
+# smaller arrays stay inside the pickle, mapping them one by one would cost more than reading them
+MIN_MAPPED_BYTES = 1 << 14
+_ALIGNMENT = 64
+
+
+def save_model(model: Model, path: str):
+    """
+    saves the model graph to the directory at path. numpy arrays of at least MIN_MAPPED_BYTES are taken out of the
+    pickle and stored one after the other in a single file, so load_model can map them instead of reading them.
+    """
+    buffers: List[pickle.PickleBuffer] = []
+
+    def keep_in_band(buffer: pickle.PickleBuffer) -> bool:
+        if buffer.raw().nbytes < MIN_MAPPED_BYTES:
+            return True
+
+        buffers.append(buffer)
+        return False
+
+    data = pickle.dumps(model, protocol=5, buffer_callback=keep_in_band)
+
+    tmp_path = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+    os.makedirs(tmp_path, exist_ok=True)
+    try:
+        with open(os.path.join(tmp_path, 'model.pickle'), 'wb') as f:
+            f.write(data)
+
+        spans: List[Tuple[int, int]] = []
+        with open(os.path.join(tmp_path, 'buffers.bin'), 'wb') as f:
+            offset = 0
+            for buffer in buffers:
+                raw = buffer.raw()
+                padding = -offset % _ALIGNMENT
+                f.write(b'\0' * padding)
+                offset += padding
+                f.write(raw)
+                spans.append((offset, raw.nbytes))
+                offset += raw.nbytes
+
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({
+                'format': MODEL_FORMAT,
+                'model': f'{type(model).__module__}.{type(model).__qualname__}',
+                'buffers': spans,
+            }, f)
+
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_model(path: str, mmap_mode: Optional[str] = 'r') -> Model:
+    """
+    loads a model graph saved by save_model. with mmap_mode='r' the large estimator arrays (support vectors,
+    coefficients, ...) are read-only views of one mapped file, shared through the page cache by every process that
+    loads it. 'c' maps them copy-on-write and None reads writable copies, e.g. to train the model further.
+    estimators that copy their arrays while unpickling, like scikit-learn trees, hold their own copy either way.
+    """
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        raise Exception(f'no saved model at {path}')
+
+    if meta.get('format') != MODEL_FORMAT:
+        raise Exception(f'saved model at {path} has format {meta.get("format")}, expected {MODEL_FORMAT}')
+
+    buffers_path = os.path.join(path, 'buffers.bin')
+    spans = meta.get('buffers')
+    if not spans:
+        blob = memoryview(b'')
+    elif mmap_mode is not None:
+        blob = memoryview(np.memmap(buffers_path, dtype=np.uint8, mode=mmap_mode))
+    else:
+        with open(buffers_path, 'rb') as f:
+            blob = memoryview(bytearray(f.read()))
+
+    with open(os.path.join(path, 'model.pickle'), 'rb') as f:
+        return pickle.loads(f.read(), buffers=[blob[offset:offset + size] for offset, size in spans])
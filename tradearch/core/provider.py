@@ -1,42 +1,565 @@
+import threading
+import warnings
 from abc import ABC, abstractmethod
-from datetime import datetime
-from typing import Tuple, Optional, Iterable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, date, timedelta
+from typing import Tuple, Optional, Iterable, Any, List, Dict, Hashable, Iterator, Union, Callable
 
+import numpy as np
 import pandas as pd
 
+from .cache import data_cache, get_persistent_cache
+from .instrumentation import traced, trace_methods, note_cache
+from .storage import append_rows
+
+_active_range_plan: ContextVar[Optional['RangePlan']] = ContextVar('tradearch_range_plan', default=None)
+_active_shared_values: ContextVar[Optional['SharedValues']] = ContextVar('tradearch_shared_values', default=None)
+
+
+def get_active_range_plan() -> Optional['RangePlan']:
+    return _active_range_plan.get()
+
 
 class Provider(ABC):
+    # class level default so subclasses which do not call super().__init__ still get a cache, only used for
+    # providers without a stable identity, the rest share the process-wide data cache
+    _data_cache = None
+    # whether outputs may be stored in the persistent cache when it is enabled
+    persistent = True
+    # bumped whenever the outputs of a provider class change, so the persistent cache does not serve the old ones
+    cache_version = 0
+    # whether get_new_data steps a rolling state kept in _stream_state (see indicators.streaming), chunks of a
+    # provider without a lookback then carry the state from one to the next instead of reading the whole history
+    carries_state = False
+    # private attributes which do not change the data, any other one may hold a parameter get_identity can not see
+    transient_attributes: Tuple[str, ...] = ('_data_cache', '_stream_state')
+
     def __init__(self):
         self._data_cache = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        trace_methods(cls, 'provider', ('get_data', 'get_all_data'))
+
+    def __getstate__(self):
+        # a pickled provider keeps its parameters only, cached data and streaming state are rebuilt after loading
+        state = self.__dict__.copy()
+        state.pop('_data_cache', None)
+        state.pop('_stream_state', None)
+        return state
+
+    @traced('provider')
     def get_data(self, from_t: Optional[datetime] = None, to_t: Optional[datetime] = None) -> pd.DataFrame:
-        if self._data_cache is None:
-            self._data_cache = self.get_all_data()
+        plan = _active_range_plan.get()
+        if plan is not None:
+            return slice_by_time(plan.get_data(self), from_t=from_t, to_t=to_t)
 
-        dataset = self._data_cache
+        return slice_by_time(self._get_cached_data(), from_t=from_t, to_t=to_t)
 
-        if from_t is None:
-            from_t = dataset.index.min()
+    def get_tail(self, n_rows: int = 1, to_t: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        last n_rows rows of the data up to to_t, computed from the tails of the upstream providers instead of their
+        whole history, see get_lookback. rows dropped on the way (e.g. by dropna) can make the tail shorter.
+        """
+        plan = RangePlan(to_t=to_t)
+        plan.require(self, n_rows)
+        with plan.activate():
+            return self.get_data()
 
-        if to_t is None:
-            to_t = dataset.index.max()
+    def iter_chunks(self, chunk_size: Union[str, timedelta], from_t: Optional[datetime] = None,
+                    to_t: Optional[datetime] = None) -> Iterator[pd.DataFrame]:
+        """
+        the data from from_t to to_t in time ordered blocks spanning chunk_size each (a timedelta or a string like
+        '90D'). every block is computed from the slices of the upstream providers it needs plus the overlap their
+        lookbacks ask for, so it equals the same rows of get_data while only one block is held at a time.
+        """
+        for plan in iter_chunk_plans([self], chunk_size, from_t=from_t, to_t=to_t):
+            with plan.activate():
+                dataset = self.get_data(from_t=plan.from_t, to_t=plan.to_t)
 
-        dataset = dataset[(dataset.index >= from_t) & (dataset.index <= to_t)]
+            if len(dataset.index):
+                yield dataset
 
-        return dataset
+    def get_lookback(self) -> Optional[int]:
+        """
+        rows of upstream data a row needs before it, e.g. window - 1 for a moving average, so the last rows can be
+        computed from the last rows of the upstream providers. None when a row depends on the whole history, like an
+        exponentially weighted mean, such providers are always computed in full.
+        """
+        return None
 
     def get_date_range(self) -> Tuple[datetime, datetime]:
-        dataset = self.get_all_data()
+        dataset = self._get_cached_data()
+        if dataset.index.is_monotonic_increasing and len(dataset.index):
+            return dataset.index[0], dataset.index[-1]
+
         return dataset.index.min(), dataset.index.max()
 
     def clear_cache(self):
         self._data_cache = None
 
+        key = self.get_cache_key()
+        if key is not None:
+            data_cache.discard(key)
+
+    def append(self, bar: pd.Series) -> pd.DataFrame:
+        raise NotImplementedError('this provider does not accept bars, append them to its source provider')
+
+    def update(self) -> pd.DataFrame:
+        """
+        brings the cached data up to date with the upstream providers and returns the rows that were added.
+        """
+        for provider in self.get_upstream_providers():
+            provider.update()
+
+        dataset = self._get_cached_data()
+        after_t = dataset.index[-1] if len(dataset.index) else None
+
+        new_dataset = self.get_new_data(after_t=after_t)
+        if len(new_dataset.index):
+            self._set_cached_data(append_rows(dataset, new_dataset))
+
+        return new_dataset
+
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        # full recompute, providers which keep a rolling state override this to extend their data incrementally
+        dataset = self.get_all_data()
+        if after_t is None:
+            return dataset
+
+        return dataset.iloc[dataset.index.searchsorted(after_t, side='right'):]
+
+    def get_identity(self) -> Optional[tuple]:
+        """
+        canonical identity built from the provider class and its public attributes (the constructor parameters),
+        providers with equal identities produce the same data. returns None when a parameter can not be canonicalized
+        or the provider has private attributes besides its transient_attributes, such providers keep their own cache.
+        """
+        attributes = vars(self)
+        if any(k.startswith('_') and k not in self.transient_attributes for k in attributes):
+            return None
+
+        try:
+            params = get_canonical_value({k: v for k, v in attributes.items() if not k.startswith('_')})
+        except UnstableIdentityError:
+            return None
+
+        return type(self).__module__, type(self).__qualname__, params
+
+    def get_upstream_providers(self) -> List['Provider']:
+        return [x for x in _iter_nested_values(vars(self)) if isinstance(x, Provider)]
+
+    def get_source_fingerprint(self) -> Optional[list]:
+        """
+        fingerprint of the source data this provider is computed from, None when it is unknown. source providers
+        override this, derived providers combine the fingerprints of their upstream providers.
+        """
+        upstream_providers = self.get_upstream_providers()
+        if not upstream_providers:
+            return None
+
+        fingerprint = []
+        for provider in upstream_providers:
+            upstream_fingerprint = provider.get_source_fingerprint()
+            if upstream_fingerprint is None:
+                return None
+            fingerprint.extend(upstream_fingerprint)
+
+        return sorted(set(fingerprint))
+
+    def get_cache_key(self) -> Optional[tuple]:
+        """
+        key of the data in the process-wide data cache, the identity together with the classes it was built from. a
+        class defined again under the same name (a reloaded module, a notebook cell run again) gets its own entries.
+        """
+        identity = self.get_identity()
+        if identity is None:
+            return None
+
+        return identity, tuple(_iter_identity_classes(self))
+
+    def _get_cached_data(self) -> pd.DataFrame:
+        key = self.get_cache_key()
+        if key is None:
+            if self._data_cache is None:
+                note_cache('miss')
+                self._data_cache = self.get_all_data()
+            else:
+                note_cache('instance')
+
+            return self._data_cache
+
+        dataset = data_cache.get(key)
+        if dataset is not None:
+            note_cache('shared')
+        elif self._data_cache is not None:
+            # too large for the data cache, see _set_cached_data
+            note_cache('instance')
+            dataset = self._data_cache
+        else:
+            dataset = self._get_persisted_data(key[0])
+            self._set_cached_data(dataset)
+
+        return dataset
+
+    def _set_cached_data(self, dataset: pd.DataFrame):
+        key = self.get_cache_key()
+        if key is None:
+            self._data_cache = dataset
+        else:
+            # a frame larger than the whole data cache is held by the provider instead of being computed again
+            self._data_cache = None if data_cache.put(key, dataset) else dataset
+
+    def _get_persisted_data(self, identity: tuple) -> pd.DataFrame:
+        persistent_cache = get_persistent_cache()
+        if persistent_cache is None or not self.persistent:
+            note_cache('miss')
+            return self.get_all_data()
+
+        fingerprint = self.get_source_fingerprint()
+        if fingerprint is None:
+            note_cache('miss')
+            return self.get_all_data()
+
+        # the versions of every class the identity is built from
+        version = tuple((x.__qualname__, getattr(x, 'cache_version', 0)) for x in _iter_identity_classes(self))
+
+        dataset = persistent_cache.load(identity, fingerprint, version=version)
+        if dataset is not None:
+            note_cache('persistent')
+        else:
+            note_cache('miss')
+            dataset = self.get_all_data()
+            persistent_cache.save(identity, fingerprint, dataset, version=version)
+
+        return dataset
+
     @abstractmethod
     def get_all_data(self) -> pd.DataFrame:
         pass
 
 
+class RangePlan:
+    """
+    rows every provider of a graph has to compute so the providers the plan was built for get the rows of a range
+    right: the rows from from_t to to_t plus the rows before from_t their consumers' lookbacks need, or only the last
+    rows up to to_t when from_t is None. while the plan is active, get_data of a planned provider computes just those
+    rows from the rows of its upstream providers, once per plan. source providers and providers without a lookback are
+    served from their cached data.
+
+    lookbacks count rows, a provider dropping rows inside its data (e.g. days a symbol did not trade) can leave the
+    first rows of a range short of history.
+
+    the plans of iter_chunk_plans pass carried_states: providers without a lookback that carry a rolling state step
+    it from where the plan of the previous range left it, see _get_stepped_data.
+    """
+
+    def __init__(self, from_t: Optional[datetime] = None, to_t: Optional[datetime] = None,
+                 carried_states: Optional[Dict[Hashable, tuple]] = None):
+        self.from_t = from_t
+        self.to_t = to_t
+        self.carried_states = carried_states
+        # (rolling state, last rows, to_t) of the providers stepped by this plan, for the plan of the next range
+        self.next_states: Dict[Hashable, tuple] = {}
+        self._n_rows: Dict[Hashable, int] = {}
+        self._datasets: Dict[Hashable, pd.DataFrame] = {}
+
+    def require(self, provider: Provider, n_rows: int):
+        key = get_provider_key(provider)
+        if self._n_rows.get(key, -1) >= n_rows:
+            return
+
+        self._n_rows[key] = n_rows
+        lookback = provider.get_lookback()
+        upstream_rows = n_rows + lookback if lookback is not None else None
+        if self._is_stepped(provider) and key in self.carried_states:
+            # the upstream rows of the range and the last one before it, where the carried state ends
+            upstream_rows = 1
+        if upstream_rows is not None:
+            for upstream_provider in provider.get_upstream_providers():
+                self.require(upstream_provider, upstream_rows)
+
+    def get_data(self, provider: Provider) -> pd.DataFrame:
+        key = get_provider_key(provider)
+        dataset = self._datasets.get(key)
+        if dataset is not None:
+            return dataset
+
+        n_rows = self._n_rows.get(key)
+        if n_rows is not None and self._is_stepped(provider):
+            dataset = self._get_stepped_data(provider, key, n_rows)
+        elif n_rows is not None and provider.get_lookback() is not None and provider.get_upstream_providers():
+            # the upstream get_data calls are served by this plan
+            dataset = provider.get_all_data()
+        else:
+            token = _active_range_plan.set(None)
+            try:
+                dataset = provider.get_data()
+            finally:
+                _active_range_plan.reset(token)
+
+        dataset = slice_by_time(dataset, to_t=self.to_t)
+        if n_rows is not None:
+            if self.from_t is None:
+                start = len(dataset.index) - n_rows
+            else:
+                start = dataset.index.searchsorted(self.from_t, side='left') - n_rows
+            dataset = dataset.iloc[max(start, 0):]
+
+        self._datasets[key] = dataset
+        return dataset
+
+    def _is_stepped(self, provider: Provider) -> bool:
+        return self.carried_states is not None and self.to_t is not None and provider.carries_state and \
+            provider.get_lookback() is None and bool(provider.get_upstream_providers())
+
+    def _get_stepped_data(self, provider: Provider, key: Hashable, n_rows: int) -> pd.DataFrame:
+        # the rows of the range stepped from the state the previous range left, or the whole history up to to_t for
+        # the first range. the state update keeps in the provider is set aside meanwhile
+        saved_state = provider.__dict__.get('_stream_state')
+        try:
+            carried = self.carried_states.get(key)
+            if carried is None:
+                provider._stream_state = None
+                # upstream providers are read in full up to to_t, whatever rows the other providers need of them
+                with RangePlan(to_t=self.to_t).activate():
+                    dataset = provider.get_all_data()
+                    # builds the state at the end of the range, there are no rows after it
+                    provider.get_new_data(after_t=self.to_t)
+            else:
+                provider._stream_state, last_rows, after_t = carried
+                dataset = provider.get_new_data(after_t=after_t)
+                if len(last_rows.index):
+                    dataset = append_rows(last_rows, dataset)
+
+            dataset = slice_by_time(dataset, to_t=self.to_t)
+            self.next_states[key] = (provider._stream_state, dataset.iloc[max(len(dataset.index) - n_rows, 0):],
+                                     self.to_t)
+        finally:
+            provider._stream_state = saved_state
+
+        return dataset
+
+    @contextmanager
+    def activate(self):
+        token = _active_range_plan.set(self)
+        try:
+            yield self
+        finally:
+            _active_range_plan.reset(token)
+
+
+def get_provider_key(provider: Provider) -> Hashable:
+    # providers are often created again inside get_all_data, equal identities are the same provider
+    identity = provider.get_identity()
+    return identity if identity is not None else ('instance', id(provider))
+
+
+class SharedValues:
+    """
+    intermediate results shared by the providers computed in one pass, e.g. the rolling sums of a price column every
+    moving average and band over that column reads. providers look them up with get_shared_value, each one is
+    computed once however many providers and threads ask for it.
+    """
+
+    def __init__(self):
+        self._values: Dict[Hashable, Any] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if key not in self._values:
+                self._values[key] = compute()
+
+            return self._values[key]
+
+
+def set_shared_values(shared_values: Optional[SharedValues]):
+    _active_shared_values.set(shared_values)
+
+
+@contextmanager
+def sharing_values():
+    """
+    providers computed inside share their intermediate results, an enclosing pass is joined instead of replaced.
+    """
+    shared_values = _active_shared_values.get()
+    if shared_values is not None:
+        yield shared_values
+        return
+
+    token = _active_shared_values.set(SharedValues())
+    try:
+        yield _active_shared_values.get()
+    finally:
+        _active_shared_values.reset(token)
+
+
+def get_shared_value(key: Hashable, compute: Callable[[], Any]) -> Any:
+    shared_values = _active_shared_values.get()
+    if shared_values is None:
+        return compute()
+
+    return shared_values.get_or_compute(key, compute)
+
+
+def get_chunk_ranges(providers: Iterable[Provider], chunk_size: Union[str, timedelta],
+                     from_t: Optional[datetime] = None,
+                     to_t: Optional[datetime] = None) -> List[Tuple[datetime, datetime]]:
+    """
+    consecutive (from_t, to_t) ranges of chunk_size covering from_t to to_t, both ends included. a range ends on the
+    last bar of the source providers the providers are computed from before the next range starts, ranges without
+    bars are left out.
+    """
+    step = pd.Timedelta(chunk_size)
+    if step <= pd.Timedelta(0):
+        raise Exception('chunk size must be positive')
+
+    indexes = [x.get_data().index for x in _get_source_providers(providers)]
+    indexes = [x for x in indexes if len(x)]
+    if not indexes:
+        return []
+
+    start = pd.Timestamp(from_t) if from_t is not None else min(x[0] for x in indexes)
+    stop = pd.Timestamp(to_t) if to_t is not None else max(x[-1] for x in indexes)
+
+    ranges = []
+    while start <= stop:
+        next_start = start + step
+        # the last bar of any source before the next range
+        ends = [x[position - 1] for x in indexes for position in [x.searchsorted(next_start, side='left')]
+                if position > 0 and x[position - 1] >= start]
+        if ends:
+            ranges.append((start, min(max(ends), stop)))
+        start = next_start
+
+    return ranges
+
+
+def iter_chunk_plans(providers: Iterable[Provider], chunk_size: Union[str, timedelta],
+                     from_t: Optional[datetime] = None, to_t: Optional[datetime] = None) -> Iterator[RangePlan]:
+    """
+    a plan per range of get_chunk_ranges requiring the rows of the providers from its from_t, to activate while the
+    range is computed. providers without a lookback which carry a rolling state step it from the end of the previous
+    range, the other ones are computed over the whole history and a warning names them.
+    """
+    providers = list(providers)
+    for provider in _get_graph_providers(providers):
+        if provider.get_lookback() is None and provider.get_upstream_providers() and not provider.carries_state:
+            warnings.warn(f'{type(provider).__name__} has no lookback and carries no rolling state, every chunk '
+                          f'computes it over the whole history')
+
+    carried_states: Dict[Hashable, tuple] = {}
+    for chunk_from_t, chunk_to_t in get_chunk_ranges(providers, chunk_size, from_t=from_t, to_t=to_t):
+        plan = RangePlan(from_t=chunk_from_t, to_t=chunk_to_t, carried_states=carried_states)
+        for provider in providers:
+            plan.require(provider, 0)
+
+        yield plan
+        carried_states = plan.next_states
+
+
+def _get_graph_providers(providers: Iterable[Provider]) -> List[Provider]:
+    visited = {}
+
+    def visit(provider: Provider):
+        key = get_provider_key(provider)
+        if key in visited:
+            return
+        visited[key] = provider
+
+        for upstream_provider in provider.get_upstream_providers():
+            visit(upstream_provider)
+
+    for x in providers:
+        visit(x)
+
+    return list(visited.values())
+
+
+def _get_source_providers(providers: Iterable[Provider]) -> List[Provider]:
+    sources = [x for x in _get_graph_providers(providers) if not x.get_upstream_providers()]
+    if not sources:
+        raise Exception('no source provider to take the date range from')
+
+    return sources
+
+
+class UnstableIdentityError(Exception):
+    pass
+
+
+def get_canonical_value(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str, bytes, datetime, date)):
+        return value
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    if hasattr(value, 'get_identity'):
+        identity = value.get_identity()
+        if identity is None:
+            raise UnstableIdentityError(f'{type(value).__qualname__} has no stable identity')
+        return identity
+
+    if isinstance(value, dict):
+        return 'dict', tuple(sorted(((get_canonical_value(k), get_canonical_value(v)) for k, v in value.items()),
+                                    key=repr))
+
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(get_canonical_value(x) for x in value)
+
+    if isinstance(value, (set, frozenset)):
+        return 'set', tuple(sorted((get_canonical_value(x) for x in value), key=repr))
+
+    raise UnstableIdentityError(f'{type(value).__qualname__} can not be canonicalized')
+
+
+def _iter_identity_classes(value: Any):
+    # the classes of value and of every value with an identity among its parameters, in the order get_identity
+    # visits them
+    yield type(value)
+    for x in _iter_nested_values({k: v for k, v in vars(value).items() if not k.startswith('_')}):
+        if hasattr(x, 'get_identity'):
+            yield from _iter_identity_classes(x)
+
+
+def _iter_nested_values(value: Any):
+    if isinstance(value, dict):
+        for x in value.values():
+            yield from _iter_nested_values(x)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for x in value:
+            yield from _iter_nested_values(x)
+    else:
+        yield value
+
+
+def slice_by_time(dataset: pd.DataFrame, from_t: Optional[datetime] = None,
+                  to_t: Optional[datetime] = None) -> pd.DataFrame:
+    index = dataset.index
+    if not index.is_monotonic_increasing:
+        if from_t is None:
+            from_t = index.min()
+
+        if to_t is None:
+            to_t = index.max()
+
+        return dataset[(index >= from_t) & (index <= to_t)]
+
+    start = 0 if from_t is None else index.searchsorted(from_t, side='left')
+    stop = len(index) if to_t is None else index.searchsorted(to_t, side='right')
+
+    return dataset.iloc[start:stop]
+
+
 def get_provider_series(provider: Provider, from_t: datetime, to_t: datetime, column: str) -> pd.Series:
     return provider.get_data(from_t=from_t, to_t=to_t)[column]
 
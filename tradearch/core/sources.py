@@ -0,0 +1,272 @@
+"""
+data sources behind the price providers.
+
+a source turns a name (a symbol) into a local csv file, downloading or extracting it first when it has to, so every
+source is read through the same columnar store. fetch_many and prefetch load many names concurrently on a bounded
+thread pool, a name that is already being fetched is waited for instead of fetched again.
+"""
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Iterable, Dict
+from urllib.parse import urlsplit, quote
+
+from .provider import get_canonical_value
+from .storage import get_cache_dir, get_file_fingerprint
+
+DEFAULT_FETCH_WORKERS = 16
+
+
+class DataSource(ABC):
+    # class level defaults so subclasses which do not call super().__init__ still work
+    _lock = None
+    _futures = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock', None)
+        state.pop('_futures', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def get_identity(self) -> tuple:
+        params = get_canonical_value({k: v for k, v in vars(self).items() if not k.startswith('_')})
+        return type(self).__module__, type(self).__qualname__, params
+
+    def get_file_path(self, name: str) -> str:
+        future = self._futures.get(name) if self._futures is not None else None
+        if future is not None:
+            return future.result()
+
+        return self.fetch(name)
+
+    def prefetch(self, names: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, Future]:
+        """
+        starts fetching the names in the background and returns their futures, get_file_path of a name waits for
+        its fetch.
+        """
+        if self._lock is None:
+            DataSource.__init__(self)
+
+        futures = {}
+        pool = None
+        with self._lock:
+            for name in names:
+                future = self._futures.get(name)
+                if future is None:
+                    if pool is None:
+                        pool = ThreadPoolExecutor(max_workers=max_workers or DEFAULT_FETCH_WORKERS)
+                    future = pool.submit(self.fetch, name)
+                    future.add_done_callback(lambda x, name=name: self._forget_failed(name, x))
+                    self._futures[name] = future
+                futures[name] = future
+
+        if pool is not None:
+            pool.shutdown(wait=False)  # the submitted fetches still run
+
+        return futures
+
+    def fetch_many(self, names: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, str]:
+        futures = self.prefetch(names, max_workers=max_workers)
+        return {name: future.result() for name, future in futures.items()}
+
+    def _forget_failed(self, name: str, future: Future):
+        # a failed fetch is tried again on the next call instead of failing forever
+        if future.exception() is not None:
+            with self._lock:
+                if self._futures.get(name) is future:
+                    del self._futures[name]
+
+    @abstractmethod
+    def fetch(self, name: str) -> str:
+        """
+        path of the local file holding name, fetched if it has to be.
+        """
+        pass
+
+
+class DirectorySource(DataSource):
+    def __init__(self, path: str, file_name: str = '{name}.csv'):
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self.file_name = file_name
+
+    def fetch(self, name: str) -> str:
+        file_path = os.path.join(self.path, self.file_name.format(name=name))
+        if not os.path.exists(file_path):
+            raise Exception(f'{name} is not in {self.path}')
+
+        return file_path
+
+
+class ArchiveSource(DataSource):
+    """
+    zip or tar archive of csv files, extracted once under the cache directory and again when the archive changes.
+    """
+
+    def __init__(self, path: str, file_name: str = '{name}.csv'):
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self.file_name = file_name
+
+    def fetch(self, name: str) -> str:
+        file_path = os.path.join(self._extract(), self.file_name.format(name=name))
+        if not os.path.exists(file_path):
+            raise Exception(f'{name} is not in {self.path}')
+
+        return file_path
+
+    def _extract(self) -> str:
+        fingerprint = get_file_fingerprint(self.path)
+        extract_path = _get_source_path('archive', self.path, *map(str, fingerprint))
+        if os.path.exists(extract_path):
+            return extract_path
+
+        with _extract_lock:
+            if not os.path.exists(extract_path):
+                tmp_path = f'{extract_path}.tmp-{os.getpid()}-{threading.get_ident()}'
+                try:
+                    shutil.unpack_archive(self.path, tmp_path)
+                    os.replace(tmp_path, extract_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        shutil.rmtree(tmp_path, ignore_errors=True)
+
+        return extract_path
+
+
+_extract_lock = threading.Lock()
+
+
+class HttpSource(DataSource):
+    """
+    csv files served over http(s) at url / file_name, downloaded under the cache directory. a file is downloaded once
+    per process, or again after max_age seconds, and a download the server answers with 304 keeps the local copy.
+    every worker thread keeps its connection to the server open between files.
+    """
+
+    def __init__(self, url: str, file_name: str = '{name}.csv', headers: Optional[Dict[str, str]] = None,
+                 timeout: float = 30, max_age: Optional[float] = None):
+        super().__init__()
+        self.url = url.rstrip('/')
+        self.file_name = file_name
+        self.headers = headers
+        self.timeout = timeout
+        self.max_age = max_age
+        self._fetched_at: Dict[str, float] = {}
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('_fetched_at', None)
+        state.pop('_local', None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._fetched_at = {}
+        self._local = threading.local()
+
+    def get_identity(self) -> tuple:
+        # only what decides the data, the headers often hold credentials and the identity is written to disk with
+        # persisted provider outputs
+        return type(self).__module__, type(self).__qualname__, get_canonical_value({'url': self.url,
+                                                                                    'file_name': self.file_name})
+
+    def fetch(self, name: str) -> str:
+        file_name = self.file_name.format(name=name)
+        file_path = os.path.join(_get_source_path('http', self.url), file_name)
+
+        fetched_at = self._fetched_at.get(name)
+        if fetched_at is not None and os.path.exists(file_path) and \
+                (self.max_age is None or time.monotonic() - fetched_at < self.max_age):
+            return file_path
+
+        meta_path = f'{file_path}.meta.json'
+        headers = dict(self.headers or {})
+        if os.path.exists(file_path):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = {}
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        status, response_headers, body = self._request(f'{self.url}/{quote(file_name)}', headers)
+        if status == 200:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = f'{file_path}.tmp-{os.getpid()}-{threading.get_ident()}'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, file_path)
+
+            with open(meta_path, 'w') as f:
+                json.dump({'etag': response_headers.get('etag'),
+                           'last_modified': response_headers.get('last-modified')}, f)
+        elif status != 304:
+            raise Exception(f'fetching {name} from {self.url} failed with status {status}')
+
+        self._fetched_at[name] = time.monotonic()
+        return file_path
+
+    def _request(self, url: str, headers: Dict[str, str]):
+        parts = urlsplit(url)
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+
+        # the connection of this thread is reused, a connection the server closed in between is opened again once
+        for attempt in range(2):
+            connection = self._get_connection(parts.scheme, parts.netloc)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                self._local.connections.pop((parts.scheme, parts.netloc), None)
+                if attempt:
+                    raise
+                continue
+
+            if response.will_close:
+                connection.close()
+                self._local.connections.pop((parts.scheme, parts.netloc), None)
+
+            return response.status, {k.lower(): v for k, v in response.getheaders()}, body
+
+    def _get_connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        if getattr(self._local, 'connections', None) is None:
+            self._local.connections = {}
+
+        connection = self._local.connections.get((scheme, netloc))
+        if connection is None:
+            if scheme == 'https':
+                connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            elif scheme == 'http':
+                connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            else:
+                raise Exception(f'url scheme {scheme} is not supported')
+            self._local.connections[(scheme, netloc)] = connection
+
+        return connection
+
+
+def _get_source_path(*key_parts: str) -> str:
+    digest = hashlib.sha1('\0'.join(key_parts).encode('utf-8')).hexdigest()[:20]
+    return os.path.join(get_cache_dir(), 'sources', digest)
@@ -0,0 +1,335 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import weakref
+from multiprocessing import shared_memory
+from typing import Optional, Tuple, Dict, List
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR_ENV = 'TRADEARCH_CACHE_DIR'
+# bumped whenever the layout of a columnar store changes, older stores are rebuilt
+STORE_FORMAT = 2
+
+_cache_dir = None
+# byte alignment of the arrays placed in shared memory by share_datasets
+_SHARED_ALIGNMENT = 64
+
+
+def get_cache_dir() -> str:
+    if _cache_dir is not None:
+        return _cache_dir
+
+    return os.environ.get(CACHE_DIR_ENV, os.path.join(os.path.expanduser('~'), '.cache', 'tradearch'))
+
+
+def set_cache_dir(path: Optional[str]):
+    global _cache_dir
+    _cache_dir = path
+
+
+def get_file_fingerprint(file_path: str) -> Tuple[int, int]:
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ColumnarStore:
+    """
+    directory of memory-mappable .npy files holding a single data frame.
+
+    columns are grouped into runs of the same dtype and every run is saved as one 2d block, so reading the store
+    back builds the frame on top of the mapped arrays without copying them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read_meta(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get('format') != STORE_FORMAT:
+            return None
+
+        return meta
+
+    def write(self, dataset: pd.DataFrame, extra: Optional[dict] = None):
+        blocks = _get_dtype_runs(dataset)
+        for start, _ in blocks:
+            dtype = dataset.dtypes.iloc[start]
+            if dtype.kind not in 'biufcmM':
+                raise ValueError(f'column {dataset.columns[start]} with dtype {dtype} can not be stored')
+
+        tmp_path = f'{self.path}.tmp-{os.getpid()}-{threading.get_ident()}'
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            np.save(os.path.join(tmp_path, 'index.npy'), np.asarray(dataset.index.values))
+            for i, (start, stop) in enumerate(blocks):
+                np.save(os.path.join(tmp_path, f'block_{i}.npy'),
+                        np.ascontiguousarray(dataset.iloc[:, start:stop].to_numpy()))
+
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump({
+                    'format': STORE_FORMAT,
+                    'index_name': dataset.index.name,
+                    'columns': dataset.columns.tolist(),
+                    'column_names': list(dataset.columns.names) if dataset.columns.nlevels > 1 else None,
+                    'blocks': blocks,
+                    'extra': extra or {},
+                }, f)
+
+            if os.path.exists(self.path):
+                shutil.rmtree(self.path, ignore_errors=True)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def read(self, mmap: bool = True) -> pd.DataFrame:
+        meta = self.read_meta()
+        if meta is None:
+            raise FileNotFoundError(f'no columnar store at {self.path}')
+
+        mmap_mode = 'r' if mmap else None
+        index = pd.Index(np.load(os.path.join(self.path, 'index.npy'), mmap_mode=mmap_mode),
+                         name=meta.get('index_name'))
+
+        if meta.get('column_names') is not None:
+            columns = pd.MultiIndex.from_tuples([tuple(x) for x in meta.get('columns')],
+                                                names=meta.get('column_names'))
+        else:
+            columns = pd.Index(meta.get('columns'))
+
+        frames = []
+        for i, (start, stop) in enumerate(meta.get('blocks')):
+            values = np.load(os.path.join(self.path, f'block_{i}.npy'), mmap_mode=mmap_mode)
+            frames.append(pd.DataFrame(values, index=index, columns=columns[start:stop], copy=False))
+
+        if not frames:
+            return pd.DataFrame(index=index, columns=columns)
+
+        if len(frames) == 1:
+            return frames[0]
+
+        return pd.concat(frames, axis=1, copy=False)
+
+
+def _get_dtype_runs(dataset: pd.DataFrame) -> List[Tuple[int, int]]:
+    # [start, stop) column positions of every run of columns sharing a dtype
+    runs = []
+    dtypes = dataset.dtypes.tolist()
+    for i, dtype in enumerate(dtypes):
+        if runs and dtype == dtypes[i - 1]:
+            runs[-1] = (runs[-1][0], i + 1)
+        else:
+            runs.append((i, i + 1))
+
+    return runs
+
+
+def get_store_path(*key_parts: str) -> str:
+    digest = hashlib.sha1('\0'.join(key_parts).encode('utf-8')).hexdigest()[:20]
+    return os.path.join(get_cache_dir(), 'columnar', digest)
+
+
+_shared_frames: Dict[str, Tuple[Tuple[int, int], pd.DataFrame]] = {}
+_shared_frames_lock = threading.Lock()
+# one lock per file, so different files are parsed concurrently and the same file once
+_file_locks: Dict[str, threading.Lock] = {}
+
+
+def read_csv_columnar(file_path: str, index_col: str, dropna: bool = False) -> pd.DataFrame:
+    """
+    process-wide shared reader for csv files.
+
+    the csv is converted once into a columnar store under the cache directory, later calls (from this or any other
+    process) map that store instead of parsing the csv again. every caller in the process gets the same frame, so it
+    must be treated as read-only.
+    """
+    file_path = os.path.abspath(file_path)
+    fingerprint = get_file_fingerprint(file_path)
+
+    with _shared_frames_lock:
+        shared = _shared_frames.get(file_path)
+        if shared is not None and shared[0] == fingerprint:
+            return shared[1]
+
+        file_lock = _file_locks.setdefault(file_path, threading.Lock())
+
+    with file_lock:
+        shared = _shared_frames.get(file_path)
+        if shared is not None and shared[0] == fingerprint:
+            return shared[1]
+
+        store = ColumnarStore(get_store_path(file_path, index_col, str(dropna)))
+        meta = store.read_meta()
+        if meta is not None and tuple(meta.get('extra', {}).get('fingerprint', ())) == fingerprint:
+            dataset = store.read()
+        else:
+            dataset = pd.read_csv(file_path, parse_dates=True, index_col=index_col)
+            if dropna:
+                dataset = dataset.dropna()
+
+            try:
+                store.write(dataset, extra={'fingerprint': fingerprint})
+                dataset = store.read()
+            except (OSError, ValueError):
+                pass  # cache directory is not writable or a column can not be stored, keep the parsed frame
+
+        with _shared_frames_lock:
+            _shared_frames[file_path] = (fingerprint, dataset)
+        return dataset
+
+
+def clear_shared_frames():
+    with _shared_frames_lock:
+        _shared_frames.clear()
+
+
+class FrameBuffer:
+    """
+    rows of a data frame in blocks with spare room at the end, one block per run of columns sharing a dtype like the
+    columnar stores. rows are written into the spare room and the blocks double when it runs out, so a frame grown a
+    row at a time costs amortized O(1) per row instead of a copy of all its rows. get_frame returns views of the
+    blocks.
+    """
+
+    def __init__(self, dataset: pd.DataFrame):
+        self.columns = dataset.columns
+        self.dtypes = dataset.dtypes.tolist()
+        self.index_name = dataset.index.name
+        self.size = len(dataset.index)
+
+        capacity = max(2 * self.size, _MIN_BUFFER_ROWS)
+        self._index = _resize(dataset.index.to_numpy(), capacity)
+        self._blocks = [(start, stop, _resize(dataset.iloc[:, start:stop].to_numpy(), capacity))
+                        for start, stop in _get_dtype_runs(dataset)]
+
+    @staticmethod
+    def supports(dataset: pd.DataFrame) -> bool:
+        # extension dtypes (tz-aware timestamps, categoricals) and objects would be copied on every get_frame
+        return all(isinstance(x, np.dtype) and x.kind in 'biufcmM' for x in [dataset.index.dtype, *dataset.dtypes])
+
+    def fits(self, rows: pd.DataFrame) -> bool:
+        return rows.columns.equals(self.columns) and rows.dtypes.tolist() == self.dtypes and \
+            rows.index.dtype == self._index.dtype
+
+    def extend(self, rows: pd.DataFrame):
+        size = self.size + len(rows.index)
+        if size > len(self._index):
+            capacity = 2 * size
+            self._index = _resize(self._index[:self.size], capacity)
+            self._blocks = [(start, stop, _resize(block[:self.size], capacity)) for start, stop, block in self._blocks]
+
+        self._index[self.size:size] = rows.index.to_numpy()
+        for start, stop, block in self._blocks:
+            block[self.size:size] = rows.iloc[:, start:stop].to_numpy()
+        self.size = size
+
+    def get_frame(self) -> pd.DataFrame:
+        index = pd.Index(self._index[:self.size], name=self.index_name, copy=False)
+        frames = [pd.DataFrame(block[:self.size], index=index, columns=self.columns[start:stop], copy=False)
+                  for start, stop, block in self._blocks]
+
+        if not frames:
+            return pd.DataFrame(index=index, columns=self.columns)
+
+        if len(frames) == 1:
+            return frames[0]
+
+        return pd.concat(frames, axis=1, copy=False)
+
+
+_MIN_BUFFER_ROWS = 16
+# buffers behind the frames returned by append_rows by id of the frame, dropped together with the frame
+_frame_buffers: Dict[int, FrameBuffer] = {}
+
+
+def append_rows(dataset: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    dataset with rows appended, like pd.concat([dataset, rows]). the result is backed by a FrameBuffer, so appending to
+    it again only writes the new rows. dataset itself is left as it is.
+    """
+    # taken out of the map, so appending to dataset a second time can not overwrite the rows of this result
+    buffer = _frame_buffers.pop(id(dataset), None)
+    if buffer is not None and buffer.size == len(dataset.index) and buffer.fits(rows):
+        buffer.extend(rows)
+    else:
+        dataset = pd.concat([dataset, rows])
+        if not FrameBuffer.supports(dataset):
+            return dataset
+
+        buffer = FrameBuffer(dataset)
+
+    frame = buffer.get_frame()
+    _frame_buffers[id(frame)] = buffer
+    weakref.finalize(frame, _frame_buffers.pop, id(frame), None)
+    return frame
+
+
+def _resize(values: np.ndarray, capacity: int) -> np.ndarray:
+    ret = np.empty((capacity, *values.shape[1:]), dtype=values.dtype)
+    ret[:len(values)] = values
+    return ret
+
+
+def share_datasets(datasets: List[Tuple[tuple, pd.DataFrame]]) -> Tuple[shared_memory.SharedMemory, list]:
+    # the index and the columns of every dataset, columns of the same dtype as one (rows, columns) block, one after
+    # the other in a single shared memory block
+    layout = []
+    arrays = []
+    offset = 0
+
+    def place(values: np.ndarray) -> Tuple[str, int, Tuple[int, ...]]:
+        nonlocal offset
+        if values.dtype.kind not in 'biufmM':
+            raise Exception(f'values of dtype {values.dtype} can not be shared')
+
+        offset += -offset % _SHARED_ALIGNMENT
+        arrays.append((offset, values))
+        span = (values.dtype.str, offset, values.shape)
+        offset += values.nbytes
+        return span
+
+    for key, dataset in datasets:
+        groups = {}
+        for column, dtype in dataset.dtypes.items():
+            groups.setdefault(dtype, []).append(column)
+
+        blocks = [(columns, place(np.ascontiguousarray(dataset[columns].to_numpy()))) for columns in groups.values()]
+        layout.append((key, dataset.index.name, place(dataset.index.to_numpy()), list(dataset.columns), blocks))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for start, values in arrays:
+        np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=start)[...] = values
+
+    return shm, layout
+
+
+def attach_datasets(shm: shared_memory.SharedMemory, layout: list) -> Dict[tuple, pd.DataFrame]:
+    def view(span: Tuple[str, int, Tuple[int, ...]]) -> np.ndarray:
+        dtype, offset, shape = span
+        values = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        values.flags.writeable = False
+        return values
+
+    datasets = {}
+    for key, index_name, index_span, columns, blocks in layout:
+        index = pd.Index(view(index_span), name=index_name)
+        frames = [pd.DataFrame(view(span), index=index, columns=block_columns, copy=False)
+                  for block_columns, span in blocks]
+        if not frames:
+            datasets[key] = pd.DataFrame(index=index)
+        elif len(frames) == 1:
+            datasets[key] = frames[0]
+        else:
+            # mixed dtypes, each worker holds its own copy of the joined frame
+            datasets[key] = pd.concat(frames, axis=1)[columns]
+
+    return datasets
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from .cache import data_cache, get_persistent_cache, enable_persistent_cache
+from .executor import GraphExecutor
+from .model import Model
+from .provider import Provider
+from .storage import share_datasets, attach_datasets
+
+
+class Sweep:
+    """
+    hyperparameter sweep over the parameters of a model graph, provider and estimator parameters alike.
+
+    build turns one set of parameters into a model graph and has to be a module level function, since trials run in
+    worker processes. shared providers (the prices and indicators every trial reads) are computed once, before the
+    workers start, and every worker reads their data from shared memory like in Universe. other providers identical
+    across trials are shared through the persistent cache when it is enabled. every finished trial is appended to
+    results_path as a json line and a sweep started again with the same file skips the trials it already has.
+
+    with eta set, trials go through successive halving: all of them are fitted on the last min_fraction of the
+    training range (1 / eta ** 2 by default, three rungs), the best 1 / eta are fitted again on eta times more history
+    and so on until the full range.
+    """
+
+    def __init__(self, build: Callable[[dict], Model], space: Dict[str, Iterable], metric: str,
+                 maximize: bool = True, results_path: Optional[str] = None, max_workers: Optional[int] = None,
+                 n_trials: Optional[int] = None, eta: Optional[int] = None, min_fraction: Optional[float] = None,
+                 seed: Optional[int] = None, shared_providers: Optional[Iterable[Provider]] = None):
+        self.build = build
+        self.space = {k: list(v) for k, v in space.items()}
+        self.metric = metric
+        self.maximize = maximize
+        self.results_path = results_path
+        self.max_workers = max_workers
+        self.n_trials = n_trials
+        self.eta = eta
+        self.min_fraction = min_fraction
+        self.seed = seed
+        self.shared_providers = list(shared_providers or [])
+
+    def get_trials(self) -> List[dict]:
+        keys = list(self.space.keys())
+        trials = [dict(zip(keys, values)) for values in itertools.product(*[self.space[k] for k in keys])]
+        if self.n_trials is not None and self.n_trials < len(trials):
+            trials = random.Random(self.seed).sample(trials, self.n_trials)
+
+        return trials
+
+    def get_fractions(self) -> List[float]:
+        if self.eta is None:
+            return [1.0]
+
+        if self.eta < 2:
+            raise Exception('eta has to be at least 2')
+
+        fraction = self.min_fraction if self.min_fraction is not None else 1 / self.eta ** 2
+        if not 0 < fraction < 1:
+            raise Exception('min_fraction has to be between 0 and 1 for successive halving')
+
+        fractions = []
+        while fraction < 1.0 - 1e-9:  # 1 / 3 ** 2 * 3 * 3 is not exactly 1 in every rounding
+            fractions.append(fraction)
+            fraction *= self.eta
+
+        return fractions + [1.0]
+
+    def run(self, train_from_t: datetime, train_to_t: datetime, test_from_t: datetime,
+            test_to_t: datetime) -> pd.DataFrame:
+        """
+        one row per trial and rung with the parameters, the share of the training range and the test metrics.
+        """
+        results = self._load_results()
+        trials = self.get_trials()
+
+        for provider in self.shared_providers:
+            if provider.get_cache_key() is None:
+                raise Exception(f'shared provider {type(provider).__name__} has no stable identity')
+
+        persistent_cache = get_persistent_cache()
+        cache_path = persistent_cache.path if persistent_cache is not None else None
+
+        shm, layout = share_datasets([(x.get_cache_key(), x.get_data()) for x in self.shared_providers])
+        try:
+            self._run_rungs(trials, results, (train_from_t, train_to_t, test_from_t, test_to_t),
+                            (cache_path, shm.name, layout))
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return pd.DataFrame([{**record['params'], 'rung': record['rung'], 'fraction': record['fraction'],
+                              **record['metrics']} for record in results.values()])
+
+    def _run_rungs(self, trials: List[dict], results: dict, ranges: tuple, initargs: tuple):
+        train_from_t, train_to_t, test_from_t, test_to_t = ranges
+        with ProcessPoolExecutor(max_workers=self.max_workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=initargs) as pool:
+            for rung, fraction in enumerate(self.get_fractions()):
+                train_from_rung_t = train_to_t - (train_to_t - train_from_t) * fraction
+
+                futures = {}
+                for params in trials:
+                    if (_get_trial_key(params), rung) in results:
+                        continue
+
+                    future = pool.submit(_run_trial_in_worker, self.build, params, train_from_rung_t, train_to_t,
+                                         test_from_t, test_to_t)
+                    futures[future] = params
+
+                for future in as_completed(futures):
+                    params = futures[future]
+                    record = {'params': params, 'rung': rung, 'fraction': fraction, 'metrics': future.result()}
+                    results[(_get_trial_key(params), rung)] = record
+                    self._save_result(record)
+
+                trials = self._get_best_trials(trials, results, rung)
+
+    def _get_best_trials(self, trials: List[dict], results: dict, rung: int) -> List[dict]:
+        if self.eta is None:
+            return trials
+
+        scores = [results[(_get_trial_key(params), rung)]['metrics'][self.metric] for params in trials]
+        order = sorted(range(len(trials)), key=lambda i: scores[i], reverse=self.maximize)
+        return [trials[i] for i in order[:max(len(trials) // self.eta, 1)]]
+
+    def _load_results(self) -> dict:
+        results = {}
+        if self.results_path is None or not os.path.exists(self.results_path):
+            return results
+
+        with open(self.results_path) as f:
+            content = f.read()
+
+        for line in content.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted sweep
+
+            results[(_get_trial_key(record['params']), record['rung'])] = record
+
+        if content and not content.endswith('\n'):
+            with open(self.results_path, 'a') as f:
+                f.write('\n')
+
+        return results
+
+    def _save_result(self, record: dict):
+        if self.results_path is None:
+            return
+
+        with open(self.results_path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+
+def _get_trial_key(params: dict) -> str:
+    # round trip through json so tuples in the space and lists read back from the results file give the same key
+    return json.dumps(json.loads(json.dumps(params, default=str)), sort_keys=True)
+
+
+_worker_state = {}
+
+
+def _init_worker(cache_path: Optional[str], shm_name: str, layout: list):
+    if cache_path is not None:
+        enable_persistent_cache(cache_path)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_state.update({
+        'shm': shm,
+        'datasets': attach_datasets(shm, layout),
+    })
+
+
+def _run_trial_in_worker(*args) -> dict:
+    # put back on every trial, the data cache may have evicted them while the previous trials ran
+    for key, dataset in _worker_state['datasets'].items():
+        data_cache.put(key, dataset)
+
+    return _run_trial(*args)
+
+
+def _run_trial(build: Callable[[dict], Model], params: dict, train_from_t: datetime, train_to_t: datetime,
+               test_from_t: datetime, test_to_t: datetime) -> dict:
+    executor = GraphExecutor(build(params))
+    executor.fit_by_time(from_t=train_from_t, to_t=train_to_t)
+    return {k: float(v) for k, v in executor.measure_by_time(from_t=test_from_t, to_t=test_to_t).items()}
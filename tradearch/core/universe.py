@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from .cache import data_cache, get_persistent_cache, enable_persistent_cache
+from .executor import GraphExecutor
+from .model import Model
+from .persistence import save_model
+from .provider import Provider
+from .storage import share_datasets, attach_datasets
+
+
+class Universe:
+    """
+    one model graph per symbol, fitted and predicted for every symbol of a universe in worker processes.
+
+    build turns a symbol into its model graph and has to be a module level function, since graphs are built in the
+    workers. shared providers (market-wide features, calendars) are computed once, before the workers start, and
+    every worker reads their data from shared memory instead of computing it again. a symbol that fails is recorded
+    in errors with its traceback and the others go on, also when it takes its worker process down. progress is called
+    after every symbol with the symbol, the number of symbols done, the number of symbols and the traceback or None.
+
+    fitted graphs are saved under models_path / symbol with save_model when models_path is set.
+    """
+
+    def __init__(self, build: Callable[[str], Model], symbols: Iterable[str],
+                 shared_providers: Optional[Iterable[Provider]] = None, max_workers: Optional[int] = None,
+                 progress: Optional[Callable[[str, int, int, Optional[str]], None]] = None,
+                 models_path: Optional[str] = None):
+        self.build = build
+        self.symbols = list(symbols)
+        self.shared_providers = list(shared_providers or [])
+        self.max_workers = max_workers
+        self.progress = progress
+        self.models_path = models_path
+        self.errors: Dict[str, str] = {}
+
+    def run(self, train_from_t: datetime, train_to_t: datetime, test_from_t: datetime,
+            test_to_t: datetime) -> pd.DataFrame:
+        """
+        the prediction panel, the predictions of every symbol that did not fail over the test range in its column.
+        """
+        self.errors = {}
+        args = (self.build, train_from_t, train_to_t, test_from_t, test_to_t, self.models_path)
+
+        if self.max_workers == 1 or len(self.symbols) < 2:
+            results = (_run_symbol(symbol, *args) for symbol in self.symbols)
+            return self._collect(results)
+
+        for provider in self.shared_providers:
+            if provider.get_cache_key() is None:
+                raise Exception(f'shared provider {type(provider).__name__} has no stable identity')
+
+        shm, layout = share_datasets([(x.get_cache_key(), x.get_data()) for x in self.shared_providers])
+        try:
+            persistent_cache = get_persistent_cache()
+            cache_path = persistent_cache.path if persistent_cache is not None else None
+            return self._collect(self._iter_pooled_results(args, (cache_path, shm.name, layout)))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _iter_pooled_results(self, args: tuple, initargs: tuple):
+        # a worker process dying (out of memory, a crash in native code) breaks the whole pool. the symbol it was
+        # running fails and the symbols not done yet go on in a new pool. when several symbols were running, each of
+        # them runs again alone to find the one the worker died on
+        context = multiprocessing.get_context()
+        pending = list(self.symbols)
+        suspects: List[str] = []
+
+        while pending or suspects:
+            if suspects:
+                symbols, max_workers = [suspects.pop(0)], 1
+            else:
+                symbols, max_workers = pending, self.max_workers or os.cpu_count()
+
+            started = context.SimpleQueue()
+            finished = set()
+            try:
+                with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                                         initargs=(*initargs, started)) as pool:
+                    futures = [pool.submit(_run_symbol_in_worker, symbol, *args) for symbol in symbols]
+                    for future in as_completed(futures):
+                        result = future.result()
+                        finished.add(result[0])
+                        yield result
+            except BrokenProcessPool:
+                running = set()
+                while not started.empty():
+                    running.add(started.get())
+                running -= finished
+                if not running:
+                    raise  # the workers could not start at all
+
+                if len(running) == 1:
+                    yield running.pop(), None, traceback.format_exc()
+                else:
+                    suspects.extend(x for x in symbols if x in running)
+                done = finished | running
+            else:
+                done = set(symbols)
+
+            if symbols is pending:
+                pending = [x for x in pending if x not in done]
+
+    def _collect(self, results: Iterable[Tuple[str, Optional[pd.Series], Optional[str]]]) -> pd.DataFrame:
+        predictions = {}
+        for i, (symbol, prediction, error) in enumerate(results):
+            if error is None:
+                predictions[symbol] = prediction
+            else:
+                self.errors[symbol] = error
+
+            if self.progress is not None:
+                self.progress(symbol, i + 1, len(self.symbols), error)
+
+        panel = pd.DataFrame({symbol: predictions[symbol] for symbol in self.symbols if symbol in predictions})
+        panel.columns.name = 'symbol'
+        return panel
+
+
+def _run_symbol(symbol: str, build: Callable[[str], Model], train_from_t: datetime, train_to_t: datetime,
+                test_from_t: datetime, test_to_t: datetime,
+                models_path: Optional[str]) -> Tuple[str, Optional[pd.Series], Optional[str]]:
+    try:
+        model = build(symbol)
+        # the symbols already run in parallel, a single thread per graph keeps the cores from being oversubscribed
+        executor = GraphExecutor(model, max_workers=1)
+        executor.fit_by_time(from_t=train_from_t, to_t=train_to_t)
+        prediction = executor.predict_by_time(from_t=test_from_t, to_t=test_to_t)
+
+        if models_path is not None:
+            save_model(model, os.path.join(models_path, symbol))
+    except Exception:
+        return symbol, None, traceback.format_exc()
+
+    return symbol, prediction, None
+
+
+_worker_state = {}
+
+
+def _init_worker(cache_path: Optional[str], shm_name: str, layout: list, started):
+    if cache_path is not None:
+        enable_persistent_cache(cache_path)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_state.update({
+        'shm': shm,
+        'datasets': attach_datasets(shm, layout),
+        'started': started,
+    })
+
+
+def _run_symbol_in_worker(symbol: str, *args) -> Tuple[str, Optional[pd.Series], Optional[str]]:
+    _worker_state['started'].put(symbol)
+
+    # put back on every symbol, the data cache may have evicted them while the previous symbols ran
+    for key, dataset in _worker_state['datasets'].items():
+        data_cache.put(key, dataset)
+
+    return _run_symbol(symbol, *args)
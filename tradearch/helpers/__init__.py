@@ -1,2 +1,2 @@
 from .model_helpers import generate_model_from_scikit_model
-from .provider_helpers import lag_provider
+from .provider_helpers import lag_provider, window_provider
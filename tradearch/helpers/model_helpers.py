@@ -1,11 +1,19 @@
-from typing import Type
+from functools import lru_cache
+from typing import Type, Optional
 
+import numpy as np
 import pandas as pd
 
 from tradearch.core.model import Model, ModelOutputTypes
 
 
 def generate_model_from_scikit_model(scikit_model_class: Type, model_output_type: ModelOutputTypes) -> Type[Model]:
+    return _get_scikit_model_class(scikit_model_class, model_output_type)
+
+
+@lru_cache(maxsize=None)
+def _get_scikit_model_class(scikit_model_class: Type, model_output_type: ModelOutputTypes) -> Type[Model]:
+    # one class per estimator class and output type, so unpickled models are instances of the same class
     class ScikitModel(Model):
         output_type = model_output_type
 
@@ -15,16 +23,60 @@ def generate_model_from_scikit_model(scikit_model_class: Type, model_output_type
             self.kwargs = kwargs
             self._scikit_model = None
 
+        def __reduce__(self):
+            # the class is generated, so pickles refer to the generator instead, e.g. to ship models to workers
+            return _restore_scikit_model, (scikit_model_class, model_output_type), self.__dict__
+
         def reset(self):
             super().reset()
+            self._reset_estimator()
+
+        def _reset_estimator(self):
             self._scikit_model = scikit_model_class(*self.args, **self.kwargs)
 
         def fit(self, x: pd.DataFrame, y: pd.Series):
-            self.reset()
-            self._scikit_model.fit(x, y)
+            # only the own estimator, the input models were fitted before and their predictions are the inputs
+            self._reset_estimator()
+            # the input matrix is already one contiguous block, so the estimator gets it as is
+            self._scikit_model.fit(x.to_numpy(), y.to_numpy())
+
+        def partial_fit(self, x: pd.DataFrame, y: pd.Series, classes: Optional[np.ndarray] = None):
+            """
+            continues training on new bars through the partial_fit of the estimator. classes are only needed on the
+            first call of a classifier that was not fitted yet, they default to the labels in y. estimators without
+            partial_fit raise, refitting them with warm_start on the new bars alone would forget the earlier ones,
+            fit them again over the whole range instead.
+            """
+            if self._scikit_model is None:
+                self._reset_estimator()
+
+            if not hasattr(self._scikit_model, 'partial_fit'):
+                raise Exception(f'{scikit_model_class.__name__} does not support incremental training')
+
+            fitted = hasattr(self._scikit_model, 'classes_') or hasattr(self._scikit_model, 'coef_')
+            if model_output_type == ModelOutputTypes.CLASSIFICATION and not fitted:
+                classes = classes if classes is not None else np.unique(y.to_numpy())
+                self._scikit_model.partial_fit(x.to_numpy(), y.to_numpy(), classes=classes)
+            else:
+                self._scikit_model.partial_fit(x.to_numpy(), y.to_numpy())
 
         def predict(self, x: pd.DataFrame) -> pd.Series:
-            prediction = self._scikit_model.predict(x)
-            return pd.Series()
+            return pd.Series(self._scikit_model.predict(x.to_numpy()), index=x.index)
+
+        def predict_proba(self, x: pd.DataFrame, batch_size: Optional[int] = None) -> pd.DataFrame:
+            """
+            class probabilities with one column per class, computed batch_size rows at a time when it is set.
+            """
+            values = x.to_numpy()
+            batch_size = batch_size or max(len(values), 1)
+            probabilities = np.concatenate([self._scikit_model.predict_proba(values[i:i + batch_size])
+                                            for i in range(0, len(values), batch_size)] or
+                                           [np.empty((0, len(self._scikit_model.classes_)))])
+            return pd.DataFrame(probabilities, index=x.index, columns=self._scikit_model.classes_, copy=False)
 
     return ScikitModel
+
+
+def _restore_scikit_model(scikit_model_class: Type, model_output_type: ModelOutputTypes) -> Model:
+    model_class = _get_scikit_model_class(scikit_model_class, model_output_type)
+    return model_class.__new__(model_class)
@@ -1,27 +1,160 @@
-from typing import Iterable, Dict, Union
+from datetime import datetime
+from typing import Iterable, Dict, Union, Optional, List, Tuple
 
+import numpy as np
 import pandas as pd
 
 from tradearch.core.provider import Provider
+from tradearch.providers.indicators import kernels
 
+LagSequence = Union[Iterable[int], Dict[str, Iterable[int]]]
 
-def lag_provider(provider: Provider, lag_sequence: Union[Iterable[int], Dict[str, Iterable[int]]] = (0, 1)) -> Provider:
-    if type(lag_sequence) == list:
-        final_lag_sequence = {}
-        for column in provider.get_all_data().columns:
-            final_lag_sequence[column] = lag_sequence
-    else:
-        final_lag_sequence = lag_sequence
 
-    class LaggedProvider(Provider):
-        def get_all_data(self) -> pd.DataFrame:
-            dataset = provider.get_all_data()
+class LaggedProvider(Provider):
+    """
+    lagged copies of the columns of a provider. lag_sequence maps columns to their lags, or is a single sequence of
+    lags for every column, in which case the columns are resolved when the data is first computed.
+    """
 
-            ret = pd.DataFrame()
-            for column in final_lag_sequence.keys():
-                for i in final_lag_sequence.get(column, []):
-                    ret[f'{column}_lagged_{i}' if i > 0 else f'{column}'] = dataset[column].shift(i)
+    def __init__(self, provider: Provider, lag_sequence: LagSequence):
+        super().__init__()
+        self.provider = provider
+        self.lag_sequence = lag_sequence
 
-            return ret
+    def get_lookback(self) -> Optional[int]:
+        return max([i for lags in _get_sequence_values(self.lag_sequence) for i in lags] + [0])
 
-    return LaggedProvider()
+    def get_all_data(self) -> pd.DataFrame:
+        return self._lag(self.provider.get_data())
+
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        if after_t is None:
+            return self.get_all_data()
+
+        dataset = self.provider.get_data()
+
+        # the new rows only need the max lag rows before them
+        start = dataset.index.searchsorted(after_t, side='right')
+        lookback_start = max(start - self.get_lookback(), 0)
+
+        return self._lag(dataset.iloc[lookback_start:]).iloc[start - lookback_start:]
+
+    def _lag(self, dataset: pd.DataFrame) -> pd.DataFrame:
+        sequence = _resolve_sequence(self.lag_sequence, dataset.columns)
+        pairs = [(column, i) for column, lags in sequence for i in lags]
+        names = [f'{column}_lagged_{i}' if i > 0 else f'{column}' for column, i in pairs]
+
+        try:
+            values = dataset[[column for column, _ in sequence]].to_numpy(dtype=np.float64)
+        except (TypeError, ValueError):
+            # non numeric columns keep their dtype through pandas
+            return pd.concat([dataset[column].shift(i).rename(name) for (column, i), name in zip(pairs, names)],
+                             axis=1)
+
+        # the whole block is allocated once, fortran order makes every lag a contiguous column and lets pandas wrap
+        # the block without copying it
+        n_rows = len(values)
+        ret = np.full((n_rows, len(names)), np.nan, order='F')
+        position = 0
+        for k, (_, lags) in enumerate(sequence):
+            for i in lags:
+                if i < n_rows:
+                    ret[i:, position] = values[:n_rows - i, k]
+                position += 1
+
+        return pd.DataFrame(ret, index=dataset.index, columns=names, copy=False)
+
+
+class RollingWindowProvider(Provider):
+    """
+    rolling aggregates ('mean', 'std', 'min' or 'max') of the columns of a provider over the windows in
+    window_sequence, which maps columns to windows or is a single sequence of windows for every column. a row gets
+    a value once its window is full, like pandas rolling, and std uses ddof=1 like pandas.
+    """
+    # means and deviations from cumulative sums restarted every block
+    cache_version = 2
+
+    def __init__(self, provider: Provider, window_sequence: LagSequence,
+                 aggregates: Iterable[str] = ('mean', 'std', 'min', 'max')):
+        super().__init__()
+        self.provider = provider
+        self.window_sequence = window_sequence
+        self.aggregates = list(aggregates)
+
+    def get_lookback(self) -> Optional[int]:
+        return max([i for windows in _get_sequence_values(self.window_sequence) for i in windows] + [1]) - 1
+
+    def get_all_data(self) -> pd.DataFrame:
+        return self._aggregate(self.provider.get_data())
+
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        if after_t is None:
+            return self.get_all_data()
+
+        dataset = self.provider.get_data()
+
+        start = dataset.index.searchsorted(after_t, side='right')
+        lookback_start = max(start - self.get_lookback(), 0)
+
+        return self._aggregate(dataset.iloc[lookback_start:]).iloc[start - lookback_start:]
+
+    def _aggregate(self, dataset: pd.DataFrame) -> pd.DataFrame:
+        sequence = _resolve_sequence(self.window_sequence, dataset.columns)
+
+        # columns sharing their windows are aggregated together over one window view
+        groups: Dict[Tuple[int, ...], List[str]] = {}
+        for column, windows in sequence:
+            groups.setdefault(tuple(windows), []).append(column)
+
+        blocks = {}
+        for windows, columns in groups.items():
+            values = dataset[columns].to_numpy(dtype=np.float64)
+            sums = kernels.RollingSums(values) if 'mean' in self.aggregates or 'std' in self.aggregates else None
+            for aggregate in self.aggregates:
+                if aggregate == 'mean':
+                    block = np.stack([sums.mean(window) for window in windows], axis=-1)
+                elif aggregate == 'std':
+                    block = np.stack([sums.std(window, ddof=1) for window in windows], axis=-1)
+                elif aggregate == 'min':
+                    block = kernels.rolling_min(values, windows)
+                elif aggregate == 'max':
+                    block = kernels.rolling_max(values, windows)
+                else:
+                    raise Exception(f'aggregate {aggregate} is not supported')
+
+                for k, column in enumerate(columns):
+                    for j, window in enumerate(windows):
+                        blocks[(column, aggregate, window)] = block[:, k, j]
+
+        names = []
+        ret = np.empty((len(dataset.index), sum(len(windows) for _, windows in sequence) * len(self.aggregates)),
+                       order='F')
+        for column, windows in sequence:
+            for aggregate in self.aggregates:
+                for window in windows:
+                    ret[:, len(names)] = blocks[(column, aggregate, window)]
+                    names.append(f'{column}_{aggregate}_{window}')
+
+        return pd.DataFrame(ret, index=dataset.index, columns=names, copy=False)
+
+
+def _resolve_sequence(sequence: LagSequence, columns: pd.Index) -> List[Tuple[str, List[int]]]:
+    if isinstance(sequence, dict):
+        return [(column, list(values)) for column, values in sequence.items()]
+
+    return [(column, list(sequence)) for column in columns]
+
+
+def _get_sequence_values(sequence: LagSequence) -> List[Iterable[int]]:
+    return list(sequence.values()) if isinstance(sequence, dict) else [sequence]
+
+
+def lag_provider(provider: Provider, lag_sequence: LagSequence = (0, 1)) -> Provider:
+    return LaggedProvider(provider=provider, lag_sequence=lag_sequence if isinstance(lag_sequence, dict)
+                          else list(lag_sequence))
+
+
+def window_provider(provider: Provider, window_sequence: LagSequence,
+                    aggregates: Iterable[str] = ('mean', 'std', 'min', 'max')) -> Provider:
+    return RollingWindowProvider(provider=provider, window_sequence=window_sequence if
+                                 isinstance(window_sequence, dict) else list(window_sequence), aggregates=aggregates)
@@ -1,34 +1,35 @@
-from sklearn.ensemble import RandomForestClassifier as _RandomForestClassifier, \
-    AdaBoostClassifier as _AdaBoostClassifier, \
-    GradientBoostingClassifier as _GradientBoostingClassifier, \
-    BaggingClassifier as _BaggingClassifier
-from sklearn.linear_model import LogisticRegression as _LogisticRegression, \
-    SGDClassifier as _SGDClassifier
-from sklearn.svm import SVC as _SVC, LinearSVC as _LinearSVC
+import importlib
+from typing import Type
 
-from tradearch.core import ModelOutputTypes
-from tradearch.helpers import generate_model_from_scikit_model
+from tradearch.core import Model, ModelOutputTypes
 
-RandomForestClassifier = generate_model_from_scikit_model(scikit_model_class=_RandomForestClassifier,
-                                                          model_output_type=ModelOutputTypes.CLASSIFICATION)
+# wrappers are generated on first access, so scikit-learn is only imported when an estimator is used
+_SCIKIT_MODELS = {
+    'RandomForestClassifier': ('sklearn.ensemble', ModelOutputTypes.CLASSIFICATION),
+    'AdaBoostClassifier': ('sklearn.ensemble', ModelOutputTypes.CLASSIFICATION),
+    'GradientBoostingClassifier': ('sklearn.ensemble', ModelOutputTypes.CLASSIFICATION),
+    'BaggingClassifier': ('sklearn.ensemble', ModelOutputTypes.CLASSIFICATION),
+    'SVC': ('sklearn.svm', ModelOutputTypes.CLASSIFICATION),
+    'LinearSVC': ('sklearn.svm', ModelOutputTypes.CLASSIFICATION),
+    'LogisticRegression': ('sklearn.linear_model', ModelOutputTypes.CLASSIFICATION),
+    'SGDClassifier': ('sklearn.linear_model', ModelOutputTypes.CLASSIFICATION),
+}
 
-AdaBoostClassifier = generate_model_from_scikit_model(scikit_model_class=_AdaBoostClassifier,
-                                                      model_output_type=ModelOutputTypes.CLASSIFICATION)
+__all__ = list(_SCIKIT_MODELS.keys())
 
-GradientBoostingClassifier = generate_model_from_scikit_model(scikit_model_class=_GradientBoostingClassifier,
-                                                              model_output_type=ModelOutputTypes.CLASSIFICATION)
 
-BaggingClassifier = generate_model_from_scikit_model(scikit_model_class=_BaggingClassifier,
-                                                     model_output_type=ModelOutputTypes.CLASSIFICATION)
+def __getattr__(name: str) -> Type[Model]:
+    if name not in _SCIKIT_MODELS:
+        raise AttributeError(f'module {__name__} has no attribute {name}')
 
-SVC = generate_model_from_scikit_model(scikit_model_class=_SVC,
-                                       model_output_type=ModelOutputTypes.CLASSIFICATION)
+    from tradearch.helpers import generate_model_from_scikit_model
 
-LinearSVC = generate_model_from_scikit_model(scikit_model_class=_LinearSVC,
-                                             model_output_type=ModelOutputTypes.CLASSIFICATION)
+    module_name, model_output_type = _SCIKIT_MODELS[name]
+    model = generate_model_from_scikit_model(scikit_model_class=getattr(importlib.import_module(module_name), name),
+                                             model_output_type=model_output_type)
+    globals()[name] = model
+    return model
 
-LogisticRegression = generate_model_from_scikit_model(scikit_model_class=_LogisticRegression,
-                                                      model_output_type=ModelOutputTypes.CLASSIFICATION)
 
-SGDClassifier = generate_model_from_scikit_model(scikit_model_class=_SGDClassifier,
-                                                 model_output_type=ModelOutputTypes.CLASSIFICATION)
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
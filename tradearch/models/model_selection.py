@@ -1,4 +1,6 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import List, Dict, Tuple
 
 import numpy as np
 import pandas as pd
@@ -13,47 +15,60 @@ class ModelSelectionModel(Model):
         super().__init__()
         self.selection_models = selection_models
         self.meta_model = meta_model
+        self._selection_predictions: Dict[Tuple, pd.DataFrame] = {}
+        self._selection_generations: Tuple[tuple, ...] = ()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_selection_predictions'] = {}
+        state['_selection_generations'] = ()
+        return state
+
+    def get_input_models(self) -> List[Model]:
+        return super().get_input_models() + list(self.selection_models)
 
     def reset(self):
         super().reset()
         self.meta_model.reset()
+        self._selection_predictions = {}
 
     def fit(self, x: pd.DataFrame, y: pd.Series):
         self.reset()
 
-        selection_predictions = []
-        from_t = y.index.min()
-        to_t = y.index.max()
-        for j, selection_model in enumerate(self.selection_models):
-            predictions = selection_model.predict_by_time(from_t=from_t, to_t=to_t)
-            selection_predictions.append(predictions)
-
-        model_y = pd.Series(index=y.index, dtype='int32')
-        for i, v in y.iteritems():
-            for j, predictions in enumerate(selection_predictions):
-                pred = predictions[i]
-                if pred == v:
-                    model_y.loc[i] = j
-                    break
-            else:
-                model_y.loc[i] = np.nan
-
-        model_y = model_y.dropna()
+        predictions = self.get_selection_predictions(y.index)
+
+        # target is the first selection model that predicted the bar right, bars no model got right are dropped
+        correct = predictions == np.asarray(y)[:, None]
+        has_correct = correct.any(axis=1)
+        model_y = pd.Series(correct.argmax(axis=1)[has_correct], index=y.index[has_correct], dtype='int32')
+
         mx = x[x.index.isin(model_y.index)]
         self.meta_model.fit(mx, model_y)
 
     def predict(self, x: pd.DataFrame) -> pd.Series:
-        real_y = pd.Series(index=x.index)
-        model_y = self.meta_model.predict(x)
+        model_y = np.asarray(self.meta_model.predict(x)).astype(np.int64)
+        predictions = self.get_selection_predictions(x.index)
+        return pd.Series(predictions[np.arange(len(x.index)), model_y], index=x.index)
+
+    def get_selection_predictions(self, index: pd.Index) -> np.ndarray:
+        """
+        (time x selection model) matrix of the predictions of the selection models on the given index. the models
+        are predicted concurrently and once per range until one of them is fitted again.
+        """
+        generations = tuple(model.get_fit_generation() for model in self.selection_models)
+        if generations != self._selection_generations:
+            self._selection_predictions = {}
+            self._selection_generations = generations
 
-        selection_predictions = []
-        from_t = x.index.min()
-        to_t = x.index.max()
-        for j, selection_model in enumerate(self.selection_models):
-            predictions = selection_model.predict_by_time(from_t=from_t, to_t=to_t)
-            selection_predictions.append(predictions)
+        key = (index.min(), index.max())
+        dataset = self._selection_predictions.get(key)
+        if dataset is None:
+            with ThreadPoolExecutor() as pool:
+                futures = [pool.submit(copy_context().run, model.predict_by_time, from_t=key[0], to_t=key[1])
+                           for model in self.selection_models]
+                dataset = pd.concat([future.result() for future in futures], axis=1,
+                                    keys=range(len(self.selection_models)))
 
-        for i, j in model_y.iteritems():
-            real_y.loc[i] = selection_predictions[int(j)][i]
+            self._selection_predictions[key] = dataset
 
-        return real_y
+        return dataset.reindex(index).to_numpy(dtype=np.float64)
@@ -0,0 +1,387 @@
+"""
+numpy kernels behind the indicator providers.
+
+every kernel accepts a single series of shape (T,) or a block of series of shape (T, K) and a sequence of parameter
+sets, and returns one block with the parameter sets on the last axis, (T, P) or (T, K, P), so sweeping many windows
+over many series is one call.
+"""
+import math
+from typing import Sequence, Tuple, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# rows per block when a rolling window view is reduced, bounds the temporary memory on long histories
+_WINDOW_BLOCK_ROWS = 1 << 16
+# output rows per block of the rolling sums in windows, the cumulative sums start again at every block so their
+# rounding error is that of a few windows whatever the length of the history. every row is read 1 + 1 / 4 times
+_SUM_BLOCK_WINDOWS = 4
+
+
+def _as_2d(values) -> Tuple[np.ndarray, bool]:
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        return values[:, None], True
+
+    return values, False
+
+
+def _stack(results: Sequence[np.ndarray], squeeze: bool) -> np.ndarray:
+    ret = np.stack(results, axis=-1)
+    if squeeze:
+        return ret[:, 0, :]
+
+    return ret
+
+
+class RollingSums:
+    """
+    rolling means and standard deviations of a block of series from cumulative sums, any window is then two
+    subtractions per row. the sums start again every few windows and are taken around a value of their block, so
+    their rounding error stays that of a few windows on long and trending histories. missing values do not count as
+    observations, like pandas rolling with min_periods equal to the window.
+    """
+
+    def __init__(self, values: np.ndarray):
+        self.values, _ = _as_2d(values)
+        self.has_missing = bool(np.isnan(self.values).any())
+
+    def mean(self, window: int) -> np.ndarray:
+        ret = np.full(self.values.shape, np.nan)
+        if window > len(self.values):
+            return ret
+
+        sums, _, counts, offsets = self._get_sums(window, squares=False)
+        ret[window - 1:] = sums / window + offsets
+        if counts is not None:
+            ret[window - 1:][counts < window] = np.nan
+
+        return ret
+
+    def std(self, window: int, ddof: int = 0) -> np.ndarray:
+        ret = np.full(self.values.shape, np.nan)
+        if window > len(self.values):
+            return ret
+
+        sums, squares, counts, _ = self._get_sums(window, squares=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret[window - 1:] = np.sqrt(np.maximum(squares - sums * sums / window, 0.0) / (window - ddof))
+        if counts is not None:
+            ret[window - 1:][counts < window] = np.nan
+
+        return ret
+
+    def _get_sums(self, window: int, squares: bool) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray],
+                                                                np.ndarray]:
+        # sums, sums of squares and counts (None without missing values) of the windows ending at rows window - 1 to
+        # T - 1, with the offsets the sums are taken around. block b holds the windows ending at its rows and reads
+        # the window - 1 rows before them
+        n_rows, n_columns = self.values.shape
+        n_windows = n_rows - window + 1
+        block_rows = _SUM_BLOCK_WINDOWS * window
+        n_blocks = -(-n_windows // block_rows)
+
+        padded = np.empty((n_blocks * block_rows + window - 1, n_columns))
+        padded[:n_rows] = self.values
+        padded[n_rows:] = np.nan if self.has_missing else self.values[-1]
+        row_stride, column_stride = padded.strides
+        blocks = np.lib.stride_tricks.as_strided(padded, shape=(n_blocks, block_rows + window - 1, n_columns),
+                                                 strides=(block_rows * row_stride, row_stride, column_stride),
+                                                 writeable=False)
+
+        counts = None
+        if self.has_missing:
+            valid = ~np.isnan(blocks)
+            counts = _get_window_sums(valid, window)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                offsets = np.where(valid, blocks, 0.0).sum(axis=1, keepdims=True) / valid.sum(axis=1, keepdims=True)
+            offsets = np.nan_to_num(offsets)
+            centered = np.where(valid, blocks - offsets, 0.0)
+        else:
+            offsets = blocks[:, block_rows // 2, None]
+            centered = blocks - offsets
+
+        sums = _get_window_sums(centered, window)
+        square_sums = _get_window_sums(np.square(centered, out=centered), window) if squares else None
+
+        def flatten(x):
+            return None if x is None else x.reshape(-1, n_columns)[:n_windows]
+
+        return flatten(sums), flatten(square_sums), flatten(counts), flatten(np.broadcast_to(offsets, sums.shape))
+
+
+def _get_window_sums(blocks: np.ndarray, window: int) -> np.ndarray:
+    # (blocks, rows + window - 1, K) to the (blocks, rows, K) sums of the windows ending at every row of a block
+    sums = np.zeros((blocks.shape[0], blocks.shape[1] + 1, blocks.shape[2]),
+                    dtype=np.int64 if blocks.dtype == bool else np.float64)
+    np.cumsum(blocks, axis=1, out=sums[:, 1:])
+    return sums[:, window:] - sums[:, :-window]
+
+
+def _sliding_windows(values: np.ndarray, window: int) -> np.ndarray:
+    # (T - window + 1, K, window) read-only view, as_strided instead of sliding_window_view to support numpy 1.19
+    n_rows, n_columns = values.shape
+    row_stride, column_stride = values.strides
+    return np.lib.stride_tricks.as_strided(values, shape=(n_rows - window + 1, n_columns, window),
+                                           strides=(row_stride, column_stride, row_stride), writeable=False)
+
+
+def _reduce_windows(values: np.ndarray, window: int, reducer) -> np.ndarray:
+    # reducer maps a (rows, K, window) block of the window view to (rows, K), rows without a full window are nan
+    ret = np.full(values.shape, np.nan)
+    if window > len(values):
+        return ret
+
+    windows = _sliding_windows(values, window)
+    for start in range(0, len(windows), _WINDOW_BLOCK_ROWS):
+        block = windows[start:start + _WINDOW_BLOCK_ROWS]
+        ret[window - 1 + start:window - 1 + start + len(block)] = reducer(block)
+
+    return ret
+
+
+def rolling_mean(values: np.ndarray, windows: Sequence[int]) -> np.ndarray:
+    values, squeeze = _as_2d(values)
+    sums = RollingSums(values)
+    return _stack([sums.mean(window) for window in windows], squeeze)
+
+
+def rolling_std(values: np.ndarray, windows: Sequence[int], ddof: int = 0) -> np.ndarray:
+    values, squeeze = _as_2d(values)
+    sums = RollingSums(values)
+    return _stack([sums.std(window, ddof=ddof) for window in windows], squeeze)
+
+
+def rolling_min(values: np.ndarray, windows: Sequence[int]) -> np.ndarray:
+    values, squeeze = _as_2d(values)
+    return _stack([_reduce_windows(values, window, lambda block: block.min(axis=-1)) for window in windows], squeeze)
+
+
+def rolling_max(values: np.ndarray, windows: Sequence[int]) -> np.ndarray:
+    values, squeeze = _as_2d(values)
+    return _stack([_reduce_windows(values, window, lambda block: block.max(axis=-1)) for window in windows], squeeze)
+
+
+def _ewm_mean(values: np.ndarray, com: float, min_periods: int) -> np.ndarray:
+    # pandas runs the adjust=False recursion in compiled code for every column, and it keeps the values identical
+    # to the ones the streaming states produce
+    return pd.DataFrame(values).ewm(com=com, min_periods=min_periods, adjust=False).mean().to_numpy()
+
+
+def get_ewm_com(span: Optional[float] = None, alpha: Optional[float] = None) -> float:
+    # pandas turns every decay parameter into a center of mass first, going through it keeps the rounding identical
+    if span is not None:
+        return (span - 1) / 2.0
+
+    return (1.0 - alpha) / alpha
+
+
+def ema(values: np.ndarray, spans: Sequence[int]) -> np.ndarray:
+    values, squeeze = _as_2d(values)
+    return _stack([_ewm_mean(values, com=get_ewm_com(span=span), min_periods=span) for span in spans], squeeze)
+
+
+def sma(values: np.ndarray, windows: Sequence[int]) -> np.ndarray:
+    return rolling_mean(values, windows)
+
+
+def rsi(close: np.ndarray, windows: Sequence[int]) -> np.ndarray:
+    close, squeeze = _as_2d(close)
+    up_direction, down_direction = get_directions(close)
+
+    results = []
+    for window in windows:
+        com = get_ewm_com(alpha=1 / window)
+        results.append(get_relative_strength(_ewm_mean(up_direction, com=com, min_periods=window),
+                                              _ewm_mean(down_direction, com=com, min_periods=window)))
+
+    return _stack(results, squeeze)
+
+
+def get_directions(close: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # upward and downward moves from the previous bar, both positive, the first bar is nan
+    diff = np.full(close.shape, np.nan)
+    diff[1:] = close[1:] - close[:-1]
+    with np.errstate(invalid='ignore'):
+        return np.where(diff > 0, diff, 0.0), -np.where(diff < 0, diff, 0.0)
+
+
+def get_relative_strength(emaup: np.ndarray, emadn: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(emadn == 0, 100, 100 - (100 / (1 + emaup / emadn)))
+
+
+def macd(close: np.ndarray, params: Sequence[Tuple[int, int, int]]) -> Dict[str, np.ndarray]:
+    """
+    params are (window_slow, window_fast, window_sign) sets, emas shared between the sets are computed once.
+    """
+    close, squeeze = _as_2d(close)
+
+    emas = {}
+    for window_slow, window_fast, _ in params:
+        for span in (window_slow, window_fast):
+            if span not in emas:
+                emas[span] = _ewm_mean(close, com=get_ewm_com(span=span), min_periods=span)
+
+    macd_results, signal_results, diff_results = [], [], []
+    for window_slow, window_fast, window_sign in params:
+        macd_values = emas[window_fast] - emas[window_slow]
+        signal_values = _ewm_mean(macd_values, com=get_ewm_com(span=window_sign), min_periods=window_sign)
+        macd_results.append(macd_values)
+        signal_results.append(signal_values)
+        diff_results.append(macd_values - signal_values)
+
+    return {
+        'macd': _stack(macd_results, squeeze),
+        'macd_sig': _stack(signal_results, squeeze),
+        'macd_diff': _stack(diff_results, squeeze),
+    }
+
+
+def bollinger_bands(close: np.ndarray, params: Sequence[Tuple[int, float]]) -> Dict[str, np.ndarray]:
+    """
+    params are (n, n_dev) sets, moving averages and deviations of the same window are computed once.
+    """
+    close, squeeze = _as_2d(close)
+    sums = RollingSums(close)
+
+    stats = {}
+    for n, _ in params:
+        if n not in stats:
+            stats[n] = (sums.mean(n), sums.std(n, ddof=0))
+
+    results = {'hband': [], 'lband': [], 'mavg': [], 'pband': [], 'wband': []}
+    for n, n_dev in params:
+        for k, v in get_bands(close, *stats[n], n_dev=n_dev).items():
+            results[k].append(v)
+
+    return {k: _stack(v, squeeze) for k, v in results.items()}
+
+
+def get_bands(close: np.ndarray, mavg: np.ndarray, mstd: np.ndarray, n_dev: float) -> Dict[str, np.ndarray]:
+    hband = mavg + n_dev * mstd
+    lband = mavg - n_dev * mstd
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pband = (close - lband) / (hband - lband)
+        wband = ((hband - lband) / mavg) * 100
+
+    return {'hband': hband, 'lband': lband, 'mavg': mavg, 'pband': pband, 'wband': wband}
+
+
+def psar(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+         params: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """
+    params are (step, max_step) sets.
+    """
+    high, squeeze = _as_2d(high)
+    low, _ = _as_2d(low)
+    close, _ = _as_2d(close)
+
+    results = []
+    for step, max_step in params:
+        ret = np.full(close.shape, np.nan)
+        for k in range(close.shape[1]):
+            # series of a panel may start later than the others
+            valid = ~(np.isnan(high[:, k]) | np.isnan(low[:, k]) | np.isnan(close[:, k]))
+            start = int(valid.argmax()) if valid.any() else len(valid)
+            ret[start:, k], _ = run_psar(high[start:, k].tolist(), low[start:, k].tolist(),
+                                         close[start:, k].tolist(), step=step, max_step=max_step)
+        results.append(ret)
+
+    return _stack(results, squeeze)
+
+
+def run_psar(high: Sequence[float], low: Sequence[float], close: Sequence[float], step: float, max_step: float,
+             state: Optional[tuple] = None) -> Tuple[list, tuple]:
+    """
+    parabolic stop and reverse with the same steps as ta.trend.PSARIndicator, over plain floats since every bar
+    depends on the previous one. continues from the state returned by an earlier run, so it can also be streamed.
+    """
+    if state is None:
+        state = (0, True, step, math.nan, math.nan, math.nan, math.nan, math.nan, math.nan, math.nan)
+
+    n_seen, up_trend, acceleration_factor, up_trend_high, down_trend_low, last_psar, high2, high1, low2, low1 = state
+
+    ret = []
+    for max_high, min_low, last_close in zip(high, low, close):
+        if n_seen < 2:
+            if n_seen == 0:
+                up_trend_high = max_high
+                down_trend_low = min_low
+
+            n_seen += 1
+            last_psar = last_close
+            high2, high1 = high1, max_high
+            low2, low1 = low1, min_low
+            ret.append(last_psar)
+            continue
+
+        reversal = False
+
+        if up_trend:
+            value = last_psar + (acceleration_factor * (up_trend_high - last_psar))
+
+            if min_low < value:
+                reversal = True
+                value = up_trend_high
+                down_trend_low = min_low
+                acceleration_factor = step
+            else:
+                if max_high > up_trend_high:
+                    up_trend_high = max_high
+                    acceleration_factor = min(acceleration_factor + step, max_step)
+
+                if low2 < value:
+                    value = low2
+                elif low1 < value:
+                    value = low1
+        else:
+            value = last_psar - (acceleration_factor * (last_psar - down_trend_low))
+
+            if max_high > value:
+                reversal = True
+                value = down_trend_low
+                up_trend_high = max_high
+                acceleration_factor = step
+            else:
+                if min_low < down_trend_low:
+                    down_trend_low = min_low
+                    acceleration_factor = min(acceleration_factor + step, max_step)
+
+                if high2 > value:
+                    value = high2
+                elif high1 > value:
+                    value = high1
+
+        up_trend = up_trend != reversal  # XOR
+        last_psar = value
+        high2, high1 = high1, max_high
+        low2, low1 = low1, min_low
+        ret.append(value)
+
+    return ret, (n_seen, up_trend, acceleration_factor, up_trend_high, down_trend_low, last_psar,
+                 high2, high1, low2, low1)
+
+
+def threshold_signal(values: np.ndarray, upper_threshold: float, lower_threshold: float) -> np.ndarray:
+    """
+    1 at or above upper_threshold (overbought), -1 at or below lower_threshold (oversold), 0 otherwise, as int8.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    signal = np.zeros(values.shape, dtype=np.int8)
+    signal[values >= upper_threshold] = 1
+    signal[values <= lower_threshold] = -1
+    return signal
+
+
+def trend_signal(indicator: np.ndarray, price: np.ndarray) -> np.ndarray:
+    """
+    1 where the price is at or above the indicator (up trend), -1 where it is below (down trend), 0 where either is
+    missing, as int8.
+    """
+    indicator = np.asarray(indicator, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    signal = np.zeros(np.broadcast(indicator, price).shape, dtype=np.int8)
+    signal[indicator >= price] = -1
+    signal[indicator <= price] = 1
+    return signal
@@ -1,10 +1,20 @@
+import math
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
 import pandas as pd
-from ta.momentum import RSIIndicator
 
 from tradearch.core.provider import Provider
+from . import kernels
+from .kernels import get_ewm_com
+from .shared import SharedKernels
+from .streaming import EWMState, get_stream_state, set_stream_state, split_new_prices
 
 
 class RSIIndicatorProvider(Provider):
+    carries_state = True
+
     def __init__(self, price_provider: Provider, window: int = 14, upper_threshold: int = 70,
                  lower_threshold: int = 30):
         self.price_provider = price_provider
@@ -13,13 +23,46 @@ class RSIIndicatorProvider(Provider):
         self.lower_threshold = lower_threshold
 
     def get_all_data(self) -> pd.DataFrame:
-        prices = self.price_provider.get_all_data()
+        prices = self.price_provider.get_data()
 
-        rsi_indicator = RSIIndicator(close=prices['adj_close'], window=self.window, fillna=False)
+        rsi = SharedKernels(self.price_provider, prices).rsi('adj_close', self.window)
 
-        ret = rsi_indicator.rsi().to_frame(name='rsi')
-        ret['rsi_signal'] = 0  # no signal
-        ret.loc[ret['rsi'] >= self.upper_threshold, 'rsi_signal'] = 1  # overbought
-        ret.loc[ret['rsi'] <= self.lower_threshold, 'rsi_signal'] = -1  # oversold
+        ret = pd.DataFrame({
+            'rsi': rsi,
+            'rsi_signal': kernels.threshold_signal(rsi, self.upper_threshold, self.lower_threshold),
+        }, index=prices.index)
 
         return ret.dropna()
+
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        if after_t is None:
+            return self.get_all_data()
+
+        prices, new_prices = split_new_prices(self.price_provider.get_data(), after_t=after_t)
+        last_close, emaup, emadn = get_stream_state(self, prices, build=self._build_stream_state)
+
+        close = new_prices['adj_close'].to_numpy(dtype=np.float64)
+        diff = np.diff(np.r_[last_close, close])
+        up, up_nobs = emaup.run(np.where(diff > 0, diff, 0.0))
+        dn, _ = emadn.run(np.where(diff < 0, -diff, 0.0))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = np.where(dn == 0, 100., 100 - (100 / (1 + up / dn)))
+        rsi[up_nobs < self.window] = math.nan
+
+        set_stream_state(self, prices, new_prices, (float(close[-1]) if len(close) else last_close, emaup, emadn))
+
+        ret = pd.DataFrame({
+            'rsi': rsi,
+            'rsi_signal': kernels.threshold_signal(rsi, self.upper_threshold, self.lower_threshold),
+        }, index=new_prices.index)
+        return ret.dropna()
+
+    def _build_stream_state(self, prices: pd.DataFrame):
+        close = prices['adj_close']
+        diff = close.diff(1)
+        com = get_ewm_com(alpha=1 / self.window)
+
+        return (float(close.iloc[-1]) if len(close.index) else math.nan,
+                EWMState.from_series(diff.where(diff > 0, 0.0), com=com),
+                EWMState.from_series(-diff.where(diff < 0, 0.0), com=com))
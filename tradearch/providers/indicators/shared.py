@@ -0,0 +1,62 @@
+"""
+kernels over the columns of one price dataset with their intermediate results shared.
+
+inside a pass opened with tradearch.core.provider.sharing_values (every model input and executor call opens one), the
+column values, rolling sums, moving averages, deviations, emas and price directions of a price provider are computed
+once and read by every indicator over it, e.g. bollinger bands and a moving average of the same window, or the macds
+and emas of overlapping spans. outside a pass every indicator computes its own.
+"""
+from typing import Dict, Hashable, Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from tradearch.core.provider import Provider, get_provider_key, get_shared_value
+from . import kernels
+
+
+class SharedKernels:
+    def __init__(self, price_provider: Provider, prices: pd.DataFrame):
+        self.prices = prices
+        # the same provider can be served different rows, e.g. by a range plan
+        bounds = (prices.index[0], prices.index[-1]) if len(prices.index) else ()
+        self._key = ('kernels', get_provider_key(price_provider), len(prices.index), *bounds)
+
+    def values(self, column: str) -> np.ndarray:
+        return self._get(('values', column), lambda: self.prices[column].to_numpy(dtype=np.float64))
+
+    def mean(self, column: str, window: int) -> np.ndarray:
+        return self._get(('mean', column, window), lambda: self._get_sums(column).mean(window)[:, 0])
+
+    def std(self, column: str, window: int, ddof: int = 0) -> np.ndarray:
+        return self._get(('std', column, window, ddof), lambda: self._get_sums(column).std(window, ddof=ddof)[:, 0])
+
+    def ema(self, column: str, span: int) -> np.ndarray:
+        return self._get(('ema', column, span), lambda: kernels.ema(self.values(column), spans=[span])[:, 0])
+
+    def rsi(self, column: str, window: int) -> np.ndarray:
+        def compute():
+            up_direction, down_direction = self._get(('directions', column),
+                                                     lambda: kernels.get_directions(self.values(column)))
+            com = kernels.get_ewm_com(alpha=1 / window)
+            return kernels.get_relative_strength(kernels._ewm_mean(up_direction, com=com, min_periods=window)[:, 0],
+                                                 kernels._ewm_mean(down_direction, com=com, min_periods=window)[:, 0])
+
+        return self._get(('rsi', column, window), compute)
+
+    def macd(self, column: str, window_slow: int, window_fast: int, window_sign: int) -> Dict[str, np.ndarray]:
+        def compute():
+            macd_values = self.ema(column, window_fast) - self.ema(column, window_slow)
+            signal_values = kernels.ema(macd_values, spans=[window_sign])[:, 0]
+            return {'macd': macd_values, 'macd_sig': signal_values, 'macd_diff': macd_values - signal_values}
+
+        return self._get(('macd', column, window_slow, window_fast, window_sign), compute)
+
+    def bollinger_bands(self, column: str, n: int, n_dev: float) -> Dict[str, np.ndarray]:
+        return kernels.get_bands(self.values(column), self.mean(column, n), self.std(column, n, ddof=0), n_dev=n_dev)
+
+    def _get_sums(self, column: str) -> kernels.RollingSums:
+        return self._get(('sums', column), lambda: kernels.RollingSums(self.values(column)))
+
+    def _get(self, key: Tuple[Hashable, ...], compute: Callable):
+        return get_shared_value((*self._key, *key), compute)
@@ -0,0 +1,130 @@
+import math
+from collections import deque
+from typing import Optional, Callable, Any, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .kernels import run_psar
+
+
+class EWMState:
+    """
+    rolling state of an exponentially weighted mean with adjust=False, stepping it gives the same values as
+    pandas.Series.ewm(adjust=False).mean() over the whole series.
+    """
+
+    def __init__(self, com: float, value: float = math.nan, nobs: int = 0):
+        self.com = com
+        self.alpha = 1. / (1. + com)
+        self.value = value
+        self.nobs = nobs
+
+    @classmethod
+    def from_series(cls, series: pd.Series, com: float) -> 'EWMState':
+        values = series.ewm(com=com, adjust=False).mean()
+        return cls(com=com,
+                   value=float(values.iloc[-1]) if len(values.index) else math.nan,
+                   nobs=int(series.count()))
+
+    def step(self, x: float) -> float:
+        is_observation = x == x
+        self.nobs += is_observation
+
+        if self.value == self.value:
+            if is_observation and self.value != x:
+                old_wt = 1. - self.alpha
+                self.value = ((old_wt * self.value) + (self.alpha * x)) / (old_wt + self.alpha)
+        elif is_observation:
+            self.value = x
+
+        return self.value
+
+    def run(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        steps every value in one pass, the recursion started from the current value gives the bits step gives. returns
+        the values and the number of observations after each step.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        nobs = self.nobs + np.cumsum(values == values)
+        if not len(values):
+            return values, nobs
+
+        ret = pd.Series(np.r_[self.value, values]).ewm(com=self.com, adjust=False).mean().to_numpy()[1:]
+        self.value = float(ret[-1])
+        self.nobs = int(nobs[-1])
+        return ret, nobs
+
+
+class RollingWindowState:
+    def __init__(self, window: int, values=()):
+        self.window = window
+        self.values = deque(values, maxlen=window)
+
+    @classmethod
+    def from_series(cls, series: pd.Series, window: int) -> 'RollingWindowState':
+        return cls(window=window, values=series.iloc[-window:].tolist())
+
+    def step(self, x: float):
+        self.values.append(x)
+
+    def is_full(self) -> bool:
+        return len(self.values) == self.window
+
+    def mean(self) -> float:
+        if not self.is_full():
+            return math.nan
+
+        return sum(self.values) / self.window
+
+    def std(self) -> float:
+        if not self.is_full():
+            return math.nan
+
+        return float(np.std(np.fromiter(self.values, dtype=np.float64, count=self.window)))
+
+
+class PSARState:
+    def __init__(self, step: float, max_step: float, state: Optional[tuple] = None):
+        self.step_size = step
+        self.max_step = max_step
+        self.state = state
+
+    @classmethod
+    def from_prices(cls, high: pd.Series, low: pd.Series, close: pd.Series, step: float,
+                    max_step: float) -> 'PSARState':
+        _, state = run_psar(high.tolist(), low.tolist(), close.tolist(), step=step, max_step=max_step)
+        return cls(step=step, max_step=max_step, state=state)
+
+    def step(self, high: float, low: float, close: float) -> float:
+        values, self.state = run_psar([high], [low], [close], step=self.step_size, max_step=self.max_step,
+                                      state=self.state)
+        return values[0]
+
+    def run(self, high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+        values, self.state = run_psar(high.tolist(), low.tolist(), close.tolist(), step=self.step_size,
+                                      max_step=self.max_step, state=self.state)
+        return np.array(values, dtype=np.float64)
+
+
+def get_stream_state(provider, prices: pd.DataFrame, build: Callable[[pd.DataFrame], Any]) -> Any:
+    """
+    rolling state of the provider after the given prices, the state kept by the previous update is reused when it
+    ended at the same row, otherwise it is rebuilt from the prices once.
+    """
+    last_t = prices.index[-1] if len(prices.index) else None
+    stream_state = getattr(provider, '_stream_state', None)
+    if stream_state is None or stream_state[0] != last_t:
+        return build(prices)
+
+    return stream_state[1]
+
+
+def set_stream_state(provider, prices: pd.DataFrame, new_prices: pd.DataFrame, state: Any):
+    last_prices = new_prices if len(new_prices.index) else prices
+    provider._stream_state = (last_prices.index[-1] if len(last_prices.index) else None, state)
+
+
+def split_new_prices(prices: pd.DataFrame, after_t) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    start = prices.index.searchsorted(after_t, side='right')
+    return prices.iloc[:start], prices.iloc[start:]
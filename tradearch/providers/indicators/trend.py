@@ -1,28 +1,68 @@
+import math
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
 import pandas as pd
-from ta.trend import SMAIndicator, MACD, PSARIndicator
 
 from tradearch.core.provider import Provider
+from . import kernels
+from .kernels import get_ewm_com
+from .shared import SharedKernels
+from .streaming import EWMState, RollingWindowState, PSARState, get_stream_state, set_stream_state, split_new_prices
 
 
 class SMAIndicatorProvider(Provider):
+    carries_state = True
+    # means from cumulative sums restarted every block
+    cache_version = 2
+
     def __init__(self, price_provider: Provider, window: int = 14):
         self.price_provider = price_provider
         self.window = window
 
+    def get_lookback(self) -> Optional[int]:
+        return self.window - 1
+
     def get_all_data(self) -> pd.DataFrame:
-        prices = self.price_provider.get_all_data()
+        prices = self.price_provider.get_data()
+        shared = SharedKernels(self.price_provider, prices)
+
+        sma = shared.mean('adj_close', self.window)
+
+        ret = pd.DataFrame({
+            'sma': sma,
+            'sma_signal': kernels.trend_signal(sma, shared.values('adj_close')),
+        }, index=prices.index)
+
+        return ret.dropna()
 
-        indicator = SMAIndicator(close=prices['adj_close'], window=self.window, fillna=False)
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        if after_t is None:
+            return self.get_all_data()
 
-        ret = indicator.sma_indicator().to_frame(name='sma')
-        ret['sma_signal'] = 0  # no signal
-        ret.loc[ret['sma'] >= prices.loc[prices.index.isin(ret.index), 'adj_close'], 'sma_signal'] = -1  # down trend
-        ret.loc[ret['sma'] <= prices.loc[prices.index.isin(ret.index), 'adj_close'], 'sma_signal'] = 1  # up trend
+        prices, new_prices = split_new_prices(self.price_provider.get_data(), after_t=after_t)
+        state = get_stream_state(self, prices, build=lambda x: RollingWindowState.from_series(x['adj_close'],
+                                                                                             window=self.window))
 
+        values = []
+        for close in new_prices['adj_close'].tolist():
+            state.step(close)
+            values.append(state.mean())
+
+        set_stream_state(self, prices, new_prices, state)
+
+        sma = np.array(values, dtype=np.float64)
+        ret = pd.DataFrame({
+            'sma': sma,
+            'sma_signal': kernels.trend_signal(sma, new_prices['adj_close'].to_numpy()),
+        }, index=new_prices.index)
         return ret.dropna()
 
 
 class MACDIndicatorProvider(Provider):
+    carries_state = True
+
     def __init__(self, price_provider: Provider, window_slow: int = 26, window_fast: int = 12, window_sign: int = 9):
         self.price_provider = price_provider
         self.window_slow = window_slow
@@ -30,34 +70,93 @@ class MACDIndicatorProvider(Provider):
         self.window_sign = window_sign
 
     def get_all_data(self) -> pd.DataFrame:
-        prices = self.price_provider.get_all_data()
+        prices = self.price_provider.get_data()
 
-        indicator = MACD(close=prices['adj_close'],
-                         window_slow=self.window_slow, window_fast=self.window_fast, window_sign=self.window_sign,
-                         fillna=False)
+        indicator = SharedKernels(self.price_provider, prices).macd('adj_close', window_slow=self.window_slow,
+                                                                    window_fast=self.window_fast,
+                                                                    window_sign=self.window_sign)
 
-        ret = indicator.macd().to_frame(name='macd')
-        ret['macd_sig'] = indicator.macd_signal()
-        ret['macd_diff'] = indicator.macd_diff()
+        ret = pd.DataFrame({
+            'macd': indicator['macd'],
+            'macd_sig': indicator['macd_sig'],
+            'macd_diff': indicator['macd_diff'],
+        }, index=prices.index)
 
         return ret.dropna()
 
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        if after_t is None:
+            return self.get_all_data()
+
+        prices, new_prices = split_new_prices(self.price_provider.get_data(), after_t=after_t)
+        ema_fast, ema_slow, ema_sign = get_stream_state(self, prices, build=self._build_stream_state)
+
+        close = new_prices['adj_close'].to_numpy(dtype=np.float64)
+        fast, fast_nobs = ema_fast.run(close)
+        slow, slow_nobs = ema_slow.run(close)
+        macd = np.where((fast_nobs >= self.window_fast) & (slow_nobs >= self.window_slow), fast - slow, math.nan)
+
+        sign, sign_nobs = ema_sign.run(macd)
+        macd_sig = np.where(sign_nobs >= self.window_sign, sign, math.nan)
+
+        set_stream_state(self, prices, new_prices, (ema_fast, ema_slow, ema_sign))
+
+        ret = pd.DataFrame({
+            'macd': macd,
+            'macd_sig': macd_sig,
+            'macd_diff': macd - macd_sig,
+        }, index=new_prices.index)
+        return ret.dropna()
+
+    def _build_stream_state(self, prices: pd.DataFrame):
+        close = prices['adj_close']
+        fast_com = get_ewm_com(span=self.window_fast)
+        slow_com = get_ewm_com(span=self.window_slow)
+
+        macd = close.ewm(com=fast_com, min_periods=self.window_fast, adjust=False).mean() - \
+            close.ewm(com=slow_com, min_periods=self.window_slow, adjust=False).mean()
+
+        return (EWMState.from_series(close, com=fast_com),
+                EWMState.from_series(close, com=slow_com),
+                EWMState.from_series(macd, com=get_ewm_com(span=self.window_sign)))
+
 
 class PSARIndicatorProvider(Provider):
+    carries_state = True
+
     def __init__(self, price_provider: Provider, step: float = 0.02, max_step: int = 0.2):
         self.price_provider = price_provider
         self.step = step
         self.max_step = max_step
 
     def get_all_data(self) -> pd.DataFrame:
-        prices = self.price_provider.get_all_data()
+        prices = self.price_provider.get_data()
+
+        psar = kernels.psar(high=prices['high'].to_numpy(), low=prices['low'].to_numpy(),
+                            close=prices['close'].to_numpy(), params=[(self.step, self.max_step)])[:, 0]
+
+        ret = pd.DataFrame({
+            'psar': psar,
+            'psar_signal': kernels.trend_signal(psar, prices['close'].to_numpy()),
+        }, index=prices.index)
+
+        return ret.dropna()
+
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        if after_t is None:
+            return self.get_all_data()
+
+        prices, new_prices = split_new_prices(self.price_provider.get_data(), after_t=after_t)
+        state = get_stream_state(self, prices, build=lambda x: PSARState.from_prices(
+            high=x['high'], low=x['low'], close=x['close'], step=self.step, max_step=self.max_step))
 
-        indicator = PSARIndicator(close=prices['close'], low=prices['low'], high=prices['high'],
-                                  step=self.step, max_step=self.max_step, fillna=False)
+        psar = state.run(high=new_prices['high'].to_numpy(), low=new_prices['low'].to_numpy(),
+                         close=new_prices['close'].to_numpy())
 
-        ret = indicator.psar().to_frame(name='psar')
-        ret['psar_signal'] = 0  # no signal
-        ret.loc[ret['psar'] >= prices.loc[prices.index.isin(ret.index), 'close'], 'psar_signal'] = -1  # down trend
-        ret.loc[ret['psar'] <= prices.loc[prices.index.isin(ret.index), 'close'], 'psar_signal'] = 1  # up trend
+        set_stream_state(self, prices, new_prices, state)
 
+        ret = pd.DataFrame({
+            'psar': psar,
+            'psar_signal': kernels.trend_signal(psar, new_prices['close'].to_numpy()),
+        }, index=new_prices.index)
         return ret.dropna()
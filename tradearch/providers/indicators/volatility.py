@@ -1,25 +1,67 @@
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
 import pandas as pd
-from ta.volatility import BollingerBands
 
 from tradearch.core.provider import Provider
+from .shared import SharedKernels
+from .streaming import RollingWindowState, get_stream_state, set_stream_state, split_new_prices
 
 
 class BollingerBandsIndicatorProvider(Provider):
+    carries_state = True
+    # means and deviations from cumulative sums restarted every block
+    cache_version = 2
+
     def __init__(self, price_provider: Provider, n: int = 20, n_dev: int = 2):
         self.price_provider = price_provider
         self.n = n
         self.n_dev = n_dev
 
+    def get_lookback(self) -> Optional[int]:
+        return self.n - 1
+
     def get_all_data(self) -> pd.DataFrame:
-        prices = self.price_provider.get_all_data()
+        prices = self.price_provider.get_data()
+
+        indicator = SharedKernels(self.price_provider, prices).bollinger_bands('adj_close', n=self.n, n_dev=self.n_dev)
+
+        ret = pd.DataFrame({
+            'bollinger_hband': indicator['hband'],
+            'bollinger_lband': indicator['lband'],
+            'bollinger_mavg': indicator['mavg'],
+            'bollinger_pband': indicator['pband'],
+            'bollinger_wband': indicator['wband'],
+        }, index=prices.index)
+
+        return ret.dropna()
+
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        if after_t is None:
+            return self.get_all_data()
+
+        prices, new_prices = split_new_prices(self.price_provider.get_data(), after_t=after_t)
+        state = get_stream_state(self, prices, build=lambda x: RollingWindowState.from_series(x['adj_close'],
+                                                                                             window=self.n))
+
+        rows = []
+        for close in new_prices['adj_close'].tolist():
+            state.step(close)
+            mavg = np.float64(state.mean())
+            mstd = np.float64(state.std())
+
+            hband = mavg + self.n_dev * mstd
+            lband = mavg - self.n_dev * mstd
+            with np.errstate(divide='ignore', invalid='ignore'):
+                pband = (close - lband) / (hband - lband)
+                wband = ((hband - lband) / mavg) * 100
 
-        indicator = BollingerBands(close=prices['adj_close'], n=self.n, ndev=self.n_dev,
-                                   fillna=False)
+            rows.append((hband, lband, mavg, pband, wband))
 
-        ret = indicator.bollinger_hband().to_frame(name='bollinger_hband')
-        ret['bollinger_lband'] = indicator.bollinger_lband()
-        ret['bollinger_mavg'] = indicator.bollinger_mavg()
-        ret['bollinger_pband'] = indicator.bollinger_pband()
-        ret['bollinger_wband'] = indicator.bollinger_wband()
+        set_stream_state(self, prices, new_prices, state)
 
+        ret = pd.DataFrame(rows, index=new_prices.index, columns=['bollinger_hband', 'bollinger_lband',
+                                                                  'bollinger_mavg', 'bollinger_pband',
+                                                                  'bollinger_wband'])
         return ret.dropna()
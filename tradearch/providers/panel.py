@@ -0,0 +1,243 @@
+"""
+panel providers hold many symbols in one (time x symbol x field) array on a shared trading calendar.
+
+their data frames have (symbol, field) column pairs backed by a single float64 block, so get_panel_values turns them
+back into the 3d array without copying and every computation runs across all symbols at once.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Iterable, Optional, List, Sequence, Tuple, Any
+
+import numpy as np
+import pandas as pd
+
+from tradearch.core.provider import Provider
+from tradearch.core.sources import DataSource, DEFAULT_FETCH_WORKERS
+from tradearch.providers.indicators import kernels
+from tradearch.providers.us_stocks import UsStockPriceProvider
+
+# windows of the kernels whose rows only read a window of past rows, by their parameter sets. the ewm based kernels
+# and psar depend on the whole history
+_KERNEL_WINDOWS = {
+    'sma': lambda params: params,
+    'rolling_mean': lambda params: params,
+    'rolling_std': lambda params: params,
+    'rolling_min': lambda params: params,
+    'rolling_max': lambda params: params,
+    'bollinger_bands': lambda params: [n for n, _ in params],
+}
+
+
+def make_panel_frame(values: np.ndarray, index: pd.Index, symbols: Sequence[str],
+                     fields: Sequence[str]) -> pd.DataFrame:
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    columns = pd.MultiIndex.from_product([list(symbols), list(fields)], names=['symbol', 'field'])
+    return pd.DataFrame(values.reshape(len(index), len(columns)), index=index, columns=columns, copy=False)
+
+
+def get_panel_values(dataset: pd.DataFrame) -> Tuple[np.ndarray, List[str], List[str]]:
+    symbols = dataset.columns.get_level_values(0).unique().tolist()
+    fields = dataset.columns.get_level_values(1).unique().tolist()
+    values = dataset.to_numpy(dtype=np.float64)
+    return values.reshape(len(dataset.index), len(symbols), len(fields)), symbols, fields
+
+
+class UsStockPanelProvider(Provider):
+    """
+    prices of many symbols from one source, the files are fetched and read concurrently on max_workers threads.
+    """
+    transient_attributes = Provider.transient_attributes + ('_max_workers',)
+
+    def __init__(self, symbols: Iterable[str], fields: Optional[Iterable[str]] = None,
+                 source: Optional[DataSource] = None, max_workers: Optional[int] = None):
+        super().__init__()
+        self.symbols = list(symbols)
+        self.fields = list(fields) if fields is not None else None
+        self.source = source
+        # private and transient so the number of threads is not part of the identity
+        self._max_workers = max_workers
+
+    def get_upstream_providers(self) -> List[Provider]:
+        return [UsStockPriceProvider(symbol=symbol, source=self.source) for symbol in self.symbols]
+
+    def get_lookback(self) -> Optional[int]:
+        # a day among the last n of the calendar is among the last n rows of every symbol that traded on it
+        return 0
+
+    def get_all_data(self) -> pd.DataFrame:
+        providers = self.get_upstream_providers()
+        if len(providers) > 1:
+            source = providers[0].get_source()
+            source.fetch_many(self.symbols, max_workers=self._max_workers)
+            with ThreadPoolExecutor(max_workers=self._max_workers or DEFAULT_FETCH_WORKERS) as pool:
+                futures = [pool.submit(copy_context().run, provider.get_data) for provider in providers]
+                datasets = [future.result() for future in futures]
+        else:
+            datasets = [provider.get_data() for provider in providers]
+        fields = self.fields if self.fields is not None else datasets[0].columns.tolist()
+
+        # union of the trading days of every symbol, days a symbol did not trade stay nan
+        calendar = datasets[0].index
+        for dataset in datasets[1:]:
+            calendar = calendar.union(dataset.index)
+
+        values = np.full((len(calendar), len(self.symbols), len(fields)), np.nan)
+        for i, dataset in enumerate(datasets):
+            values[calendar.get_indexer(dataset.index), i, :] = dataset[fields].to_numpy(dtype=np.float64)
+
+        return make_panel_frame(values, index=calendar, symbols=self.symbols, fields=fields)
+
+
+class PanelSymbolProvider(Provider):
+    """
+    one symbol of a panel as a regular single-symbol provider, so the existing providers can be stacked on top of it.
+    the slice is a view of the panel block unless rows have to be dropped.
+    """
+
+    def __init__(self, panel_provider: Provider, symbol: str, dropna: bool = True):
+        super().__init__()
+        self.panel_provider = panel_provider
+        self.symbol = symbol
+        self.dropna = dropna
+
+    def get_lookback(self) -> Optional[int]:
+        return 0
+
+    def get_all_data(self) -> pd.DataFrame:
+        panel = self.panel_provider.get_data()
+        values, symbols, fields = get_panel_values(panel)
+        symbol_values = values[:, symbols.index(self.symbol), :]
+
+        dataset = pd.DataFrame(symbol_values, index=panel.index, columns=fields, copy=False)
+        if self.dropna:
+            valid = ~np.isnan(symbol_values).any(axis=1)
+            if not valid.all():
+                dataset = dataset[valid]
+
+        return dataset
+
+
+class PanelDiffProvider(Provider):
+    def __init__(self, panel_provider: Provider, n_days: int = 1):
+        super().__init__()
+        self.panel_provider = panel_provider
+        self.n_days = n_days
+
+    def get_lookback(self) -> Optional[int]:
+        return self.n_days
+
+    def get_all_data(self) -> pd.DataFrame:
+        dataset = self.panel_provider.get_data()
+        values, symbols, fields = get_panel_values(dataset)
+
+        ret = np.full(values.shape, np.nan)
+        ret[self.n_days:] = values[self.n_days:] - values[:-self.n_days]
+
+        return make_panel_frame(ret, index=dataset.index, symbols=symbols, fields=fields)
+
+
+class PanelMovementProvider(Provider):
+    def __init__(self, panel_provider: Provider, n_days: int = 1):
+        super().__init__()
+        self.panel_provider = panel_provider
+        self.n_days = n_days
+
+    def get_upstream_providers(self) -> List[Provider]:
+        return [PanelDiffProvider(panel_provider=self.panel_provider, n_days=self.n_days)]
+
+    def get_lookback(self) -> Optional[int]:
+        return 0
+
+    def get_all_data(self) -> pd.DataFrame:
+        dataset = PanelDiffProvider(panel_provider=self.panel_provider, n_days=self.n_days).get_data()
+        values, symbols, fields = get_panel_values(dataset)
+
+        # same labels as UsStockMovementProvider, -1 for (-inf, 0] and 1 for (0, inf)
+        with np.errstate(invalid='ignore'):
+            ret = np.where(np.isnan(values), np.nan, np.where(values > 0, 1., -1.))
+
+        return make_panel_frame(ret, index=dataset.index, symbols=symbols, fields=fields)
+
+
+class PanelIndicatorProvider(Provider):
+    """
+    runs one of the indicator kernels over a field of every symbol in a single call, one output field per kernel
+    output and parameter set, e.g. indicator='sma', params=[5, 20] gives sma_5 and sma_20 for every symbol.
+    """
+    # means and deviations from cumulative sums restarted every block
+    cache_version = 2
+
+    def __init__(self, panel_provider: Provider, indicator: str, params: Sequence[Any], field: str = 'adj_close'):
+        super().__init__()
+        self.panel_provider = panel_provider
+        self.indicator = indicator
+        self.params = list(params)
+        self.field = field
+
+    def get_lookback(self) -> Optional[int]:
+        windows = _KERNEL_WINDOWS.get(self.indicator)
+        return max(windows(self.params)) - 1 if windows is not None and self.params else None
+
+    def get_all_data(self) -> pd.DataFrame:
+        dataset = self.panel_provider.get_data()
+        values, symbols, fields = get_panel_values(dataset)
+
+        if self.indicator == 'psar':
+            source = values[:, :, fields.index('close')]
+            outputs = {'psar': kernels.psar(high=values[:, :, fields.index('high')],
+                                            low=values[:, :, fields.index('low')],
+                                            close=source, params=self.params)}
+        else:
+            source = values[:, :, fields.index(self.field)]
+            outputs = getattr(kernels, self.indicator)(source, self.params)
+            if not isinstance(outputs, dict):
+                outputs = {self.indicator: outputs}
+
+        # ewm based kernels carry their last value over days a symbol did not trade
+        missing = np.isnan(source)
+
+        names = []
+        blocks = []
+        for name, output in outputs.items():
+            for i, param in enumerate(self.params):
+                suffix = '_'.join(str(x) for x in param) if isinstance(param, (tuple, list)) else str(param)
+                names.append(f'{name}_{suffix}')
+                blocks.append(np.where(missing, np.nan, output[:, :, i]))
+
+        return make_panel_frame(np.stack(blocks, axis=-1), index=dataset.index, symbols=symbols, fields=names)
+
+
+class PanelCrossSectionProvider(Provider):
+    """
+    cross-sectional features across the symbols of a panel for every day and field, method is 'rank' (percentile
+    rank) or 'zscore'. symbols without a value on a day are left out of that day.
+    """
+
+    def __init__(self, panel_provider: Provider, method: str = 'rank'):
+        super().__init__()
+        self.panel_provider = panel_provider
+        self.method = method
+
+    def get_lookback(self) -> Optional[int]:
+        return 0
+
+    def get_all_data(self) -> pd.DataFrame:
+        dataset = self.panel_provider.get_data()
+        values, symbols, fields = get_panel_values(dataset)
+
+        if self.method == 'zscore':
+            valid = ~np.isnan(values)
+            count = valid.sum(axis=1, keepdims=True)
+            mean = np.where(valid, values, 0.).sum(axis=1, keepdims=True) / np.maximum(count, 1)
+            deviation = np.where(valid, values - mean, 0.)
+            std = np.sqrt((deviation ** 2).sum(axis=1, keepdims=True) / np.maximum(count, 1))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ret = np.where(valid & (std > 0), (values - mean) / std, np.nan)
+        elif self.method == 'rank':
+            ret = np.empty(values.shape)
+            for k in range(len(fields)):
+                ret[:, :, k] = pd.DataFrame(values[:, :, k]).rank(axis=1, pct=True).to_numpy()
+        else:
+            raise Exception(f'cross section method {self.method} is not supported')
+
+        return make_panel_frame(ret, index=dataset.index, symbols=symbols, fields=fields)
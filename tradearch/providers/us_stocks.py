@@ -1,65 +1,202 @@
 import math
-from typing import Iterable, Dict
+import os
+from datetime import datetime
+from typing import Iterable, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-import pkg_resources
 
 from tradearch.core.provider import Provider
+from tradearch.core.sources import DataSource, DirectorySource
+from tradearch.core.storage import read_csv_columnar, get_file_fingerprint, append_rows
+
+# csv files bundled with the package, the default source of the price providers
+PACKAGE_SOURCE = DirectorySource(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data',
+                                              'us_stocks'))
+
+# bars appended at runtime through UsStockPriceProvider.append, keyed by source file
+_streamed_bars: Dict[str, pd.DataFrame] = {}
 
 
 class UsStockPriceProvider(Provider):
-    def __init__(self, symbol: str):
+    # already served from a memory-mapped columnar store
+    persistent = False
+
+    def __init__(self, symbol: str, source: Optional[DataSource] = None):
         super().__init__()
         self.symbol = symbol
+        self.source = source
+
+    def get_source(self) -> DataSource:
+        return self.source if self.source is not None else PACKAGE_SOURCE
+
+    def get_file_path(self) -> str:
+        return self.get_source().get_file_path(self.symbol)
+
+    def get_source_fingerprint(self) -> Optional[list]:
+        file_path = self.get_file_path()
+        streamed = _streamed_bars.get(file_path)
+        if streamed is None:
+            return [(file_path, *get_file_fingerprint(file_path))]
+
+        return [(file_path, *get_file_fingerprint(file_path), len(streamed.index), str(streamed.index[-1]))]
 
     def get_all_data(self) -> pd.DataFrame:
-        file_path = pkg_resources.resource_filename('tradearch', f'data/us_stocks/{self.symbol}.csv')
+        file_path = self.get_file_path()
+
+        dataset = read_csv_columnar(file_path, index_col='date', dropna=True)
+
+        streamed = _streamed_bars.get(file_path)
+        if streamed is not None:
+            dataset = pd.concat([dataset, streamed])
 
-        dataset = pd.read_csv(file_path, parse_dates=True, index_col='date')
-        dataset = dataset.dropna()
         return dataset
 
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        streamed = _streamed_bars.get(self.get_file_path())
+        if after_t is not None and streamed is not None and after_t >= streamed.index[-1]:
+            # append puts the bars into the cached data itself, nothing comes after the last of them
+            return streamed.iloc[:0]
+
+        return super().get_new_data(after_t)
+
+    def append(self, bar: pd.Series) -> pd.DataFrame:
+        dataset = self._get_cached_data()
+
+        bar_t = pd.Timestamp(bar.name)
+        if len(dataset.index) and bar_t <= dataset.index[-1]:
+            raise Exception('bars must be appended in time order')
+
+        row = pd.DataFrame([bar.reindex(dataset.columns).tolist()], columns=dataset.columns,
+                           index=pd.DatetimeIndex([bar_t], name=dataset.index.name)).astype(dataset.dtypes.to_dict())
+
+        file_path = self.get_file_path()
+        streamed = _streamed_bars.get(file_path)
+        _streamed_bars[file_path] = row if streamed is None else append_rows(streamed, row)
+
+        self._set_cached_data(append_rows(dataset, row))
+        return row
+
 
 class UsStockDiffProvider(Provider):
-    def __init__(self, symbol: str, n_days: int = 1):
+    def __init__(self, symbol: str, n_days: int = 1, source: Optional[DataSource] = None):
         super().__init__()
         self.symbol = symbol
         self.n_days = n_days
+        self.source = source
+
+    def get_upstream_providers(self) -> List[Provider]:
+        return [UsStockPriceProvider(symbol=self.symbol, source=self.source)]
+
+    def get_lookback(self) -> Optional[int]:
+        return self.n_days
 
     def get_all_data(self) -> pd.DataFrame:
-        ohcp_dataset = UsStockPriceProvider(symbol=self.symbol).get_all_data()
+        ohcp_dataset = UsStockPriceProvider(symbol=self.symbol, source=self.source).get_data()
 
         dataset = ohcp_dataset.diff(self.n_days)
         dataset = dataset.dropna()
         return dataset
 
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        if after_t is None:
+            return self.get_all_data()
+
+        ohcp_dataset = UsStockPriceProvider(symbol=self.symbol, source=self.source).get_data()
+
+        # only the new rows and the n_days rows before them are needed for the diff
+        start = ohcp_dataset.index.searchsorted(after_t, side='right')
+        lookback_start = max(start - self.n_days, 0)
+        dataset = ohcp_dataset.iloc[lookback_start:].diff(self.n_days).iloc[start - lookback_start:]
+        dataset = dataset.dropna()
+        return dataset
+
 
 class UsStockDiffQuantizedProvider(Provider):
     def __init__(self, symbol: str, bins: Dict[str, Iterable[float]],
-                 labels: Dict[str, Iterable[int]], n_days: int = 1):
+                 labels: Dict[str, Iterable[int]], n_days: int = 1, source: Optional[DataSource] = None):
         super().__init__()
         self.symbol = symbol
         self.bins = bins
         self.labels = labels
         self.n_days = n_days
+        self.source = source
+
+    def get_upstream_providers(self) -> List[Provider]:
+        return [UsStockDiffProvider(symbol=self.symbol, n_days=self.n_days, source=self.source)]
+
+    def get_lookback(self) -> Optional[int]:
+        return 0
 
     def get_all_data(self) -> pd.DataFrame:
-        diff_dataset = UsStockDiffProvider(symbol=self.symbol, n_days=self.n_days).get_all_data()
+        diff_dataset = UsStockDiffProvider(symbol=self.symbol, n_days=self.n_days, source=self.source).get_data()
+        return self._quantize(diff_dataset)
 
-        dataset = pd.DataFrame()
-        for col in diff_dataset.columns:
-            dataset[col] = pd.cut(diff_dataset[col], bins=self.bins.get(col), labels=self.labels.get(col))
-        dataset = dataset.dropna()
-        return dataset
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        diff_dataset = UsStockDiffProvider(symbol=self.symbol, n_days=self.n_days, source=self.source).get_data()
+        if after_t is not None:
+            diff_dataset = diff_dataset.iloc[diff_dataset.index.searchsorted(after_t, side='right'):]
+
+        return self._quantize(diff_dataset)
+
+    def _quantize(self, diff_dataset: pd.DataFrame) -> pd.DataFrame:
+        columns = diff_dataset.columns.tolist()
+        values = diff_dataset.to_numpy(dtype=np.float64)
+        labels = [np.asarray(list(self.labels.get(column))) for column in columns]
+
+        ret = np.empty(values.shape, dtype=_get_label_dtype(labels))
+        valid = np.ones(len(values), dtype=bool)
+
+        # columns sharing their bins are binned together, in (left, right] intervals like pd.cut
+        groups: Dict[Tuple[float, ...], List[int]] = {}
+        for k, column in enumerate(columns):
+            groups.setdefault(tuple(self.bins.get(column)), []).append(k)
+
+        for bins, positions in groups.items():
+            codes = np.searchsorted(np.asarray(bins, dtype=np.float64), values[:, positions], side='left') - 1
+            inside = (codes >= 0) & (codes < len(bins) - 1)
+            valid &= inside.all(axis=1)
+            for j, k in enumerate(positions):
+                ret[:, k] = labels[k][np.where(inside[:, j], codes[:, j], 0)]
+
+        return pd.DataFrame(ret[valid], index=diff_dataset.index[valid], columns=columns, copy=False)
 
 
 class UsStockMovementProvider(Provider):
-    def __init__(self, symbol: str, n_days: int = 1):
+    def __init__(self, symbol: str, n_days: int = 1, source: Optional[DataSource] = None):
         super().__init__()
         self.symbol = symbol
         self.n_days = n_days
+        self.source = source
+
+    def get_upstream_providers(self) -> List[Provider]:
+        return [UsStockDiffProvider(symbol=self.symbol, n_days=self.n_days, source=self.source)]
+
+    def get_lookback(self) -> Optional[int]:
+        return 0
 
     def get_all_data(self) -> pd.DataFrame:
+        diff_dataset = UsStockDiffProvider(symbol=self.symbol, n_days=self.n_days, source=self.source).get_data()
+        return self._get_movement(diff_dataset)
+
+    def get_new_data(self, after_t: Optional[datetime]) -> pd.DataFrame:
+        diff_dataset = UsStockDiffProvider(symbol=self.symbol, n_days=self.n_days, source=self.source).get_data()
+        if after_t is not None:
+            diff_dataset = diff_dataset.iloc[diff_dataset.index.searchsorted(after_t, side='right'):]
+
+        return self._get_movement(diff_dataset)
+
+    @staticmethod
+    def _get_movement(diff_dataset: pd.DataFrame) -> pd.DataFrame:
+        # the labels get_quantized_provider gives, -1 for (-inf, 0] and 1 for (0, inf], straight from the signs
+        values = diff_dataset.to_numpy(dtype=np.float64)
+        valid = (values > -np.inf).all(axis=1)
+        ret = np.where(values[valid] > 0, 1, -1).astype(np.int8)
+
+        return pd.DataFrame(ret, index=diff_dataset.index[valid], columns=diff_dataset.columns, copy=False)
+
+    def get_quantized_provider(self) -> UsStockDiffQuantizedProvider:
+        # the general form of this provider's labels, kept for callers binning the diffs differently
         bins = {
             'open': [-math.inf, 0, math.inf],
             'close': [-math.inf, 0, math.inf],
@@ -76,6 +213,18 @@ class UsStockMovementProvider(Provider):
             'adj_close': [-1, 1],
             'volume': [-1, 1],
         }
-        dataset = UsStockDiffQuantizedProvider(symbol=self.symbol, bins=bins, labels=labels,
-                                               n_days=self.n_days).get_all_data()
-        return dataset
+        return UsStockDiffQuantizedProvider(symbol=self.symbol, bins=bins, labels=labels, n_days=self.n_days,
+                                            source=self.source)
+
+
+def _get_label_dtype(labels: List[np.ndarray]) -> np.dtype:
+    # the smallest integer type holding every label, e.g. int8 for -1 and 1
+    values = np.concatenate(labels) if labels else np.zeros(0, dtype=np.int8)
+    if values.dtype.kind not in 'iu':
+        return values.dtype
+
+    for dtype in (np.int8, np.int16, np.int32):
+        if not len(values) or (np.iinfo(dtype).min <= values.min() and values.max() <= np.iinfo(dtype).max):
+            return np.dtype(dtype)
+
+    return np.dtype(np.int64)